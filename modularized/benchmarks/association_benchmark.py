@@ -0,0 +1,221 @@
+# benchmarks/association_benchmark.py
+"""
+Microbenchmark of the pose to food/ drink association over growing crowds.
+
+Generates synthetic frames with a number of persons (nose, eyes, ears and wrists laid out like a standing person)
+and food/ drinks (some held, some lying around), and times the per pair loop association used to run against
+the vectorised `match_people`. Both have to pick the same person for every object.
+
+Run from the 'modularized' directory:
+
+    python -m benchmarks.association_benchmark
+    python -m benchmarks.association_benchmark --people 1 8 32 128 --objects 4 --repeats 200
+"""
+import argparse, os, sys, time
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, PROJECT_ROOT)
+
+from shared.association_engine import match_people
+from shared.model import NOSE, LEFT_EYE, RIGHT_EYE, LEFT_EAR, RIGHT_EAR, LEFT_WRIST, RIGHT_WRIST
+
+FRAME_SHAPE = (1440, 2560, 3)
+
+
+def extract_face_from_nose(pose_points, frame):
+  """
+  Estimates a bounding box for the face based on detected keypoints: nose, eyes, and ears.
+  Single person version of `face_regions`, as threads/association.py used it before `match_people`.
+
+  The bounding box is calculated vertically using the distance from nose to eyes (value is tripled),
+  and horizontally using the ears and eye positions with some offsets.
+
+  Parameters:
+    pose_points (np.ndarray): Keypoints of one person, shape (7, 2), see `PoseDetectionModel.parse_keypoints`.
+    frame (np.ndarray): The frame from which to extract the face area.
+
+  Returns:
+    tuple: Coordinates (x1, y1, x2, y2) defining the bounding box of the estimated face region.
+
+  Raises:
+    ValueError: If the calculated bounding box dimensions are invalid (x2 <= x1 or y2 <= y1).
+  """
+  h, _ = frame.shape[:2]
+
+  nose = pose_points[NOSE]
+  l_eye = pose_points[LEFT_EYE]
+  r_eye = pose_points[RIGHT_EYE]
+  l_ear = pose_points[LEFT_EAR]
+  r_ear = pose_points[RIGHT_EAR]
+
+  # Get the vertical distance of nose to eyes
+  average_y_of_eyes = (l_eye[1] + r_eye[1]) // 2
+  nose_to_eye_height = abs(nose[1] - average_y_of_eyes) * 3
+  eye_center_y = average_y_of_eyes
+
+  # Add one unit (of nose_to_eye_height) above eye center, one below nose
+  y1 = max(int(eye_center_y - nose_to_eye_height), 0)
+  y2 = min(int(nose[1] + nose_to_eye_height) + 20, h)
+
+  # Horizontal distance of bbox based on ears
+  x1 = int(min(l_ear[0], r_eye[0] - 40))
+  x2 = int(max(r_ear[0], l_eye[0] + 40))
+
+  # check that bbox is valid
+  if x2 <= x1 or y2 <= y1:
+    raise ValueError("Invalid bounding box dimensions.")
+
+  return (x1, y1, x2, y2)
+
+
+def get_dist_nose_to_box(pose_points, food_drinks_bbox):
+  """
+  Calculates the shortest Euclidean distance from the nose keypoint to the edges of a given bounding box.
+  Single pair version of the nose to object distance in `match_people`.
+
+  Parameters:
+    pose_points (np.ndarray): Keypoints of one person, shape (7, 2), see `PoseDetectionModel.parse_keypoints`.
+    food_drinks_bbox (tuple): Coordinates (x1, y1, x2, y2) of the bounding box representing food or drink.
+
+  Returns:
+    float: The Euclidean distance between the nose point and the closest edge of the bounding box.
+  """
+  # Compute edge of food/drink bbox edges to nose point
+  # Get nose point
+  nose = pose_points[NOSE]
+
+  # Get food/ drinks bounding box coords
+  x1, y1, x2, y2 = food_drinks_bbox
+
+  # Clamp the nose to the bounding box (to get closest point on box edge)
+  clamped_x = np.clip(nose[0], x1, x2)
+  clamped_y = np.clip(nose[1], y1, y2)
+
+  # Compute distance from nose to closest point on the bbox (euclidean distance formula)
+  return np.linalg.norm(nose - np.array([clamped_x, clamped_y]))
+
+
+def reference_match(boxes, centers, pose_points, frame):
+  """
+  Per (object, person) pair association, as threads/association.py ran it before `match_people`.
+
+  Returns:
+    list of int: Index of the matched person of each object, -1 if no person matched.
+  """
+  matches = []
+  for food_drinks_bbox, food_drinks_center in zip(boxes, centers):
+    x1, y1, x2, y2 = map(int, food_drinks_bbox)
+    best_score, best_person = float("inf"), -1
+
+    for index, p in enumerate(pose_points):
+      try:
+        fx1, fy1, fx2, fy2 = map(int, extract_face_from_nose(p, frame))
+      except ValueError:
+        continue
+
+      if y1 < p[NOSE][1] * 0.65:
+        continue
+
+      area_food_drinks = abs(x1 - x2) * abs(y1 - y2)
+      area_head = abs(fx1 - fx2) * abs(fy1 - fy2)
+      area_check = area_food_drinks >= area_head * 4 or area_food_drinks < area_head * 0.1
+      height_check = abs(y1 - y2) >= abs(fy1 - fy2) * 2.85 or abs(y1 - y2) < abs(fy1 - fy2) * 0.35
+      if area_check or height_check:
+        continue
+
+      dist_nose_to_box = get_dist_nose_to_box(p, food_drinks_bbox)
+      dist = min(
+        np.linalg.norm(p[LEFT_WRIST] - food_drinks_center),
+        np.linalg.norm(p[RIGHT_WRIST] - food_drinks_center),
+      )
+
+      if dist_nose_to_box > abs(y1 - y2) * 0.3:
+        if dist > abs(y1 - y2) * 0.5 or dist_nose_to_box > abs(y1 - y2) * 1.1:
+          continue
+
+      score = dist_nose_to_box + dist
+      if score < best_score:
+        best_score, best_person = score, index
+
+    matches.append(best_person)
+  return matches
+
+
+def synthetic_scene(people, objects, rng):
+  """
+  Returns random (boxes, centers, pose_points) of a frame, half of the objects held by a person.
+  """
+  height, width = FRAME_SHAPE[:2]
+  pose_points = np.zeros((people, 7, 2), dtype=np.float32)
+  scale = rng.uniform(0.6, 1.4, people)
+  nose = np.stack([rng.uniform(100, width - 100, people), rng.uniform(150, height - 300, people)], axis=1)
+
+  offsets = {
+    NOSE: (0, 0), LEFT_EYE: (12, -15), RIGHT_EYE: (-12, -15), LEFT_EAR: (-30, -8), RIGHT_EAR: (30, -8),
+    LEFT_WRIST: (-45, 110), RIGHT_WRIST: (45, 110),
+  }
+  for keypoint, offset in offsets.items():
+    pose_points[:, keypoint] = nose + np.array(offset) * scale[:, None] + rng.normal(0, 3, (people, 2))
+
+  boxes = np.zeros((objects, 4), dtype=np.float32)
+  for index in range(objects):
+    if people and index % 2 == 0:
+      person = rng.integers(people)
+      wrist = pose_points[person, rng.choice([LEFT_WRIST, RIGHT_WRIST])]
+      size = np.array([40, 90]) * scale[person]
+      center = wrist + rng.normal(0, 10, 2)
+    else:
+      size = rng.uniform(30, 120, 2)
+      center = rng.uniform([0, 0], [width, height])
+    boxes[index] = np.concatenate([center - size / 2, center + size / 2])
+
+  boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width - 1)
+  boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height - 1)
+  centers = np.stack([(boxes[:, 0] + boxes[:, 2]) // 2, (boxes[:, 1] + boxes[:, 3]) // 2], axis=1)
+  return boxes, centers, pose_points
+
+
+def time_per_call(function, repeats):
+  """
+  Returns the median seconds per call of `function` over `repeats` calls.
+  """
+  times = []
+  for _ in range(repeats):
+    start = time.perf_counter()
+    function()
+    times.append(time.perf_counter() - start)
+  return float(np.median(times))
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark the association of food/ drinks with persons.")
+  parser.add_argument("--people", nargs="+", type=int, default=[1, 2, 4, 8, 16, 32, 64])
+  parser.add_argument("--objects", nargs="+", type=int, default=[1, 4, 16])
+  parser.add_argument("--repeats", type=int, default=100, help="Timed calls per configuration.")
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+
+  rng = np.random.default_rng(args.seed)
+  frame = np.zeros(FRAME_SHAPE, dtype=np.uint8)
+
+  print(f"{'people':>6} {'objects':>7} {'matched':>7} {'loop ms':>9} {'vectorised ms':>13} {'speedup':>8}")
+  for objects in args.objects:
+    for people in args.people:
+      boxes, centers, pose_points = synthetic_scene(people, objects, rng)
+
+      reference = reference_match(boxes, centers, pose_points, frame)
+      matches, _, _ = match_people(boxes, centers, pose_points, frame.shape[0])
+      if list(matches) != reference:
+        print(f"[ERROR] {people} people, {objects} objects: matches differ {list(matches)} != {reference}")
+
+      loop = time_per_call(lambda: reference_match(boxes, centers, pose_points, frame), args.repeats)
+      vectorised = time_per_call(lambda: match_people(boxes, centers, pose_points, frame.shape[0]), args.repeats)
+      print(
+        f"{people:>6} {objects:>7} {sum(match >= 0 for match in reference):>7} "
+        f"{1000 * loop:>9.3f} {1000 * vectorised:>13.3f} {loop / vectorised:>7.1f}x"
+      )
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,472 @@
+# benchmarks/pipeline_benchmark.py
+"""
+End-to-end pipeline benchmark over the bundled datasets.
+
+Replays `datasets/<dataset>/<n>tiles` through the full reader -> DetectionWorker -> association pipeline
+with the NVR, database, notification and saver layers stubbed out, and reports frames per second,
+per-stage p50/p95/p99 latency and peak RSS for every configuration. Each configuration runs in its own
+process so peak RSS and the singleton DetectionManager are not shared between runs.
+
+Run from the 'modularized' directory (models are loaded from 'yolo_models'):
+
+    python -m benchmarks.pipeline_benchmark --output benchmarks/results/baseline.json
+    python -m benchmarks.pipeline_benchmark --datasets one_bottle --tiles 4 --cameras 4 --duration 30
+    python -m benchmarks.pipeline_benchmark --output new.json --compare benchmarks/results/baseline.json
+
+Detection cascade (small screener, yolo11x only on escalated frames), the escalation rate is reported per configuration:
+
+    CASCADE_SCREENER_MODEL=yolo11n.pt python -m benchmarks.pipeline_benchmark --output cascade.json --compare baseline.json
+
+Keyframes (detection on every n-th frame, detections propagated to the frames in between):
+
+    DETECTION_KEYFRAME_INTERVAL=3 python -m benchmarks.pipeline_benchmark --output keyframes.json --compare baseline.json
+
+Cameras with a live feed client (frames annotated and JPEG encoded like in /video_feed), unwatched cameras skip rendering:
+
+    python -m benchmarks.pipeline_benchmark --datasets one_bottle --tiles 4 --cameras 4 --viewers 1
+
+Scaling across cores of the thread and process DetectionWorker backends:
+
+    python -m benchmarks.pipeline_benchmark --datasets one_bottle --tiles 4 --cameras 8 --workers 1 2 4 --backend thread process
+"""
+import argparse, itertools, json, os, queue, subprocess, sys, threading, time
+from datetime import datetime
+
+try:
+  import resource
+except ImportError:  # Not available on Windows
+  resource = None
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, PROJECT_ROOT)
+
+DATASETS = ["no_bottle", "one_bottle", "one_bottle_no_association"]
+TILES = list(range(2, 11))
+RESULT_PREFIX = "BENCHMARK_RESULT "
+
+
+class StubNVR:
+  """
+  NVR without network access: never finds a matching face and accepts every face insert.
+  """
+
+  def __init__(self, *args, **kwargs):
+    self.inserted = 0
+
+  def get_mode_data(self, face):
+    return "stub-mode-data"
+
+  def get_face_comparison(self, mode_data):
+    return (0, None)
+
+  def insert_into_face_db(self, face, name):
+    self.inserted += 1
+    return f"stub-{self.inserted}"
+
+
+class StubProcessIncompliance:
+  """
+  ProcessIncompliance without database access, hands out increasing person IDs.
+  """
+
+  # Shared by the handlers of all recognition worker threads
+  person_ids = itertools.count(1)
+
+  def __init__(self, db_params, camera_id):
+    self.camera_id = camera_id
+
+  def match_found_new_incompliance(self, *args, **kwargs):
+    return None
+
+  def no_match_new_incompliance(self, *args, **kwargs):
+    return f"bench-{self.camera_id}-{next(self.person_ids)}"
+
+
+class StubLabSafetyStaffDAO:
+  def get_email_by_camera_id(self, camera_id):
+    return []
+
+
+class StubNotificationService:
+  def send_incompliance_email(self, *args, **kwargs):
+    pass
+
+  def send_incompliance_telegram(self, *args, **kwargs):
+    pass
+
+
+class StubSaver:
+  """
+  Saver that counts snapshots instead of writing them to disk.
+  """
+
+  def __init__(self):
+    self.saved = 0
+
+  def save_img(self, frame, uuid_str, timestamp):
+    self.saved += 1
+
+  def stop(self):
+    pass
+
+
+def watch_feed(camera):
+  """
+  Live feed client of a camera: encodes every annotated frame of the display queue, like the /video_feed route.
+  """
+  import cv2
+
+  camera.add_viewer()
+  try:
+    while camera.running.is_set():
+      try:
+        frame_ref = camera.display_queue.get(timeout=1)
+      except queue.Empty:
+        continue
+      cv2.imencode(".jpg", frame_ref.frame)
+      frame_ref.release()
+  finally:
+    camera.remove_viewer()
+
+
+class BenchmarkManager:
+  """
+  Minimal stand-in for CameraManager: provides what Camera, read_frames and association need, without the database.
+  """
+
+  def __init__(self, num_workers, backend):
+    from shared.detection_manager import DetectionManager
+    from shared.flagged_store import FlaggedStore
+    from threads.association import recognise
+    from threads.recognition_service import RecognitionService
+
+    self.detection_manager = DetectionManager(num_workers, backend)
+    self.saver = StubSaver()
+    self.flagged_foodbev = FlaggedStore()
+    self.recognition_service = RecognitionService(recognise)
+
+
+def install_stubs():
+  """
+  Replaces the NVR, database, notification and MQTT dependencies of the association stage with stubs.
+  """
+  import threads.association as association
+
+  association.NVR = StubNVR
+  association.ProcessIncompliance = StubProcessIncompliance
+  association.NotificationService = StubNotificationService
+  association.lab_safety_staff_dao = StubLabSafetyStaffDAO()
+  association.get_lab_safety_telegram_by_camera_id = lambda camera_id: []
+  association.mqtt_client = None
+
+  # Snapshots of "new" persons create folders under web/static, keep them out of the tree
+  association.os = _NoMakedirsOS()
+
+
+class _NoMakedirsOS:
+  """
+  Proxy of the os module whose makedirs does nothing.
+  """
+
+  def __getattr__(self, name):
+    return getattr(os, name)
+
+  def makedirs(self, *args, **kwargs):
+    pass
+
+
+def peak_rss_mb(who=None):
+  """
+  Returns the peak resident set size of this process in MB, None if it can't be measured on this platform.
+
+  Parameters:
+    who (int, optional): `resource.RUSAGE_CHILDREN` for the largest terminated child process (process backend workers). Defaults to this process.
+  """
+  if resource is None:
+    return None
+
+  peak = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+  # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+  return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_configuration(dataset, tiles, cameras, workers, backend, duration, warmup, fps, viewers=0):
+  """
+  Runs one benchmark configuration in the current process.
+
+  Parameters:
+    dataset (str): Dataset folder under 'datasets'.
+    tiles (int): Tile variant of the dataset (e.g. 4 for '4tiles').
+    cameras (int): Number of cameras replaying the dataset concurrently.
+    workers (int): Number of DetectionWorkers.
+    backend (str): DetectionWorker backend, "thread" or "process".
+    duration (float): Measured seconds.
+    warmup (float): Seconds to run after the first processed frame before measuring starts.
+    fps (float or None): Replay rate of each camera, None to replay as fast as possible.
+    viewers (int, optional): Number of cameras with a live feed client. Defaults to 0.
+
+  Returns:
+    dict: Frames per second, per-stage latency percentiles, peak RSS, dropped frames, frame ring overflows, live wrist
+      proximity history tracks, face recognition request counters, per worker load and the
+      cascade's escalation rate (fraction of processed frames run through object detection) of the configuration.
+  """
+  install_stubs()
+
+  from shared.config import CASCADE_SCREENER_MODEL, DETECTION_KEYFRAME_INTERVAL
+  from shared.camera import Camera
+  from shared.frame_source import ImageDirectoryFrameSource
+  from shared.metrics import stage_metrics
+  from threads.reader import read_frames
+  from threads.association import association
+
+  directory = os.path.join(PROJECT_ROOT, "datasets", dataset, f"{tiles}tiles")
+  manager = BenchmarkManager(workers, backend)
+
+  camera_list = []
+  threads = []
+  for camera_id in range(cameras):
+    source = ImageDirectoryFrameSource(directory, fps=fps, loop=True)
+    camera = Camera(camera_id, f"replay-{camera_id}", "101", False, manager, source=source)
+    camera_list.append(camera)
+    targets = (read_frames, association, watch_feed) if camera_id < viewers else (read_frames, association)
+    for target in targets:
+      thread = threading.Thread(target=target, args=(camera,), daemon=True)
+      thread.start()
+      threads.append(thread)
+
+  # Wait for the models to load and the first frame to make it through a worker
+  load_deadline = time.monotonic() + 600
+  while stage_metrics.count("worker") == 0 and time.monotonic() < load_deadline:
+    time.sleep(0.5)
+  time.sleep(warmup)
+
+  stage_metrics.reset()
+  dropped_before = sum(camera.dropped_frames for camera in camera_list)
+  start = time.monotonic()
+  time.sleep(duration)
+  elapsed = time.monotonic() - start
+  summary = stage_metrics.summary()
+  dropped = sum(camera.dropped_frames for camera in camera_list) - dropped_before
+
+  for camera in camera_list:
+    camera.running.clear()
+  for thread in threads:
+    thread.join(timeout=5)
+  worker_stats = manager.detection_manager.get_worker_stats()
+  manager.detection_manager.stop_all()
+  manager.recognition_service.stop()
+  recognition = manager.recognition_service.get_stats()
+  ring_overflows = sum(camera.frame_ring.overflows for camera in camera_list)
+  wrist_history_tracks = sum(len(camera.wrist_proximity_history) for camera in camera_list)
+  for camera in camera_list:
+    camera.frame_ring.close()
+
+  processed = summary.get("worker", {}).get("count", 0)
+  # Without a cascade or keyframe interval every processed frame runs object detection
+  detected = summary.get("detect", {}).get("count", 0)
+  return {
+    "dataset": dataset,
+    "tiles": tiles,
+    "cameras": cameras,
+    "workers": workers,
+    "backend": backend,
+    "replay_fps": fps,
+    "viewers": min(viewers, cameras),
+    "duration_s": elapsed,
+    "frames_processed": processed,
+    "fps": processed / elapsed if elapsed > 0 else 0.0,
+    "frames_dropped": dropped,
+    "frame_ring_overflows": ring_overflows,
+    "wrist_history_tracks": wrist_history_tracks,
+    "recognition": recognition,
+    "worker_load": worker_stats,
+    "cascade_screener": CASCADE_SCREENER_MODEL or None,
+    "keyframe_interval": DETECTION_KEYFRAME_INTERVAL,
+    "escalation_rate": detected / processed if processed else None,
+    "stages": summary,
+    "peak_rss_mb": peak_rss_mb(),
+    "peak_worker_process_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN) if resource and backend == "process" else None,
+  }
+
+
+def git_commit():
+  """
+  Returns the current git commit hash, None outside a git checkout.
+  """
+  try:
+    return subprocess.run(
+      ["git", "rev-parse", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True
+    ).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+
+def run_in_subprocess(dataset, tiles, workers, backend, args):
+  """
+  Runs one configuration in a fresh Python process and returns its result.
+  """
+  command = [
+    sys.executable, "-m", "benchmarks.pipeline_benchmark", "--single",
+    "--datasets", dataset,
+    "--tiles", str(tiles),
+    "--cameras", str(args.cameras),
+    "--workers", str(workers),
+    "--backend", backend,
+    "--duration", str(args.duration),
+    "--warmup", str(args.warmup),
+  ]
+  if args.fps:
+    command += ["--fps", str(args.fps)]
+  if args.viewers:
+    command += ["--viewers", str(args.viewers)]
+
+  completed = subprocess.run(command, cwd=PROJECT_ROOT, capture_output=True, text=True)
+  for line in completed.stdout.splitlines():
+    if line.startswith(RESULT_PREFIX):
+      return json.loads(line[len(RESULT_PREFIX):])
+
+  return {
+    "dataset": dataset,
+    "tiles": tiles,
+    "workers": workers,
+    "backend": backend,
+    "error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else f"exit code {completed.returncode}",
+  }
+
+
+def configuration_key(result):
+  """
+  Returns the key identifying a result's configuration, results of older benchmark files default to 1 thread worker.
+  """
+  return (result["dataset"], result["tiles"], result.get("workers", 1), result.get("backend", "thread"))
+
+
+def configuration_name(result):
+  """
+  Returns a short readable name of a result's configuration (e.g. 'one_bottle/4tiles 2xprocess').
+  """
+  dataset, tiles, workers, backend = configuration_key(result)
+  return f"{dataset}/{tiles}tiles {workers}x{backend}"
+
+
+def print_scaling(results):
+  """
+  Prints the FPS gain of every worker count over the smallest measured worker count, per dataset and backend.
+  """
+  groups = {}
+  for result in results:
+    if "error" not in result:
+      dataset, tiles, workers, backend = configuration_key(result)
+      groups.setdefault((dataset, tiles, backend), {})[workers] = result["fps"]
+
+  for (dataset, tiles, backend), fps_by_workers in groups.items():
+    if len(fps_by_workers) < 2:
+      continue
+    base_workers = min(fps_by_workers)
+    base_fps = fps_by_workers[base_workers]
+    scaling = ", ".join(
+      f"{workers} workers {fps / base_fps:.2f}x" if base_fps > 0 else f"{workers} workers n/a"
+      for workers, fps in sorted(fps_by_workers.items())
+    )
+    print(f"[INFO] Scaling {dataset}/{tiles}tiles ({backend}), relative to {base_workers} workers: {scaling}")
+
+
+def compare(results, baseline_path):
+  """
+  Prints FPS and worker p95 latency changes against a previous benchmark JSON file.
+  """
+  with open(baseline_path) as f:
+    baseline = {configuration_key(r): r for r in json.load(f)["results"] if "error" not in r}
+
+  print(f"{'configuration':<36}{'fps':>18}{'worker p95 ms':>24}")
+  for result in results:
+    old = baseline.get(configuration_key(result))
+    if old is None or "error" in result:
+      continue
+    new_p95 = result["stages"].get("worker", {}).get("p95_ms", 0.0)
+    old_p95 = old["stages"].get("worker", {}).get("p95_ms", 0.0)
+    print(
+      f"{configuration_name(result):<36}"
+      f"{old['fps']:>8.2f} -> {result['fps']:<7.2f}"
+      f"{old_p95:>11.1f} -> {new_p95:<10.1f}"
+    )
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark the detection pipeline on the bundled datasets.")
+  parser.add_argument("--datasets", nargs="+", default=DATASETS, choices=DATASETS)
+  parser.add_argument("--tiles", nargs="+", type=int, default=TILES)
+  parser.add_argument("--cameras", type=int, default=1, help="Cameras replaying the dataset concurrently.")
+  parser.add_argument("--workers", nargs="+", type=int, default=[1], help="Numbers of DetectionWorkers to measure.")
+  parser.add_argument(
+    "--backend", nargs="+", default=["thread"], choices=["thread", "process"], help="DetectionWorker backends to measure."
+  )
+  parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds per configuration.")
+  parser.add_argument("--warmup", type=float, default=3.0, help="Seconds to run before measuring.")
+  parser.add_argument("--fps", type=float, default=None, help="Replay rate per camera, as fast as possible if omitted.")
+  parser.add_argument("--viewers", type=int, default=0, help="Cameras with a live feed client, the others skip rendering.")
+  parser.add_argument("--output", default=None, help="JSON file to write the results to.")
+  parser.add_argument("--compare", default=None, help="Previous results JSON file to compare against.")
+  parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.single:
+    result = run_configuration(
+      args.datasets[0], args.tiles[0], args.cameras, args.workers[0], args.backend[0],
+      args.duration, args.warmup, args.fps, args.viewers,
+    )
+    print(RESULT_PREFIX + json.dumps(result))
+    return
+
+  results = []
+  for dataset in args.datasets:
+    for tiles in args.tiles:
+      for backend in args.backend:
+        for workers in args.workers:
+          result = run_in_subprocess(dataset, tiles, workers, backend, args)
+          results.append(result)
+          if "error" in result:
+            print(f"[ERROR] {configuration_name(result)}: {result['error']}")
+          else:
+            worker = result["stages"].get("worker", {})
+            print(
+              f"[INFO] {configuration_name(result)}: {result['fps']:.2f} FPS, "
+              f"worker p50/p95/p99 {worker.get('p50_ms', 0):.1f}/{worker.get('p95_ms', 0):.1f}/{worker.get('p99_ms', 0):.1f} ms, "
+              f"peak RSS {result['peak_rss_mb'] or 0:.0f} MB"
+              + (
+                f", object detection on {result['escalation_rate']:.1%} of frames"
+                if result.get("escalation_rate") is not None and result["escalation_rate"] < 1 else ""
+              )
+            )
+
+  print_scaling(results)
+
+  report = {
+    "commit": git_commit(),
+    "timestamp": datetime.now().isoformat(timespec="seconds"),
+    "config": {
+      "cameras": args.cameras,
+      "workers": args.workers,
+      "backends": args.backend,
+      "duration_s": args.duration,
+      "warmup_s": args.warmup,
+      "replay_fps": args.fps,
+      "viewers": args.viewers,
+    },
+    "results": results,
+  }
+
+  output = args.output or os.path.join(
+    PROJECT_ROOT, "benchmarks", "results", f"pipeline-{datetime.now():%Y%m%d-%H%M%S}.json"
+  )
+  os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+  with open(output, "w") as f:
+    json.dump(report, f, indent=2)
+  print(f"[INFO] Results written to {output}")
+
+  if args.compare:
+    compare(results, args.compare)
+
+
+if __name__ == "__main__":
+  main()
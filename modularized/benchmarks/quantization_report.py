@@ -0,0 +1,419 @@
+# benchmarks/quantization_report.py
+"""
+Accuracy/ latency report of FP32 and INT8 model variants.
+
+Runs every candidate model (ONNX Runtime, FP32 and INT8 exports, see `shared/quantization.py`) over the frames of
+`datasets/<dataset>/<n>tiles` and compares it with the FP32 export of the model the pipeline uses today:
+
+  - detect: AP50 over the food/ drink classes, and agreement (F1) of the boxes above the pipeline's confidence threshold,
+    i.e. whether the candidate reports the same objects as incompliant.
+  - pose: AP50 of the person boxes, agreement (F1) of the persons above the pipeline's threshold and the mean error
+    in pixels of the keypoints association uses (nose, eyes, ears, wrists).
+  - classify: top-1 agreement and water bottle verdict agreement on crops of the reference detections.
+
+Together with the per-frame latency and file size this shows the smallest model that still catches the same incompliances.
+Run from the 'modularized' directory (candidate .pt models must be in 'yolo_models', exports are created on first use):
+
+    python -m benchmarks.quantization_report
+    python -m benchmarks.quantization_report --detect yolo11x.pt yolo11m.pt yolo11s.pt --datasets one_bottle --threads 4
+"""
+import argparse, json, os, sys, time
+from datetime import datetime
+import cv2 as cv
+import numpy as np
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, PROJECT_ROOT)
+
+from benchmarks.pipeline_benchmark import DATASETS, TILES, git_commit
+from shared.model import BaseModel, FOOD_DRINK_CLASSES, DETECTION_CONFIDENCE, MODEL_PRECISIONS, PIPELINE_MODELS, POSE_KEYPOINTS
+from shared.detection_pipeline import is_water_bottle
+from shared.image_utils import safe_crop
+
+# Thresholds of the pose model in the DetectionPipeline
+POSE_CONFIDENCE = 0.8
+POSE_IOU = 0.7
+# Confidence candidates are run at for AP50, so the whole precision/ recall curve is covered
+AP_CONFIDENCE = 0.25
+MATCH_IOU = 0.5
+
+
+class CandidateModel(BaseModel):
+  """
+  Any model run through ONNX Runtime at a given precision, exported/ quantized on first use like the pipeline's models.
+  """
+
+  def __init__(self, model, task, precision, intra_op_threads):
+    self.task = task
+    super().__init__(model, backend="onnx", intra_op_threads=intra_op_threads, precision=precision)
+
+  @property
+  def size_mb(self):
+    """
+    Size of the model on disk, including external weights.
+    """
+    files = [self.model_path, f"{self.model_path}.data"]
+    return sum(os.path.getsize(path) for path in files if os.path.exists(path)) / (1024 * 1024)
+
+
+def load_frames(datasets, tiles, max_frames):
+  """
+  Loads the frames of the given datasets and tile counts, spread evenly if there are more than `max_frames` (0 for all).
+  """
+  paths = []
+  for dataset in datasets:
+    for tile in tiles:
+      directory = os.path.join(PROJECT_ROOT, "datasets", dataset, f"{tile}tiles")
+      if os.path.isdir(directory):
+        paths += [os.path.join(directory, name) for name in sorted(os.listdir(directory))]
+
+  if 0 < max_frames < len(paths):
+    paths = [paths[i] for i in np.linspace(0, len(paths) - 1, max_frames).round().astype(int)]
+
+  frames = [cv.imread(path) for path in paths]
+  return [frame for frame in frames if frame is not None]
+
+
+def box_iou_matrix(boxes_a, boxes_b):
+  """
+  Returns the IoU of every pair of (x1, y1, x2, y2) boxes, shape (len(boxes_a), len(boxes_b)).
+  """
+  if len(boxes_a) == 0 or len(boxes_b) == 0:
+    return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+
+  top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+  bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+  intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+  area_a = (boxes_a[:, 2:] - boxes_a[:, :2]).prod(axis=1)
+  area_b = (boxes_b[:, 2:] - boxes_b[:, :2]).prod(axis=1)
+  return intersection / (area_a[:, None] + area_b[None, :] - intersection + 1e-9)
+
+
+def match_boxes(reference, candidate):
+  """
+  Greedily matches candidate boxes (highest confidence first) to unmatched reference boxes of the same class.
+
+  Parameters:
+    reference (numpy.ndarray): Reference detections of a frame, rows of (x1, y1, x2, y2, confidence, class).
+    candidate (numpy.ndarray): Candidate detections of the same frame, same layout.
+
+  Returns:
+    list of int: Index of the matched reference box for every candidate box (in descending confidence order), -1 if unmatched.
+    numpy.ndarray: Candidate indices in descending confidence order.
+  """
+  order = np.argsort(-candidate[:, 4], kind="stable")
+  ious = box_iou_matrix(candidate[order, :4], reference[:, :4])
+  used = np.zeros(len(reference), dtype=bool)
+  matches = []
+
+  for row, index in enumerate(order):
+    valid = (ious[row] >= MATCH_IOU) & ~used & (reference[:, 5] == candidate[index, 5])
+    if valid.any():
+      match = int(np.argmax(np.where(valid, ious[row], -1)))
+      used[match] = True
+      matches.append(match)
+    else:
+      matches.append(-1)
+
+  return matches, order
+
+
+def average_precision_50(references, candidates):
+  """
+  AP50 of candidate detections against reference detections taken as ground truth, averaged over the classes
+  that appear in the references (all-point interpolated, like Pascal VOC/ COCO).
+
+  Parameters:
+    references (list of numpy.ndarray): Reference detections per frame, rows of (x1, y1, x2, y2, confidence, class).
+    candidates (list of numpy.ndarray): Candidate detections per frame, same layout.
+
+  Returns:
+    float or None: mAP50, None if the references contain no detections.
+  """
+  classes = np.unique(np.concatenate([reference[:, 5] for reference in references])) if references else []
+  aps = []
+
+  for cls in classes:
+    scores, hits = [], []
+    n_ground_truth = 0
+    for reference, candidate in zip(references, candidates):
+      reference = reference[reference[:, 5] == cls]
+      candidate = candidate[candidate[:, 5] == cls]
+      n_ground_truth += len(reference)
+      matches, order = match_boxes(reference, candidate)
+      scores += candidate[order, 4].tolist()
+      hits += [match >= 0 for match in matches]
+
+    order = np.argsort(-np.array(scores), kind="stable")
+    true_positives = np.cumsum(np.array(hits, dtype=float)[order])
+    recall = true_positives / n_ground_truth
+    precision = true_positives / np.arange(1, len(order) + 1)
+
+    # Area under the precision envelope
+    recall = np.concatenate([[0.0], recall, [1.0]])
+    precision = np.maximum.accumulate(np.concatenate([[1.0], precision, [0.0]])[::-1])[::-1]
+    aps.append(float(np.sum((recall[1:] - recall[:-1]) * precision[1:])))
+
+  return float(np.mean(aps)) if aps else None
+
+
+def agreement_f1(references, candidates, threshold):
+  """
+  F1 of the candidate detections above `threshold` against the reference detections above it, 1.0 if neither has any.
+  Missed and extra objects both count, so 1.0 means the candidate reports exactly the same objects as the reference.
+  """
+  true_positives = false_positives = false_negatives = 0
+  for reference, candidate in zip(references, candidates):
+    reference = reference[reference[:, 4] >= threshold]
+    candidate = candidate[candidate[:, 4] >= threshold]
+    matches, _ = match_boxes(reference, candidate)
+    matched = sum(match >= 0 for match in matches)
+    true_positives += matched
+    false_positives += len(candidate) - matched
+    false_negatives += len(reference) - matched
+
+  denominator = 2 * true_positives + false_positives + false_negatives
+  return 2 * true_positives / denominator if denominator else 1.0
+
+
+def latency_stats(latencies):
+  """
+  Returns mean and p95 latency in milliseconds.
+  """
+  latencies = np.array(latencies) * 1000
+  return {"mean_ms": float(latencies.mean()), "p95_ms": float(np.percentile(latencies, 95))} if len(latencies) else {}
+
+
+def timed(function, *args, **kwargs):
+  start = time.perf_counter()
+  result = function(*args, **kwargs)
+  return result, time.perf_counter() - start
+
+
+def run_detect(model, frames):
+  """
+  Runs a detection model over every frame, returns detections per frame and latencies.
+  """
+  detections, latencies = [], []
+  for frame in frames:
+    result, latency = timed(
+      model.model.predict, frame, classes=FOOD_DRINK_CLASSES, conf=AP_CONFIDENCE, verbose=False
+    )
+    detections.append(result[0].boxes.data.cpu().numpy()[:, :6])
+    latencies.append(latency)
+  return detections, latencies
+
+
+def run_pose(model, frames):
+  """
+  Runs a pose model over every frame, returns person boxes and keypoints per frame and latencies.
+  """
+  detections, keypoints, latencies = [], [], []
+  for frame in frames:
+    result, latency = timed(model.model.predict, frame, conf=AP_CONFIDENCE, iou=POSE_IOU, verbose=False)
+    detections.append(result[0].boxes.data.cpu().numpy()[:, :6])
+    keypoints.append(result[0].keypoints.xy.cpu().numpy() if result[0].keypoints is not None else np.zeros((0, 17, 2)))
+    latencies.append(latency)
+  return detections, keypoints, latencies
+
+
+def run_classify(model, crops):
+  """
+  Runs a classification model over every crop, returns the top-1 labels and latencies.
+  """
+  labels, latencies = [], []
+  for crop in crops:
+    result, latency = timed(model.model.predict, crop, verbose=False)
+    labels.append(result[0].names[result[0].probs.top1])
+    latencies.append(latency)
+  return labels, latencies
+
+
+def keypoint_error(reference_boxes, reference_keypoints, candidate_boxes, candidate_keypoints):
+  """
+  Mean distance in pixels between the association keypoints of reference and candidate persons above the pipeline's
+  threshold that were matched to each other, None if no person was matched.
+  """
+  errors = []
+  for ref_boxes, ref_kpts, cand_boxes, cand_kpts in zip(reference_boxes, reference_keypoints, candidate_boxes, candidate_keypoints):
+    ref_keep = ref_boxes[:, 4] >= POSE_CONFIDENCE
+    cand_keep = cand_boxes[:, 4] >= POSE_CONFIDENCE
+    ref_kpts, cand_kpts = ref_kpts[ref_keep], cand_kpts[cand_keep]
+    matches, order = match_boxes(ref_boxes[ref_keep], cand_boxes[cand_keep])
+
+    for index, match in zip(order, matches):
+      if match < 0:
+        continue
+      ref, cand = ref_kpts[match][POSE_KEYPOINTS], cand_kpts[index][POSE_KEYPOINTS]
+      # Keypoints the model could not locate are (0, 0)
+      visible = (ref > 0).all(axis=1) & (cand > 0).all(axis=1)
+      errors += np.linalg.norm(ref[visible] - cand[visible], axis=1).tolist()
+
+  return float(np.mean(errors)) if errors else None
+
+
+def classification_crops(frames, reference_detections):
+  """
+  Crops of every reference detection (what the classifier sees in the pipeline), frame quadrants if there are none.
+  """
+  crops = []
+  for frame, detections in zip(frames, reference_detections):
+    for x1, y1, x2, y2, *_ in detections:
+      crops.append(safe_crop(frame, int(x1), int(y1), int(x2), int(y2), padding=10))
+
+  if not crops:
+    for frame in frames:
+      h, w = frame.shape[:2]
+      crops += [frame[y:y + h // 2, x:x + w // 2] for y in (0, h // 2) for x in (0, w // 2)]
+
+  return [crop for crop in crops if crop.size]
+
+
+def evaluate(task, models, precisions, frames, threads):
+  """
+  Evaluates every (model, precision) candidate of a task against the FP32 version of the first model.
+
+  Returns:
+    list of dict: One result per candidate, the reference first.
+    list: Reference detections per frame (detect task only, used for the classifier crops).
+  """
+  reference_model = models[0]
+  candidates = [(reference_model, "fp32")] + [
+    (model, precision) for model in models for precision in precisions if (model, precision) != (reference_model, "fp32")
+  ]
+
+  results = []
+  reference = None
+  for model_name, precision in candidates:
+    model = CandidateModel(model_name, task, precision, threads)
+    result = {"task": task, "model": model_name, "precision": precision, "size_mb": model.size_mb}
+
+    if task == "detect":
+      detections, latencies = run_detect(model, frames)
+      if reference is None:
+        reference = detections
+      result["ap50"] = average_precision_50(
+        [ref[ref[:, 4] >= DETECTION_CONFIDENCE] for ref in reference], detections
+      )
+      result["agreement"] = agreement_f1(reference, detections, DETECTION_CONFIDENCE)
+
+    elif task == "pose":
+      detections, keypoints, latencies = run_pose(model, frames)
+      if reference is None:
+        reference = (detections, keypoints)
+      result["ap50"] = average_precision_50(
+        [ref[ref[:, 4] >= POSE_CONFIDENCE] for ref in reference[0]], detections
+      )
+      result["agreement"] = agreement_f1(reference[0], detections, POSE_CONFIDENCE)
+      result["keypoint_error_px"] = keypoint_error(reference[0], reference[1], detections, keypoints)
+
+    else:
+      labels, latencies = run_classify(model, frames)
+      if reference is None:
+        reference = labels
+      result["top1_agreement"] = float(np.mean([a == b for a, b in zip(reference, labels)])) if labels else None
+      result["agreement"] = float(np.mean(
+        [is_water_bottle(a) == is_water_bottle(b) for a, b in zip(reference, labels)]
+      )) if labels else None
+
+    result.update(latency_stats(latencies))
+    results.append(result)
+    print_result(result, results[0])
+
+  return results, reference
+
+
+def print_result(result, reference):
+  speedup = reference.get("mean_ms", 0) / result["mean_ms"] if result.get("mean_ms") else 0.0
+  metrics = [f"agreement {result['agreement']:.3f}" if result["agreement"] is not None else "agreement n/a"]
+  if "ap50" in result:
+    metrics.append(f"AP50 {result['ap50']:.3f}" if result["ap50"] is not None else "AP50 n/a (no reference detections)")
+  if result.get("keypoint_error_px") is not None:
+    metrics.append(f"keypoint error {result['keypoint_error_px']:.1f} px")
+  if result.get("top1_agreement") is not None:
+    metrics.append(f"top-1 agreement {result['top1_agreement']:.3f}")
+
+  print(
+    f"[INFO] {result['task']:<8} {result['model']:<20} {result['precision']:<5} "
+    f"{result['size_mb']:>7.1f} MB  {result.get('mean_ms', 0):>7.1f} ms (p95 {result.get('p95_ms', 0):.1f}, {speedup:.2f}x)  "
+    + ", ".join(metrics)
+  )
+
+
+def recommend(results, min_agreement):
+  """
+  Prints the smallest candidate of each task whose agreement with the reference is at least `min_agreement`.
+  """
+  for task in dict.fromkeys(result["task"] for result in results):
+    eligible = [
+      r for r in results
+      if r["task"] == task and r["agreement"] is not None and r["agreement"] >= min_agreement
+    ]
+    if not eligible:
+      print(f"[INFO] {task}: no candidate reaches {min_agreement:.2f} agreement, keep the FP32 reference")
+      continue
+
+    best = min(eligible, key=lambda r: (r["size_mb"], r.get("mean_ms", 0)))
+    print(
+      f"[INFO] {task}: smallest candidate with agreement >= {min_agreement:.2f} is "
+      f"{best['model']} {best['precision']} ({best['size_mb']:.1f} MB, {best.get('mean_ms', 0):.1f} ms per frame)"
+    )
+
+
+def main():
+  default_models = {task: model for model, task in PIPELINE_MODELS.items()}
+
+  parser = argparse.ArgumentParser(description="Compare FP32 and INT8 model variants on the bundled datasets.")
+  parser.add_argument("--detect", nargs="*", default=[default_models["detect"]], help="Detection models, the first one is the reference.")
+  parser.add_argument("--pose", nargs="*", default=[default_models["pose"]], help="Pose models, the first one is the reference.")
+  parser.add_argument("--classify", nargs="*", default=[default_models["classify"]], help="Classification models, the first one is the reference.")
+  parser.add_argument("--precisions", nargs="+", default=MODEL_PRECISIONS, choices=MODEL_PRECISIONS)
+  parser.add_argument("--datasets", nargs="+", default=DATASETS, choices=DATASETS)
+  parser.add_argument("--tiles", nargs="+", type=int, default=TILES)
+  parser.add_argument("--frames", type=int, default=0, help="Maximum frames to evaluate, spread over the datasets (0 for all).")
+  parser.add_argument("--threads", type=int, default=0, help="ONNX Runtime intra-op threads per model (0 for the default).")
+  parser.add_argument("--min-agreement", type=float, default=0.95, help="Agreement a candidate needs to be recommended.")
+  parser.add_argument("--output", default=None, help="JSON file to write the results to.")
+  args = parser.parse_args()
+
+  if not args.detect:
+    parser.error("--detect needs at least one model, its detections are the classifier's inputs")
+
+  frames = load_frames(args.datasets, args.tiles, args.frames)
+  if not frames:
+    parser.error("No frames found for the selected datasets and tiles")
+  print(f"[INFO] Evaluating on {len(frames)} frames.")
+
+  results, reference_detections = evaluate("detect", args.detect, args.precisions, frames, args.threads)
+  if args.pose:
+    results += evaluate("pose", args.pose, args.precisions, frames, args.threads)[0]
+  if args.classify:
+    crops = classification_crops(frames, [ref[ref[:, 4] >= AP_CONFIDENCE] for ref in reference_detections])
+    results += evaluate("classify", args.classify, args.precisions, crops, args.threads)[0]
+
+  recommend(results, args.min_agreement)
+
+  report = {
+    "commit": git_commit(),
+    "timestamp": datetime.now().isoformat(timespec="seconds"),
+    "config": {
+      "datasets": args.datasets,
+      "tiles": args.tiles,
+      "frames": len(frames),
+      "threads": args.threads,
+      "min_agreement": args.min_agreement,
+    },
+    "results": results,
+  }
+
+  output = args.output or os.path.join(
+    PROJECT_ROOT, "benchmarks", "results", f"quantization-{datetime.now():%Y%m%d-%H%M%S}.json"
+  )
+  os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+  with open(output, "w") as f:
+    json.dump(report, f, indent=2)
+  print(f"[INFO] Results written to {output}")
+
+
+if __name__ == "__main__":
+  main()
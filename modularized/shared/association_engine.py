@@ -0,0 +1,100 @@
+# shared/association_engine.py
+import numpy as np
+from shared.model import NOSE, LEFT_EYE, RIGHT_EYE, LEFT_EAR, RIGHT_EAR, LEFT_WRIST, RIGHT_WRIST
+
+
+def face_regions(pose_points, frame_height):
+  """
+  Estimates the face bounding box of every person from the nose, eyes and ears, see `extract_face_from_nose` in
+  benchmarks/association_benchmark.py for the single person version this matches.
+
+  Parameters:
+    pose_points (numpy.ndarray): Keypoints of the persons, shape (persons, 7, 2), see `PoseDetectionModel.parse_keypoints`.
+    frame_height (int): Height of the frame the keypoints belong to.
+
+  Returns:
+    tuple: (faces, valid), int64 array of shape (persons, 4) with the (x1, y1, x2, y2) face boxes and a bool array of
+      shape (persons,), False for persons whose face box is invalid (x2 <= x1 or y2 <= y1).
+  """
+  nose = pose_points[:, NOSE]
+  l_eye, r_eye = pose_points[:, LEFT_EYE], pose_points[:, RIGHT_EYE]
+  l_ear, r_ear = pose_points[:, LEFT_EAR], pose_points[:, RIGHT_EAR]
+
+  # Vertical: nose to eye distance (tripled) above the eyes and below the nose
+  average_y_of_eyes = (l_eye[:, 1] + r_eye[:, 1]) // 2
+  nose_to_eye_height = np.abs(nose[:, 1] - average_y_of_eyes) * 3
+  y1 = np.maximum(np.trunc(average_y_of_eyes - nose_to_eye_height), 0)
+  y2 = np.minimum(np.trunc(nose[:, 1] + nose_to_eye_height) + 20, frame_height)
+
+  # Horizontal: ears, at least 40 pixels beside the eyes
+  x1 = np.trunc(np.minimum(l_ear[:, 0], r_eye[:, 0] - 40))
+  x2 = np.trunc(np.maximum(r_ear[:, 0], l_eye[:, 0] + 40))
+
+  faces = np.stack([x1, y1, x2, y2], axis=1).astype(np.int64)
+  valid = (faces[:, 2] > faces[:, 0]) & (faces[:, 3] > faces[:, 1])
+  return faces, valid
+
+
+def match_people(boxes, centers, pose_points, frame_height):
+  """
+  Finds the person most likely holding or consuming each object, for all objects and persons of a frame at once.
+
+  Every (object, person) pair goes through the same filters as the per pair checks association used to run:
+    - the person's face box must be valid,
+    - the top of the object must not be far above the nose (less than 65% of the nose height),
+    - the object must be at the same depth as the person (area and height compared to the face box), and
+    - the nose must be touching the object (consuming), or a wrist and the nose must be close to it (holding).
+  Of the remaining persons, the one with the smallest nose to object + wrist to object distance is the match.
+
+  Parameters:
+    boxes (numpy.ndarray): Bounding boxes (x1, y1, x2, y2) of the objects, shape (objects, 4).
+    centers (numpy.ndarray): Centers (x, y) of the objects, shape (objects, 2).
+    pose_points (numpy.ndarray): Keypoints of the persons, shape (persons, 7, 2), see `PoseDetectionModel.parse_keypoints`.
+    frame_height (int): Height of the frame the objects and persons were detected in.
+
+  Returns:
+    tuple: (matches, scores, faces)
+      matches (numpy.ndarray): Index of the matched person of each object, -1 if no person matched, shape (objects,).
+      scores (numpy.ndarray): Score of each match (lower is closer), inf if no person matched, shape (objects,).
+      faces (numpy.ndarray): Face boxes of the persons, see `face_regions`.
+  """
+  boxes = np.asarray(boxes).reshape(-1, 4)
+  centers = np.asarray(centers).reshape(-1, 2)
+  faces, valid = face_regions(pose_points, frame_height)
+
+  # Objects along the rows, persons along the columns
+  x1, y1, x2, y2 = (boxes[:, i].astype(np.int64)[:, None] for i in range(4))
+  fx1, fy1, fx2, fy2 = (faces[None, :, i] for i in range(4))
+  nose = pose_points[None, :, NOSE]
+
+  # Top of the object a percentage above the nose
+  above_nose = y1 < nose[..., 1] * 0.65
+
+  # Object a lot larger than the head (person further away) or a lot smaller (object further away)
+  height = np.abs(y1 - y2)
+  area = np.abs(x1 - x2) * height
+  head_height = np.abs(fy1 - fy2)
+  area_head = np.abs(fx1 - fx2) * head_height
+  area_check = (area >= area_head * 4) | (area < area_head * 0.1)
+  height_check = (height >= head_height * 2.85) | (height < head_height * 0.35)
+
+  # Distance of the nose to the closest point of the object, and of the closest wrist to the object's center
+  clamped = np.clip(nose, boxes[:, None, :2], boxes[:, None, 2:])
+  dist_nose_to_box = np.linalg.norm(nose - clamped, axis=-1)
+  dist = np.minimum(
+    np.linalg.norm(pose_points[None, :, LEFT_WRIST] - centers[:, None], axis=-1),
+    np.linalg.norm(pose_points[None, :, RIGHT_WRIST] - centers[:, None], axis=-1),
+  )
+
+  consuming = dist_nose_to_box <= height * 0.3
+  holding = (dist <= height * 0.5) & (dist_nose_to_box <= height * 1.1)
+
+  candidates = valid[None, :] & ~above_nose & ~area_check & ~height_check & (consuming | holding)
+  scores = np.where(candidates, dist_nose_to_box + dist, np.inf)
+
+  if scores.shape[1] == 0:
+    return np.full(len(boxes), -1), np.full(len(boxes), np.inf), faces
+
+  matches = scores.argmin(axis=1)
+  best = scores[np.arange(len(boxes)), matches]
+  return np.where(np.isfinite(best), matches, -1), best, faces
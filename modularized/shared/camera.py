@@ -1,6 +1,23 @@
 # shared/camera.py
 import threading
 import queue
+import time
+from shared.config import (
+  MOTION_GATE_ENABLED,
+  MOTION_THRESHOLD,
+  MOTION_CAMERA_THRESHOLDS,
+  MOTION_PIXEL_THRESHOLD,
+  MOTION_KEYFRAME_INTERVAL,
+  MOTION_HOLD_TIME,
+  USE_SUB_STREAM,
+  FRAME_RING_SLOTS,
+  WRIST_HISTORY_SIZE,
+  WRIST_HISTORY_TTL,
+)
+from shared.motion_gate import MotionGate
+from shared.frame_source import RTSPFrameSource, WebcamFrameSource
+from shared.frame_ring import FrameRing
+from shared.proximity_history import ProximityHistory
 
 class Camera:
   """
@@ -13,60 +30,175 @@ class Camera:
     ip_address (str): IP address of the camera.
     channel (str): Channel identifier (e.g., "1501, 101, 1601, 201").
     use_ip_camera (bool): Indicates if the camera is an IP camera. Set to False only for testing with webcam.
+    use_sub_stream (bool): Read frames for detection from the low resolution sub-stream instead of the main stream.
     manager (CameraManager): Reference to the parent CameraManager instance.
     detection_manager: Inference manager retrieved from the camera manager.
+    source (FrameSource): Where the reader gets frames from. Defaults to the RTSP stream (sub-stream if `use_sub_stream`)
+      for IP cameras and the local webcam otherwise. Offline sources (video file, image directory) can be passed in for benchmarking.
 
-    frame_queue (queue.Queue): Queue for raw frames to use in object and pose detection.
-    process_queue (queue.Queue): Queue for frames used in association logic (human-to-food/beverage).
-    display_queue (queue.Queue): Queue for frames to be displayed in the dashboard UI.
+    frame_ring (FrameRing): Pre-allocated shared memory slots the camera's frames are decoded into. Stages pass FrameRefs
+      to these slots and release them when done instead of copying frames.
+    latest_frame (FrameRef): Single-slot buffer holding the newest frame not yet picked up by a DetectionWorker.
+    latest_frame_time (float): `time.perf_counter()` timestamp of when 'latest_frame' was captured, used for latency metrics.
+    dropped_frames (int): Number of frames overwritten in 'latest_frame' before a worker could process them.
+    scheduled (bool): Set while the camera is queued on a worker or its frame is in flight, the camera is only queued
+      again once the worker has published that frame. Keeps a camera out of a batch twice and off two workers at once.
+    process_queue (queue.Queue): Queue of FrameResults (frame, incompliant objects and pose keypoints) used in association logic (human-to-food/beverage), released by the association thread.
+    display_queue (queue.Queue): Queue of annotated FrameRefs to be displayed in the dashboard UI, released by the video feed.
+      Only filled while at least one client is watching the camera's live feed.
+    viewers (int): Number of clients currently streaming the camera's live feed.
 
     running (threading.Event): Flag to control camera's detection loop.
+    motion_gate (MotionGate): Skips frames while the scene is static, None if the motion gate is disabled.
 
-    flagged_foodbev (list): List of track IDs flagged for food or beverage policy violations.
-    pose_points (list): List of detected pose keypoints per frame.
-    detected_incompliance (dict): Maps track IDs to non-compliant detection data.
-      Format: {
-        track_id: [coords (list of 4), center (tuple), confidence (float), class_id (int)]
-      }
-
-    wrist_proximity_history (dict): Historical record of wrist proximity timestamps by track ID.
-      Format: {
-        track_id: [timestamp1, timestamp2, ...]
-      }
-
-    detected_incompliance_lock (threading.Lock): Lock for accessing/modifying 'detected_incompliance'.
-    pose_points_lock (threading.Lock): Lock for accessing/modifying 'pose_points'.
-    flagged_foodbev_lock (threading.Lock): Lock for accessing/modifying 'flagged_foodbev'.
+    flagged_foodbev (FlaggedStore): Food/ drinks flagged for policy violations, keyed by (camera_id, track_id) and shared by
+      all cameras of the manager. Flags expire individually after FLAGGED_TTL seconds.
+
+    wrist_proximity_history (ProximityHistory): Recent wrist proximity timestamps by track ID, bounded per track and
+      evicted once a track has not been close to a person for WRIST_HISTORY_TTL seconds.
+
+    latest_frame_lock (threading.Lock): Lock for accessing/modifying 'latest_frame', 'dropped_frames' and 'scheduled'.
+    viewers_lock (threading.Lock): Lock for accessing/modifying 'viewers'.
   """
 
-  def __init__(self, camera_id, ip_address, channel, use_ip_camera, manager):
+  def __init__(self, camera_id, ip_address, channel, use_ip_camera, manager, source=None):
     
     # Store Camera details
     self.camera_id = camera_id
     self.ip_address = ip_address
     self.channel = channel
     self.use_ip_camera = use_ip_camera
+    self.use_sub_stream = USE_SUB_STREAM and use_ip_camera
 
     self.manager = manager
     self.detection_manager = manager.detection_manager
 
-    self.frame_queue = queue.Queue(maxsize=10)
+    self.frame_ring = FrameRing(FRAME_RING_SLOTS)
     self.process_queue = queue.Queue(maxsize=10)
     self.display_queue = queue.Queue(maxsize=3)
+    self.viewers = 0
+    self.viewers_lock = threading.Lock()
+
+    if source is None:
+      source = RTSPFrameSource(ip_address, self.detection_channel) if use_ip_camera else WebcamFrameSource(0)
+    self.source = source
 
-    self.cap = None
+    # Per camera motion gate in front of detection
+    self.motion_gate = None
+    if MOTION_GATE_ENABLED:
+      self.motion_gate = MotionGate(
+        threshold=MOTION_CAMERA_THRESHOLDS.get(camera_id, MOTION_THRESHOLD),
+        pixel_threshold=MOTION_PIXEL_THRESHOLD,
+        keyframe_interval=MOTION_KEYFRAME_INTERVAL,
+        hold_time=MOTION_HOLD_TIME,
+      )
 
     # Shared flags and locks
     self.running = threading.Event()
     self.running.set()
-    
-    self.detected_incompliance_lock = threading.Lock()
-    self.pose_points_lock = threading.Lock()
-    self.flagged_foodbev_lock = threading.Lock()
 
-    self.flagged_foodbev = [] # Format: [track ids]
-    self.pose_points = []
-    self.detected_incompliance = {} # Format: { track_id, [coords(List Of 4 Values), center(Tuple Of 2 Values), confidence(Float), classId(Integer)] }
+    # Latest frame only, stale frames are overwritten so latency stays bounded when inference falls behind
+    self.latest_frame_lock = threading.Lock()
+    self.latest_frame = None
+    self.latest_frame_time = None
+    self.dropped_frames = 0
+    self.scheduled = False
+
+    self.flagged_foodbev = manager.flagged_foodbev
 
     # Track wrist proximity times per person
-    self.wrist_proximity_history = {}  # Format: {track_id: [timestamps]}
+    self.wrist_proximity_history = ProximityHistory(WRIST_HISTORY_SIZE, WRIST_HISTORY_TTL)
+
+
+  def put_latest_frame(self, frame):
+    """
+    Stores a frame in the latest frame slot, overwriting (and releasing) the previous frame if no worker has picked it up yet.
+
+    Parameters:
+      frame (FrameRef): Newly decoded frame from the camera, the slot takes over the caller's reference.
+
+    Returns:
+      bool: True if the camera has to be scheduled on a worker, False if it is already queued or in flight
+        (the worker picks up the newest frame, or reschedules the camera after publishing its current one).
+    """
+    with self.latest_frame_lock:
+      stale = self.latest_frame
+      if stale is not None:
+        self.dropped_frames += 1
+      self.latest_frame = frame
+      self.latest_frame_time = time.perf_counter()
+      schedule = not self.scheduled
+      self.scheduled = True
+
+    if stale is not None:
+      stale.release()
+    return schedule
+
+  def take_latest_frame(self):
+    """
+    Removes and returns the newest frame from the latest frame slot, the caller takes over its reference.
+
+    Returns:
+      tuple: (frame, captured_at), the newest FrameRef and its `time.perf_counter()` capture timestamp, or (None, None) if the slot is empty.
+    """
+    with self.latest_frame_lock:
+      frame, captured_at = self.latest_frame, self.latest_frame_time
+      self.latest_frame = None
+      self.latest_frame_time = None
+
+    return frame, captured_at
+
+  def finish_frame(self):
+    """
+    Called by the worker once the frame it took is published (or dropped), the camera is no longer in flight.
+
+    Returns:
+      bool: True if a newer frame arrived meanwhile, the camera stays scheduled and has to be queued on a worker again.
+    """
+    with self.latest_frame_lock:
+      self.scheduled = self.latest_frame is not None
+      return self.scheduled
+
+
+  @property
+  def has_viewers(self):
+    """
+    True while at least one client is streaming the live feed, frames are only annotated for the dashboard then.
+    """
+    return self.viewers > 0
+
+  def add_viewer(self):
+    """
+    Registers a client streaming the camera's live feed.
+    """
+    with self.viewers_lock:
+      self.viewers += 1
+
+  def remove_viewer(self):
+    """
+    Unregisters a client streaming the camera's live feed.  
+    Once the last one is gone, the annotated frames left in the display queue are released.
+    """
+    with self.viewers_lock:
+      self.viewers = max(0, self.viewers - 1)
+      if self.viewers:
+        return
+
+    while True:
+      try:
+        self.display_queue.get_nowait().release()
+      except queue.Empty:
+        break
+
+  @property
+  def detection_channel(self):
+    """
+    Channel the reader decodes frames for detection from.  
+    Sub-stream channels end in "02" (e.g. main stream "101" -> sub-stream "102").
+
+    Returns:
+      str: The sub-stream channel if `use_sub_stream` is set, otherwise the main stream channel.
+    """
+    if self.use_sub_stream:
+      return f"{str(self.channel)[:-2]}02"
+    return self.channel
@@ -1,7 +1,11 @@
 # shared/camera_manager.py
 import threading, psycopg2, os
+from shared.config import FLAGGED_TTL, FLAGGED_MAX_ENTRIES
+from shared.config import RECOGNITION_CONCURRENCY, RECOGNITION_QUEUE_SIZE, NVR_FACE_MODEL_DELAY
 from shared.detection_manager import DetectionManager
+from shared.flagged_store import FlaggedStore
 from threads.saver import Saver
+from threads.recognition_service import RecognitionService
 
 target_class_list = [39, 40, 41, 46, 47, 48, 49, 50, 51, 52, 53, 54, 55]
 
@@ -24,6 +28,8 @@ class CameraManager:
     db (psycopg2.extensions.connection): Active PostgreSQL database connection.
     detection_manager (DetectionManager): Manager for coordinating YOLO detection workers.
     saver (Saver): Thread responsible for saving detection results.
+    flagged_foodbev (FlaggedStore): Food/ drinks of all cameras already flagged for a policy violation.
+    recognition_service (RecognitionService): Face recognition of the persons associated with food/ drinks, shared by all cameras.
   """
   _instance = None
 
@@ -66,7 +72,12 @@ class CameraManager:
     gpu_count = os.getenv("GPU_COUNT")
     self.detection_manager = DetectionManager(gpu_count)
     self.saver = Saver()
-    self.nvr_face_lock = threading.Lock()
+    self.flagged_foodbev = FlaggedStore(FLAGGED_TTL, FLAGGED_MAX_ENTRIES)
+
+    from threads.association import recognise
+    self.recognition_service = RecognitionService(
+      recognise, RECOGNITION_CONCURRENCY, RECOGNITION_QUEUE_SIZE, NVR_FACE_MODEL_DELAY
+    )
 
     # Start detection on all cameras and add them to the camera pool
     for camera_id, ip_address in rows:
@@ -78,7 +89,7 @@ class CameraManager:
     """
     Gracefully shuts down all active cameras in the camera pool.
     Ensures that all camera threads are properly terminated.
-    Also stops all other threads (Detection Worker and Saver) for a clean exit.
+    Also stops all other threads (Detection Worker, Recognition Service and Saver) for a clean exit.
 
     For each camera, this method:  
     - Clears the 'running' event to stop detection.  
@@ -98,8 +109,14 @@ class CameraManager:
         print(f"[INFO] Thread '{thread_name}' for camera {camera_id} joined.")
 
     self.detection_manager.stop_all()
+    self.recognition_service.stop()
     self.saver.stop()
 
+    for camera_info in self.camera_pool.values():
+      camera = camera_info.get("camera")
+      if camera:
+        camera.frame_ring.close()
+
   def remove_camera(self, camera_id):
     """
     Removes a camera from the camera pool and gracefully shuts it down.
@@ -133,9 +150,13 @@ class CameraManager:
       print(f"[INFO] Thread '{thread_name}' for camera {camera_id} joined.")
 
     del self.camera_pool[camera_id]
+    self.detection_manager.release_camera(camera_id)
+    self.flagged_foodbev.drop_camera(camera_id)
+    if camera:
+      camera.frame_ring.close()
     return True
 
-  def add_new_camera(self, camera_id, ip_address, use_ip_camera, channel="101"):
+  def add_new_camera(self, camera_id, ip_address, use_ip_camera, channel="101", source=None):
     """
     Adds a new camera and starts its associated processing/ detection threads.
 
@@ -149,6 +170,7 @@ class CameraManager:
       ip_address (str): IP address of the camera.
       use_ip_camera (bool): Whether the camera is an IP camera or not. Use False only for testing purposes, otherwise it should always be True.
       channel (str, optional): Camera channel number. Defaults to "101".
+      source (FrameSource, optional): Frame source to read from instead of the camera's stream (e.g. a replayed video file or image directory).
 
     Returns:
       bool: True if the camera was added successfully, False otherwise.
@@ -158,7 +180,7 @@ class CameraManager:
     from shared.camera import Camera
 
     try:
-      camera = Camera(camera_id, ip_address, channel, use_ip_camera, self)
+      camera = Camera(camera_id, ip_address, channel, use_ip_camera, self, source=source)
 
       # Start all threads
       read_thread = threading.Thread(target=read_frames, args=(camera,))
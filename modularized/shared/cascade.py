@@ -0,0 +1,120 @@
+# shared/cascade.py
+import threading
+
+
+class DetectionCascade:
+  """
+  First stage of a two-stage detector cascade: a small screener model runs on every frame at a low confidence,
+  and only frames that need it are escalated to the large object detection model.
+
+  A frame is escalated if
+    - the screener finds a food/ drink candidate,
+    - the camera's tracker still has active tracks (the large model confirms them, or ends them once they are gone), or
+    - the camera has not been escalated for `refresh_frames` frames (safety net for objects the screener misses).
+
+  Attributes:
+    screener (ObjectDetectionModel): Small detector run on every frame.
+    confidence (float): Minimum screener confidence of a candidate.
+    refresh_frames (int): Frames after which a camera is escalated regardless of the screener, 0 to disable.
+    frames_since_escalation (dict): Frames each camera was not escalated for.
+      Format: {
+        camera_id: frames (int)
+      }
+    frames_screened (int): Number of frames run through the screener.
+    escalations (dict): Number of escalated frames per reason ("candidates", "tracks", "refresh").
+    screen_seconds (float): Total time spent in the screener.
+    detect_seconds (float): Total time spent in the large detector on escalated frames.
+  """
+
+  def __init__(self, screener, confidence=0.25, refresh_frames=30):
+    """
+    Initializes the cascade.
+
+    Parameters:
+      screener (ObjectDetectionModel): Small detector run on every frame.
+      confidence (float, optional): Minimum screener confidence of a candidate. Defaults to 0.25.
+      refresh_frames (int, optional): Frames after which a camera is escalated regardless of the screener, 0 to disable. Defaults to 30.
+    """
+    self.screener = screener
+    self.confidence = confidence
+    self.refresh_frames = refresh_frames
+
+    self.frames_since_escalation = {}
+    self.frames_screened = 0
+    self.escalations = {"candidates": 0, "tracks": 0, "refresh": 0}
+    self.screen_seconds = 0.0
+    self.detect_seconds = 0.0
+    self.lock = threading.Lock()
+
+  def select(self, camera_ids, frames, trackers):
+    """
+    Screens a batch of frames and returns the ones the large detector has to run on.
+
+    Parameters:
+      camera_ids (list of int): Camera of each frame.
+      frames (list of numpy.ndarray): Frames of the batch.
+      trackers (list): Tracker of each frame's camera, tracks still active in it force an escalation.
+
+    Returns:
+      list of int: Indices of the escalated frames.
+    """
+    candidates = self.screener.screen_batch(frames, self.confidence)
+
+    escalated = []
+    with self.lock:
+      self.frames_screened += len(frames)
+      for index, (camera_id, tracker) in enumerate(zip(camera_ids, trackers)):
+        skipped = self.frames_since_escalation.get(camera_id, self.refresh_frames)
+
+        if candidates[index]:
+          reason = "candidates"
+        elif tracker.tracked_stracks:
+          reason = "tracks"
+        elif self.refresh_frames and skipped >= self.refresh_frames:
+          reason = "refresh"
+        else:
+          self.frames_since_escalation[camera_id] = skipped + 1
+          continue
+
+        self.escalations[reason] += 1
+        self.frames_since_escalation[camera_id] = 0
+        escalated.append(index)
+
+    return escalated
+
+  def record_time(self, screen_seconds, detect_seconds):
+    """
+    Adds the time a batch spent in the screener and in the large detector.
+    """
+    with self.lock:
+      self.screen_seconds += screen_seconds
+      self.detect_seconds += detect_seconds
+
+  def drop_camera(self, camera_id):
+    """
+    Forgets a camera, e.g. after it was moved to another worker or removed.
+    """
+    with self.lock:
+      self.frames_since_escalation.pop(camera_id, None)
+
+  def get_stats(self):
+    """
+    Returns the escalation rate, escalations per reason, screener/ detector latency and the detection time saved.
+
+    The time saved compares the time spent in the screener and the large detector with the time the large detector
+    would have needed on every screened frame (at its measured time per escalated frame).
+    """
+    with self.lock:
+      escalated = sum(self.escalations.values())
+      detect_per_frame = self.detect_seconds / escalated if escalated else 0.0
+      full_seconds = detect_per_frame * self.frames_screened
+
+      return {
+        "frames_screened": self.frames_screened,
+        "frames_escalated": escalated,
+        "escalation_rate": escalated / self.frames_screened if self.frames_screened else 0.0,
+        "escalations": dict(self.escalations),
+        "screen_ms_per_frame": 1000 * self.screen_seconds / self.frames_screened if self.frames_screened else 0.0,
+        "detect_ms_per_escalated_frame": 1000 * detect_per_frame,
+        "time_saved": 1 - (self.screen_seconds + self.detect_seconds) / full_seconds if full_seconds else 0.0,
+      }
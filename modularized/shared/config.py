@@ -17,3 +17,106 @@ BOT_TOKEN = os.environ.get("BOT_TOKEN")
 LF_CAMERA_PER_PAGE = 1
 FINC_CAMERA_PER_PAGE = 3
 SINC_CAMERA_PER_PAGE = 3
+
+# --- Detection Worker Batching ---
+# Max frames (from different cameras) per object detection call, 1 disables batching
+DETECTION_BATCH_SIZE = int(os.environ.get("DETECTION_BATCH_SIZE", 1))
+# Max time to wait for a batch to fill up after its first frame arrives
+DETECTION_BATCH_DEADLINE_MS = float(os.environ.get("DETECTION_BATCH_DEADLINE_MS", 20))
+# Seconds between batching stats reports printed by each worker
+BATCH_STATS_INTERVAL = int(os.environ.get("BATCH_STATS_INTERVAL", 60))
+# "thread" runs each DetectionWorker as a thread of the app, "process" runs its inference in a separate process (frames via shared memory)
+DETECTION_BACKEND = os.environ.get("DETECTION_BACKEND", "thread").lower()
+
+# --- Model Inference Backend ---
+# "pytorch" runs the .pt models, "onnx"/ "openvino" export them once (cached next to the .pt in yolo_models) and run the export, faster on CPU-only nodes
+MODEL_BACKEND = os.environ.get("MODEL_BACKEND", "pytorch").lower()
+# Threads ONNX Runtime/ OpenVINO use per inference call, 0 keeps the runtime default (all cores, oversubscribed with several workers)
+MODEL_INTRA_OP_THREADS = int(os.environ.get("MODEL_INTRA_OP_THREADS", 0))
+# "fp32", or "int8" to run statically quantized models (onnx backend only, compare both with benchmarks/quantization_report.py first)
+MODEL_PRECISION = os.environ.get("MODEL_PRECISION", "fp32").lower()
+# Frames the INT8 models are calibrated on (images are picked evenly from every dataset in the directory)
+MODEL_CALIBRATION_DIR = os.environ.get("MODEL_CALIBRATION_DIR", "datasets")
+MODEL_CALIBRATION_FRAMES = int(os.environ.get("MODEL_CALIBRATION_FRAMES", 64))
+
+# --- Keyframes ---
+# Run detection on every n-th frame of a camera only, boxes and pose keypoints are carried to the frames in between with optical flow (1 = every frame)
+DETECTION_KEYFRAME_INTERVAL = int(os.environ.get("DETECTION_KEYFRAME_INTERVAL", 1))
+# Per camera overrides of DETECTION_KEYFRAME_INTERVAL, format: "camera_id:interval,camera_id:interval"
+DETECTION_KEYFRAME_CAMERA_INTERVALS = {
+    int(camera_id): int(interval)
+    for camera_id, interval in (
+        item.split(":") for item in os.environ.get("DETECTION_KEYFRAME_CAMERA_INTERVALS", "").split(",") if item.strip()
+    )
+}
+
+# --- Pose Regions ---
+# Run pose estimation on padded regions around the incompliant objects (merged where they overlap) instead of the full frame
+POSE_ROI_ENABLED = os.environ.get("POSE_ROI_ENABLED", "false").lower() == "true"
+# Padding on every side of an object, relative to its larger side (the person holding it has to fit into the region)
+POSE_ROI_PADDING = float(os.environ.get("POSE_ROI_PADDING", 2.0))
+# Minimum width/ height of a region in pixels
+POSE_ROI_MIN_SIZE = int(os.environ.get("POSE_ROI_MIN_SIZE", 256))
+
+# --- Detection Cascade ---
+# Small screener model (e.g. "yolo11n.pt" in yolo_models) run on every frame, yolo11x then only runs on frames with candidates
+# or active tracks. Empty disables the cascade.
+CASCADE_SCREENER_MODEL = os.environ.get("CASCADE_SCREENER_MODEL", "")
+# Minimum screener confidence of a candidate, kept low so the screener rather escalates too often than misses an object
+CASCADE_SCREEN_CONFIDENCE = float(os.environ.get("CASCADE_SCREEN_CONFIDENCE", 0.25))
+# Frames after which a camera is escalated even if the screener finds nothing (0 = never)
+CASCADE_REFRESH_FRAMES = int(os.environ.get("CASCADE_REFRESH_FRAMES", 30))
+
+# --- Frame Ring (per camera pool of shared memory frame slots passed between pipeline stages) ---
+# Slots per camera, frames are allocated privately (and counted as overflows) while all slots are in use
+FRAME_RING_SLOTS = int(os.environ.get("FRAME_RING_SLOTS", 16))
+# Share of /dev/shm the rings of all cameras may reserve, the rest is left to the process workers' frame slots.
+# A ring that does not fit gets fewer slots (or none, all its frames are private), instead of crashing with SIGBUS on write
+FRAME_RING_SHM_SHARE = float(os.environ.get("FRAME_RING_SHM_SHARE", 0.75))
+
+# --- Water Bottle Classifier Verdict Cache ---
+VERDICT_CACHE_SIZE = int(os.environ.get("VERDICT_CACHE_SIZE", 1024))
+# Seconds a verdict stays valid
+VERDICT_CACHE_TTL = float(os.environ.get("VERDICT_CACHE_TTL", 300))
+# Frames a verdict is reused before the object is classified again
+VERDICT_RECLASSIFY_FRAMES = int(os.environ.get("VERDICT_RECLASSIFY_FRAMES", 30))
+# Min IoU between the current and the classified box, below this the box changed too much and is classified again
+VERDICT_IOU_THRESHOLD = float(os.environ.get("VERDICT_IOU_THRESHOLD", 0.5))
+
+# --- Association ---
+# Seconds a flagged food/ drink (already reported) stays flagged, each flag expires on its own
+FLAGGED_TTL = float(os.environ.get("FLAGGED_TTL", 7200))
+# Maximum number of flagged food/ drinks over all cameras, the oldest flags are dropped first
+FLAGGED_MAX_ENTRIES = int(os.environ.get("FLAGGED_MAX_ENTRIES", 4096))
+# Wrist proximity timestamps kept per tracked object (at least the detections association requires within its time window)
+WRIST_HISTORY_SIZE = int(os.environ.get("WRIST_HISTORY_SIZE", 8))
+# Seconds after which the wrist proximity history of an object no person was close to anymore is evicted
+WRIST_HISTORY_TTL = float(os.environ.get("WRIST_HISTORY_TTL", 30))
+# Face recognition requests handled by the NVR at the same time (recognition worker threads)
+RECOGNITION_CONCURRENCY = int(os.environ.get("RECOGNITION_CONCURRENCY", 2))
+# Maximum number of queued face recognition requests, requests beyond it are dropped and retried on a later frame
+RECOGNITION_QUEUE_SIZE = int(os.environ.get("RECOGNITION_QUEUE_SIZE", 32))
+# Seconds the NVR needs to model the face of a newly inserted person, new persons are not inserted meanwhile
+NVR_FACE_MODEL_DELAY = float(os.environ.get("NVR_FACE_MODEL_DELAY", 5))
+
+# --- Motion Gate (skip detection while a camera's scene is static) ---
+MOTION_GATE_ENABLED = os.environ.get("MOTION_GATE_ENABLED", "false").lower() == "true"
+# Min fraction of changed pixels (downscaled frame) to count as motion
+MOTION_THRESHOLD = float(os.environ.get("MOTION_THRESHOLD", 0.01))
+# Per camera overrides of MOTION_THRESHOLD, format: "camera_id:threshold,camera_id:threshold"
+MOTION_CAMERA_THRESHOLDS = {
+    int(camera_id): float(threshold)
+    for camera_id, threshold in (
+        item.split(":") for item in os.environ.get("MOTION_CAMERA_THRESHOLDS", "").split(",") if item.strip()
+    )
+}
+# Min grayscale difference for a pixel to count as changed
+MOTION_PIXEL_THRESHOLD = int(os.environ.get("MOTION_PIXEL_THRESHOLD", 25))
+# Seconds between forced keyframes while the scene is static
+MOTION_KEYFRAME_INTERVAL = float(os.environ.get("MOTION_KEYFRAME_INTERVAL", 0.5))
+# Seconds frames keep being sent after the last motion
+MOTION_HOLD_TIME = float(os.environ.get("MOTION_HOLD_TIME", 2.0))
+
+# --- Dual Stream ---
+# Detect on the low resolution sub-stream (channel x02), the main stream is only grabbed for face crops and evidence snapshots
+USE_SUB_STREAM = os.environ.get("USE_SUB_STREAM", "false").lower() == "true"
@@ -1,6 +1,17 @@
 # shared/detection_manager.py
-import threading
+import threading, time
+from shared.config import DETECTION_BACKEND, BATCH_STATS_INTERVAL
+from shared.model import export_models
 from threads.detection_worker import DetectionWorker
+from threads.detection_process import ProcessDetectionWorker
+
+WORKER_BACKENDS = {
+  "thread": DetectionWorker,
+  "process": ProcessDetectionWorker,
+}
+
+# A camera stays on its current worker unless that worker has this many times more outstanding work than the least loaded one
+AFFINITY_SLACK = 1.5
 
 
 class DetectionManager:
@@ -8,13 +19,17 @@ class DetectionManager:
   Singleton class that manages multiple DetectionWorker threads to process incoming frames.
 
   Distsributes frames among a fixed number of workers (according to number of available GPUs, defined in .env file)
-  using round-robin scheduling.
+  using load-aware scheduling. Each camera is routed to the worker with the least outstanding work
+  (queued frames multiplied by the worker's measured inference time EWMA), but keeps its current worker while that
+  worker is not much busier, so the camera's tracker state stays warm.
+
+  Workers run as threads of this process or, with DETECTION_BACKEND=process, each run their inference in a separate process.
   """
 
   _instance = None
 
   # Singleton
-  def __new__(cls, num_workers):
+  def __new__(cls, num_workers, backend=DETECTION_BACKEND):
     if cls._instance is None:
       cls._instance = super(DetectionManager, cls).__new__(cls)
       cls._instance._initialized = False
@@ -26,23 +41,35 @@ class DetectionManager:
       raise RuntimeError("DetectionManager has not been initialized yet.")
     return cls._instance
 
-  def __init__(self, num_workers):
+  def __init__(self, num_workers, backend=DETECTION_BACKEND):
     """
     Initializes the DetectionManager with a specified number of DetectionWorker threads. 1 Worker = 1 YOLO Detection Queue = 1 GPU
 
     Parameters:
       num_workers (int): The number of workers to create.
+      backend (str, optional): "thread" or "process", see `WORKER_BACKENDS`. Defaults to DETECTION_BACKEND.
+
+    Raises:
+      ValueError: If the backend is unknown.
     """
     if self._initialized: # Singleton
       return 
     
+    if backend not in WORKER_BACKENDS:
+      raise ValueError(f"Unknown detection backend '{backend}', expected one of {list(WORKER_BACKENDS)}")
+
+    self.backend = backend
     self.workers = []
-    self.next_worker_index = 0 # For round-robin selection
+    self.camera_affinity = {} # Format: {camera_id: worker index}
     self.lock = threading.Lock() 
+    self.last_stats_report = time.monotonic()
 
-    print(f"[INFO] Starting {int(num_workers)} DetectionWorkers.")
+    # Export (or reuse cached exports of) the models once, instead of every worker exporting them at the same time
+    export_models()
+
+    print(f"[INFO] Starting {int(num_workers)} DetectionWorkers ({backend} backend).")
     for i in range(int(num_workers)):
-      worker = DetectionWorker(i)
+      worker = WORKER_BACKENDS[backend](i, int(num_workers))
       self.workers.append(worker)
 
   
@@ -50,21 +77,113 @@ class DetectionManager:
     """
     Submit a frame and its associated camera to a worker for processing.
 
-    This method uses round-robin scheduling to distribute incoming
-    frames across all detection workers.
+    The frame is stored in the camera's latest frame slot. The camera is only queued on a worker
+    (selected by `select_worker`) when it is not queued or in flight already, otherwise a stale frame is overwritten
+    and the worker that has the camera picks up the newest frame instead.
 
     Parameters:
-      frame: The frame data to be processed (e.g., an image or video frame).
+      frame (FrameRef): Reference to the frame to be processed, ownership passes to the camera's latest frame slot.
       camera: Metadata or identifier associated with the camera that provided the frame.
     """
+    if camera.put_latest_frame(frame):
+      self.schedule(camera)
+
+  def schedule(self, camera):
+    """
+    Queues a camera with a frame in its latest frame slot on the worker selected by `select_worker`.
+
+    Parameters:
+      camera (Camera): The camera, marked as scheduled by `put_latest_frame` or `finish_frame`.
+    """
+    worker = self.select_worker(camera.camera_id)
+    worker.submit(camera)
+    self.report_worker_stats()
+
+  def select_worker(self, camera_id):
+    """
+    Selects the worker for a camera's next frame based on outstanding work and camera affinity, skipping dead workers.
+
+    Parameters:
+      camera_id (int): The camera the frame belongs to.
+
+    Returns:
+      DetectionWorker: The selected worker.
+    """
+    with self.lock:
+      loads = [worker.outstanding_work() for worker in self.workers]
+      assigned = [0] * len(self.workers)
+      for index in self.camera_affinity.values():
+        assigned[index] += 1
+
+      # Dead workers (e.g. a crashed worker process) get no cameras, unless none is left
+      alive = [i for i, worker in enumerate(self.workers) if worker.is_alive()] or list(range(len(self.workers)))
+
+      # Least outstanding work, ties go to the worker with the fewest cameras
+      best = min(alive, key=lambda i: (loads[i], assigned[i]))
+
+      current = self.camera_affinity.get(camera_id)
+      if current in alive and loads[current] <= loads[best] * AFFINITY_SLACK:
+        return self.workers[current]
+
+      # Move camera to the least loaded worker, its tracker on the previous worker is stale from now on
+      if current is not None:
+        self.workers[current].drop_tracker(camera_id)
+      self.camera_affinity[camera_id] = best
+
+    return self.workers[best]
+
+  def release_camera(self, camera_id):
+    """
+    Forgets a removed camera's worker assignment and tracker state.
+
+    Parameters:
+      camera_id (int): The camera that was removed.
+    """
     with self.lock:
+      index = self.camera_affinity.pop(camera_id, None)
+
+    if index is not None:
+      self.workers[index].drop_tracker(camera_id)
 
-      # Set the current worker
-      worker = self.workers[self.next_worker_index]
+  def get_worker_stats(self):
+    """
+    Returns the current load of every DetectionWorker.
+
+    Returns:
+      list of dict: Per worker queue depth, frames in flight, processing time EWMA (ms), utilisation and number of assigned cameras.
+    """
+    with self.lock:
+      assigned = [0] * len(self.workers)
+      for index in self.camera_affinity.values():
+        assigned[index] += 1
+
+    return [
+      {
+        "worker_id": worker.worker_id,
+        "queue_depth": worker.queue_depth(),
+        "in_flight": worker.in_flight,
+        "ewma_frame_ms": worker.ewma_frame_time * 1000 if worker.ewma_frame_time is not None else None,
+        "utilisation": worker.utilisation,
+        "cameras": assigned[i],
+      }
+      for i, worker in enumerate(self.workers)
+    ]
+
+  def report_worker_stats(self):
+    """
+    Prints the load of every worker, at most once every BATCH_STATS_INTERVAL seconds.
+    """
+    with self.lock:
+      if time.monotonic() - self.last_stats_report < BATCH_STATS_INTERVAL:
+        return
+      self.last_stats_report = time.monotonic()
 
-      # Increment to the next worker, modulus to cap it at the max num of workers
-      self.next_worker_index = (self.next_worker_index + 1) % len(self.workers)
-    worker.submit(frame, camera)
+    for stats in self.get_worker_stats():
+      ewma = f"{stats['ewma_frame_ms']:.1f} ms/frame" if stats["ewma_frame_ms"] is not None else "n/a"
+      print(
+        f"[INFO] DetectionWorker-{stats['worker_id']} load: {stats['cameras']} cameras, queue depth {stats['queue_depth']}, "
+        f"{stats['in_flight']} in flight, EWMA {ewma}, utilisation {stats['utilisation']:.1%}"
+      )
 
   def stop_all(self):
     """
@@ -0,0 +1,390 @@
+# shared/detection_pipeline.py
+import time
+from collections import namedtuple
+import numpy as np
+from shared.config import (
+  CASCADE_SCREENER_MODEL,
+  CASCADE_SCREEN_CONFIDENCE,
+  CASCADE_REFRESH_FRAMES,
+  DETECTION_KEYFRAME_INTERVAL,
+  DETECTION_KEYFRAME_CAMERA_INTERVALS,
+  POSE_ROI_ENABLED,
+  POSE_ROI_PADDING,
+  POSE_ROI_MIN_SIZE,
+  VERDICT_CACHE_SIZE,
+  VERDICT_CACHE_TTL,
+  VERDICT_RECLASSIFY_FRAMES,
+  VERDICT_IOU_THRESHOLD,
+)
+from shared.model import (
+  ObjectDetectionModel,
+  PoseDetectionModel,
+  ImageClassificationModel,
+)
+from shared.verdict_cache import VerdictCache
+from shared.cascade import DetectionCascade
+from shared.keyframes import KeyframePropagator
+from shared.image_utils import safe_crop, padded_region, merge_regions
+
+# Column layout of FrameDetections.detections
+DETECTION_COLUMNS = ("track_id", "cls_id", "confidence", "x1", "y1", "x2", "y2")
+# Fraction of the frame the pose regions may cover, above it pose runs on the full frame instead
+POSE_ROI_MAX_COVERAGE = 0.5
+
+
+class FrameDetections(namedtuple("FrameDetections", ["detections", "incompliant", "keypoints", "timings"])):
+  """
+  Inference result of a single frame, made of plain NumPy arrays so it can be passed between processes cheaply.
+
+  Attributes:
+    detections (numpy.ndarray): float32 array of shape (N, 7), one row per tracked food/ drink box, see DETECTION_COLUMNS.
+    incompliant (numpy.ndarray): bool array of shape (N,), True for boxes that are not flagged yet and were not classified as water bottles.
+    keypoints (numpy.ndarray): float32 array of shape (persons, 17, 2) with the pose keypoints, None if no incompliant box was found or no person was detected.
+    timings (dict): Seconds spent in the screen, detect, classify, pose or propagate stages of this frame (stages that did not run are left out).
+  """
+  __slots__ = ()
+
+
+class FrameResult(namedtuple("FrameResult", ["frame", "captured_at", "detections", "keypoints"])):
+  """
+  Frozen result of a frame passed from the DetectionWorker to the association stage through the camera's process queue.
+
+  Carries everything association needs about the frame, so it never reads camera state that may already belong to a
+  newer frame. The arrays are read-only.
+
+  Attributes:
+    frame (FrameRef): The frame, released by the association stage (or when dropped from the queue).
+    captured_at (float): `time.perf_counter()` timestamp of when the frame was captured.
+    detections (numpy.ndarray): float32 array of shape (N, 7) with the incompliant objects of the frame, see DETECTION_COLUMNS.
+    keypoints (numpy.ndarray): float32 array of shape (persons, 7, 2), see `PoseDetectionModel.parse_keypoints`.
+  """
+  __slots__ = ()
+
+  def __new__(cls, frame, captured_at, detections, keypoints):
+    detections.setflags(write=False)
+    keypoints.setflags(write=False)
+    return super().__new__(cls, frame, captured_at, detections, keypoints)
+
+  def release(self):
+    """
+    Releases the frame reference.
+    """
+    self.frame.release()
+
+
+def boxes_to_detections(boxes):
+  """
+  Converts the tracked boxes of a frame into a detections array with a single host transfer.
+
+  Parameters:
+    boxes (Boxes): Tracked food/ drink boxes, boxes without a track ID are left out.
+
+  Returns:
+    numpy.ndarray: float32 array of shape (N, 7), see DETECTION_COLUMNS.
+  """
+  if boxes is None or not boxes.is_track:
+    return np.zeros((0, len(DETECTION_COLUMNS)), dtype=np.float32)
+
+  # Tracked boxes are laid out as (x1, y1, x2, y2, track_id, confidence, cls_id)
+  data = boxes.data
+  data = data.cpu().numpy() if hasattr(data, "cpu") else np.asarray(data)
+  return np.ascontiguousarray(data[:, [4, 6, 5, 0, 1, 2, 3]], dtype=np.float32)
+
+
+def is_water_bottle(predicted_label):
+  """
+  Returns True if the water bottle classifier's label means the object is allowed (model tends to detect some bottles as milk can also).
+  """
+  return predicted_label == "water_bottle" or predicted_label == "milk_can"
+
+
+class DetectionPipeline:
+  """
+  Models and per-camera state needed to turn frames into detections, independent of how frames get to it.
+
+  Used by a DetectionWorker thread directly, or inside the process of a ProcessDetectionWorker. It only reads frames
+  and returns FrameDetections, all Camera state (drawing, incompliances, pose points, queues) is updated by the worker.
+
+  Attributes:
+    object_detection_model (ObjectDetectionModel): Food/ drink detector.
+    pose_model (PoseDetectionModel): Pose estimation model.
+    classif_model (ImageClassificationModel): Water bottle classifier.
+    trackers (dict): Tracker state per camera, swapped in for each frame so cameras sharing the model keep separate track IDs.
+      Format: {
+        camera_id: CameraTracker
+      }
+    track_id_offset (int): Offset of the track IDs handed out by this pipeline's trackers, see CameraTracker.
+    track_id_stride (int): Number of worker processes sharing the track ID space of a camera.
+    verdict_cache (VerdictCache): Cached water bottle classifier verdicts per (camera_id, track_id).
+    cascade (DetectionCascade): Screener deciding which frames the object detection model runs on, None if CASCADE_SCREENER_MODEL is not set.
+    keyframes (KeyframePropagator): Decides which frames of a camera are keyframes and propagates their detections to the frames in between.
+    pose_roi (bool): Run pose estimation on padded regions around the incompliant objects instead of the full frame.
+    pose_stats (dict): Pose estimation calls, calls on regions and the frame/ region pixels processed.
+  """
+
+  def __init__(self, gpu_id, track_id_offset=0, track_id_stride=1):
+    """
+    Loads the models.
+
+    Parameters:
+      gpu_id (int): The ID of the GPU device used for object detection.
+      track_id_offset (int, optional): Offset of the track IDs handed out by this pipeline's trackers. Defaults to 0.
+      track_id_stride (int, optional): Number of worker processes sharing the track ID space of a camera. Defaults to 1.
+    """
+    self.object_detection_model = ObjectDetectionModel("yolo11x.pt", gpu_device=gpu_id)
+    self.pose_model = PoseDetectionModel("yolov8n-pose.pt", 0.8, 0.7)
+    self.classif_model = ImageClassificationModel("yolov8n-cls.pt")
+
+    self.cascade = None
+    if CASCADE_SCREENER_MODEL:
+      self.cascade = DetectionCascade(
+        ObjectDetectionModel(CASCADE_SCREENER_MODEL, gpu_device=gpu_id),
+        confidence=CASCADE_SCREEN_CONFIDENCE,
+        refresh_frames=CASCADE_REFRESH_FRAMES,
+      )
+
+    self.trackers = {}
+    self.track_id_offset = track_id_offset
+    self.track_id_stride = track_id_stride
+    self.verdict_cache = VerdictCache(
+      max_entries=VERDICT_CACHE_SIZE,
+      ttl=VERDICT_CACHE_TTL,
+      reclassify_frames=VERDICT_RECLASSIFY_FRAMES,
+      iou_threshold=VERDICT_IOU_THRESHOLD,
+    )
+    self.keyframes = KeyframePropagator(DETECTION_KEYFRAME_INTERVAL, DETECTION_KEYFRAME_CAMERA_INTERVALS)
+
+    self.pose_roi = POSE_ROI_ENABLED
+    self.pose_stats = {"calls": 0, "roi_calls": 0, "frame_pixels": 0, "pose_pixels": 0}
+
+  def run(self, items):
+    """
+    Runs a batch of frames from different cameras through object detection, the water bottle classifier and pose estimation.
+
+    Only keyframes are run through the models (every frame unless a keyframe interval is configured), the detections
+    and pose keypoints of the frames in between are propagated from the camera's last keyframe with optical flow.
+
+    Parameters:
+      items (list of tuple): (camera_id, frame, flagged track IDs) entries. Flagged tracks are drawn but never reported as incompliant again.
+
+    Returns:
+      tuple: (list of FrameDetections in the same order as `items`, seconds taken by the batched object detection call)
+    """
+    results = [None] * len(items)
+    keyframes = []
+
+    for index, (camera_id, frame, flagged) in enumerate(items):
+      if self.keyframes.is_keyframe(camera_id):
+        keyframes.append(index)
+        continue
+
+      start = time.perf_counter()
+      detections, incompliant, keypoints = self.keyframes.propagate(camera_id, frame, flagged)
+      results[index] = FrameDetections(detections, incompliant, keypoints, {"propagate": time.perf_counter() - start})
+
+    detect_time = 0.0
+    if keyframes:
+      keyframe_items = [items[index] for index in keyframes]
+      keyframe_results, detect_time = self.detect(keyframe_items)
+      for index, (camera_id, frame, _), result in zip(keyframes, keyframe_items, keyframe_results):
+        self.keyframes.update(camera_id, frame, result)
+        results[index] = result
+
+    return results, detect_time
+
+  def detect(self, items):
+    """
+    Runs keyframes from different cameras through object detection, the water bottle classifier and pose estimation.
+
+    With a cascade, only the frames escalated by the screener are run through object detection, the trackers of the
+    other cameras are advanced without detections.
+
+    Parameters:
+      items (list of tuple): (camera_id, frame, flagged track IDs) entries, see `run`.
+
+    Returns:
+      tuple: (list of FrameDetections in the same order as `items`, seconds taken by the batched object detection call)
+    """
+    camera_ids = [camera_id for camera_id, _, _ in items]
+    frames = [frame for _, frame, _ in items]
+    trackers = [self.get_tracker(camera_id) for camera_id in camera_ids]
+    timings = [{} for _ in items]
+
+    escalated = range(len(items))
+    if self.cascade is not None:
+      start = time.perf_counter()
+      escalated = self.cascade.select(camera_ids, frames, trackers)
+      screen_time = time.perf_counter() - start
+      for frame_timings in timings:
+        frame_timings["screen"] = screen_time
+
+    # Food/Drink detection, one batched inference call for all (escalated) cameras in the batch
+    batch_boxes = [None] * len(items)
+    detect_time = 0.0
+    if escalated:
+      start = time.perf_counter()
+      detected = self.object_detection_model.detect_batch(
+        [frames[index] for index in escalated], [trackers[index] for index in escalated]
+      )
+      detect_time = time.perf_counter() - start
+      for index, drink_boxes in zip(escalated, detected):
+        batch_boxes[index] = drink_boxes
+        timings[index]["detect"] = detect_time
+
+    if self.cascade is not None:
+      self.cascade.record_time(screen_time, detect_time)
+      for index, drink_boxes in enumerate(batch_boxes):
+        if drink_boxes is None:
+          batch_boxes[index] = self.object_detection_model.skip_frame(frames[index], trackers[index])
+
+    results = [
+      self.process_frame(camera_id, frame, drink_boxes, flagged, frame_timings)
+      for (camera_id, frame, flagged), drink_boxes, frame_timings in zip(items, batch_boxes, timings)
+    ]
+    return results, detect_time
+
+  def process_frame(self, camera_id, frame, drink_boxes, flagged, timings=None):
+    """
+    Classifies the detected objects of a single frame (water bottles are ignored) and detects human poses if any object is incompliant.
+
+    Parameters:
+      camera_id (int): The camera the frame belongs to.
+      frame (numpy.ndarray): The frame that was run through object detection.
+      drink_boxes (Boxes): Tracked food/ drink boxes detected in the frame.
+      flagged (set): Track IDs of the camera that are already flagged.
+      timings (dict, optional): Stage timings of the frame measured so far, the classify and pose timings are added to it.
+
+    Returns:
+      FrameDetections: Detections, incompliance mask and pose keypoints of the frame.
+    """
+    detections = boxes_to_detections(drink_boxes)
+    incompliant = np.zeros(len(detections), dtype=bool)
+    timings = {} if timings is None else timings
+
+    # Crops of objects without a valid cached verdict, classified in one batch after the loop
+    pending_crops = []
+
+    for index, (track_id, coords) in enumerate(zip(detections[:, 0].astype(int).tolist(), detections[:, 3:7])):
+      if track_id in flagged:
+        continue
+
+      # Check if it's a water bottle or not, reusing the verdict of this track if it's still valid
+      predicted_label = self.verdict_cache.get(camera_id, track_id, coords)
+      if predicted_label is None:
+        x1, y1, x2, y2 = map(int, coords)
+        pending_crops.append((index, track_id, coords, safe_crop(frame, x1, y1, x2, y2, padding=10)))
+        continue
+
+      incompliant[index] = not is_water_bottle(predicted_label)
+
+    # Classify all remaining crops of this frame at once and map the verdicts back to their track ids
+    if pending_crops:
+      start = time.perf_counter()
+      predicted_labels = self.classif_model.classify_batch([crop for *_, crop in pending_crops])
+      timings["classify"] = time.perf_counter() - start
+
+      for (index, track_id, coords, _), predicted_label in zip(pending_crops, predicted_labels):
+        self.verdict_cache.put(camera_id, track_id, coords, predicted_label)
+        if is_water_bottle(predicted_label):
+          print("🚫 Water bottle, skipping")
+        else:
+          incompliant[index] = True
+
+    # Poses are only needed to associate incompliant objects with a person
+    keypoints = None
+    if incompliant.any():
+      start = time.perf_counter()
+      keypoints = self.estimate_poses(frame, detections[incompliant, 3:7])
+      timings["pose"] = time.perf_counter() - start
+
+    return FrameDetections(
+      detections=detections,
+      incompliant=incompliant,
+      keypoints=keypoints,
+      timings=timings,
+    )
+
+  def estimate_poses(self, frame, boxes):
+    """
+    Detects the poses of the persons that could be holding the given objects.
+
+    In ROI mode, pose estimation runs on padded regions around the objects (overlapping regions merged) in one batch,
+    people elsewhere in the frame are never processed. If the regions cover most of the frame anyway, the full frame is used.
+
+    Parameters:
+      frame (numpy.ndarray): The frame the objects were detected in.
+      boxes (numpy.ndarray): Bounding boxes (x1, y1, x2, y2) of the incompliant objects.
+
+    Returns:
+      numpy.ndarray or None: Keypoints of the detected persons in frame coordinates, shape (persons, 17, 2), None if no person was found.
+    """
+    frame_pixels = frame.shape[0] * frame.shape[1]
+    regions = None
+    if self.pose_roi:
+      regions = merge_regions([padded_region(box, frame.shape, POSE_ROI_PADDING, POSE_ROI_MIN_SIZE) for box in boxes])
+      region_pixels = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions)
+      if region_pixels > POSE_ROI_MAX_COVERAGE * frame_pixels:
+        regions = None
+
+    self.pose_stats["calls"] += 1
+    self.pose_stats["frame_pixels"] += frame_pixels
+
+    if regions is None:
+      self.pose_stats["pose_pixels"] += frame_pixels
+      pose_keypoints = self.pose_model.predict(frame)
+      return pose_keypoints.cpu().numpy() if pose_keypoints is not None else None
+
+    self.pose_stats["roi_calls"] += 1
+    self.pose_stats["pose_pixels"] += region_pixels
+    return self.pose_model.predict_regions(frame, regions)
+
+  def get_tracker(self, camera_id):
+    """
+    Returns the tracker of a camera, creating a new one the first time the camera is seen by this pipeline.
+
+    Parameters:
+      camera_id (int): The camera the frame belongs to.
+
+    Returns:
+      CameraTracker: Tracker holding the camera's track state.
+    """
+    tracker = self.trackers.get(camera_id)
+    if tracker is None:
+      # The tracker only sees keyframes, scale its frame rate so lost tracks are kept for the same time
+      frame_rate = max(1, round(30 / self.keyframes.interval(camera_id)))
+      tracker = self.object_detection_model.create_tracker(
+        camera_id, frame_rate, self.track_id_offset, self.track_id_stride
+      )
+      self.trackers[camera_id] = tracker
+
+    return tracker
+
+  def drop_tracker(self, camera_id):
+    """
+    Discards the tracker state of a camera, e.g. after it was moved to another worker or removed.
+
+    Parameters:
+      camera_id (int): The camera whose tracker is discarded.
+    """
+    self.trackers.pop(camera_id, None)
+    self.keyframes.drop_camera(camera_id)
+    if self.cascade is not None:
+      self.cascade.drop_camera(camera_id)
+
+  def get_stats(self):
+    """
+    Returns the stats of the verdict cache, the keyframes, pose estimation and, if enabled, the cascade.
+
+    Returns:
+      dict: {"verdict_cache": dict, "keyframes": dict, "pose": dict, "cascade": dict or None}
+    """
+    pose_stats = dict(self.pose_stats)
+    pose_stats["pixel_ratio"] = (
+      pose_stats["pose_pixels"] / pose_stats["frame_pixels"] if pose_stats["frame_pixels"] else 0.0
+    )
+    return {
+      "verdict_cache": self.verdict_cache.get_stats(),
+      "keyframes": self.keyframes.get_stats(),
+      "pose": pose_stats,
+      "cascade": self.cascade.get_stats() if self.cascade is not None else None,
+    }
@@ -0,0 +1,131 @@
+# shared/flagged_store.py
+import threading, time
+from collections import OrderedDict
+
+
+class FlaggedStore:
+  """
+  Tracked objects that were already flagged for a food or beverage policy violation, so they are neither reported
+  as incompliant nor sent to face recognition again.
+
+  Entries are keyed by (camera_id, track_id) and expire individually `ttl` seconds after they were flagged, instead of
+  all flags being cleared at once. If more than `max_entries` objects are flagged, the oldest flags are dropped first.
+  Each camera's flagged track IDs are kept as a frozenset that is replaced whenever a flag is added or removed, so the
+  workers and association threads reading them every frame get the current set without a copy.
+
+  Attributes:
+    ttl (float): Seconds a flag stays valid.
+    max_entries (int): Maximum number of flags kept.
+    entries (OrderedDict): Expiry timestamp of each flag, oldest flag first.
+      Format: {
+        (camera_id, track_id): expiry timestamp (float)
+      }
+    cameras (dict): Flagged track IDs of each camera, an index into `entries`.
+      Format: {
+        camera_id: frozenset({track_id, ...})
+      }
+    expired (int): Number of flags that expired.
+    evicted (int): Number of flags dropped because the store was full.
+  """
+
+  def __init__(self, ttl=7200.0, max_entries=4096):
+    """
+    Initializes an empty FlaggedStore.
+
+    Parameters:
+      ttl (float, optional): Seconds a flag stays valid. Defaults to 7200 (2 hours).
+      max_entries (int, optional): Maximum number of flags kept. Defaults to 4096.
+    """
+    self.ttl = ttl
+    self.max_entries = max_entries
+
+    self.entries = OrderedDict()
+    self.cameras = {}
+    self.expired = 0
+    self.evicted = 0
+    self.lock = threading.Lock()
+
+  def add(self, camera_id, track_id):
+    """
+    Flags a tracked object, flagging it again restarts its TTL.
+
+    Parameters:
+      camera_id (int): The camera the object was detected on.
+      track_id (int): Track ID of the object.
+    """
+    key = (camera_id, track_id)
+    with self.lock:
+      self._expire(time.monotonic())
+      self.entries[key] = time.monotonic() + self.ttl
+      self.entries.move_to_end(key)
+      track_ids = self.cameras.get(camera_id, frozenset())
+      if track_id not in track_ids:
+        self.cameras[camera_id] = track_ids | {track_id}
+
+      while len(self.entries) > self.max_entries:
+        self._remove(*self.entries.popitem(last=False)[0])
+        self.evicted += 1
+
+  def __contains__(self, key):
+    """
+    Returns True if the (camera_id, track_id) key is flagged and its flag has not expired.
+    """
+    with self.lock:
+      self._expire(time.monotonic())
+      return key in self.entries
+
+  def track_ids(self, camera_id):
+    """
+    Returns the flagged track IDs of a camera, a read-only snapshot that later flags do not change.
+
+    Parameters:
+      camera_id (int): The camera to read the flagged track IDs of.
+
+    Returns:
+      frozenset: Track IDs of the camera with a valid flag.
+    """
+    with self.lock:
+      self._expire(time.monotonic())
+      return self.cameras.get(camera_id, frozenset())
+
+  def drop_camera(self, camera_id):
+    """
+    Removes all flags of a camera, e.g. after it was removed.
+    """
+    with self.lock:
+      for track_id in self.cameras.pop(camera_id, ()):
+        del self.entries[(camera_id, track_id)]
+
+  def _expire(self, now):
+    # Flags are kept in the order they were (re)flagged, so the expired ones are always at the front
+    while self.entries:
+      key, expires_at = next(iter(self.entries.items()))
+      if expires_at > now:
+        break
+      del self.entries[key]
+      self._remove(*key)
+      self.expired += 1
+
+  def _remove(self, camera_id, track_id):
+    track_ids = self.cameras.get(camera_id)
+    if track_ids is None or track_id not in track_ids:
+      return
+    if len(track_ids) > 1:
+      self.cameras[camera_id] = track_ids - {track_id}
+    else:
+      del self.cameras[camera_id]
+
+  def __len__(self):
+    with self.lock:
+      return len(self.entries)
+
+  def get_stats(self):
+    """
+    Returns the number of flags, expired flags and flags dropped because the store was full.
+    """
+    with self.lock:
+      return {
+        "entries": len(self.entries),
+        "expired": self.expired,
+        "evicted": self.evicted,
+      }
@@ -0,0 +1,245 @@
+# shared/frame_ring.py
+import os, threading
+from multiprocessing import shared_memory
+import numpy as np
+from shared.config import FRAME_RING_SHM_SHARE
+
+SHM_PATH = "/dev/shm"
+
+# Bytes reserved by the rings of this process. Shared memory pages are only committed once written, so /dev/shm's free
+# space does not show what the rings will take, and a ring that outgrows it crashes the process with SIGBUS on write.
+_reserved_bytes = 0
+_reserved_lock = threading.Lock()
+
+
+def shm_budget():
+  """
+  Returns the bytes of /dev/shm all frame rings may reserve, None if the platform has no /dev/shm to check.
+  """
+  try:
+    stats = os.statvfs(SHM_PATH)
+  except (AttributeError, OSError):
+    return None
+  return int(stats.f_blocks * stats.f_frsize * FRAME_RING_SHM_SHARE)
+
+
+class FrameRef:
+  """
+  Reference counted handle to a frame, passed between pipeline stages instead of the frame array itself.
+
+  Every holder of a reference (latest frame slot, worker, process/ display queue, association) calls `release` once it
+  no longer needs the frame. When the last reference is released the ring slot can be reused for a new frame.
+  Frames that did not fit into the ring (ring full, different resolution) are private arrays with `ring` set to None.
+
+  Attributes:
+    ring (FrameRing): The ring the frame lives in, None for a private frame.
+    index (int): Slot index in the ring, -1 for a private frame.
+    frame (numpy.ndarray): The frame, a view into the ring's shared memory for ring frames.
+  """
+  __slots__ = ("ring", "index", "frame")
+
+  def __init__(self, ring, index, frame):
+    self.ring = ring
+    self.index = index
+    self.frame = frame
+
+  def retain(self):
+    """
+    Adds a reference for another holder of the frame (e.g. before putting it into a second queue).
+
+    Returns:
+      FrameRef: This reference.
+    """
+    if self.ring is not None:
+      self.ring.retain(self.index)
+    return self
+
+  def release(self):
+    """
+    Drops one reference, the slot is freed when the last one is released.
+    """
+    if self.ring is not None:
+      self.ring.release(self.index)
+
+
+class FrameRing:
+  """
+  Per-camera pool of pre-allocated frame slots in a single shared memory block.
+
+  The reader decodes frames straight into free slots and the pipeline stages pass FrameRefs around, so no frame is
+  allocated per read (at 1080p that is ~6 MB per frame and camera). The block is sized on the first frame. Freed slots are
+  reused last-in first-out, so a lightly loaded camera keeps touching the same few slots (shared memory pages are only
+  committed once written). Being shared memory, a ProcessDetectionWorker reads ring frames in place without copying them.
+
+  Attributes:
+    slots (int): Number of frame slots, fewer than requested if the ring did not fit into the shared memory budget (see `shm_budget`).
+    shape (tuple): Shape of every slot's frame, None until the first frame is adopted.
+    dtype (numpy.dtype): dtype of every slot's frame.
+    block (SharedMemory): The shared memory block holding all slots, None until the first frame is adopted.
+    refcounts (list of int): Number of references to each slot, 0 for free slots.
+    overflows (int): Number of frames that had to be allocated privately because no slot was free or the resolution changed.
+  """
+
+  def __init__(self, slots=16):
+    """
+    Initializes an empty FrameRing, the shared memory is allocated on the first frame.
+
+    Parameters:
+      slots (int, optional): Number of frame slots. Defaults to 16.
+    """
+    self.slots = slots
+    self.shape = None
+    self.dtype = None
+    self.block = None
+    self.views = []
+    self.refcounts = [0] * slots
+    self.free = list(range(slots - 1, -1, -1))
+    self.overflows = 0
+    self.lock = threading.Lock()
+
+  @property
+  def name(self):
+    """
+    Name of the shared memory block, None until the first frame is adopted.
+    """
+    return self.block.name if self.block is not None else None
+
+  @property
+  def slot_bytes(self):
+    """
+    Size of one slot in bytes.
+    """
+    return int(np.prod(self.shape)) * self.dtype.itemsize
+
+  def allocate(self, shape, dtype):
+    """
+    Allocates the shared memory block for frames of the given shape.
+
+    The ring takes as many of its slots as still fit into the shared memory budget of all rings. Without a single slot
+    no block is allocated and every frame of the camera is a private frame.
+    """
+    global _reserved_bytes
+
+    self.shape = tuple(shape)
+    self.dtype = np.dtype(dtype)
+
+    requested = self.slots
+    budget = shm_budget()
+    with _reserved_lock:
+      if budget is not None and self.slot_bytes:
+        self.slots = max(0, min(requested, (budget - _reserved_bytes) // self.slot_bytes))
+      _reserved_bytes += self.slot_bytes * self.slots
+
+    if self.slots < requested:
+      print(
+        f"[ERROR] Frame ring of {self.shape} frames only fits {self.slots}/{requested} slots into {SHM_PATH} "
+        f"({budget / 1024 ** 3:.2f} GB for all rings), raise shm_size or lower FRAME_RING_SLOTS."
+      )
+    self.refcounts = [0] * self.slots
+    self.free = list(range(self.slots - 1, -1, -1))
+    if self.slots == 0:
+      return
+
+    self.block = shared_memory.SharedMemory(create=True, size=self.slot_bytes * self.slots)
+    self.views = [
+      np.ndarray(self.shape, dtype=self.dtype, buffer=self.block.buf, offset=index * self.slot_bytes)
+      for index in range(self.slots)
+    ]
+
+  def acquire(self):
+    """
+    Takes a free slot to decode the next frame into.
+
+    Returns:
+      FrameRef: Reference (count 1) to a free slot, None if the ring is not allocated yet or all slots are in use.
+    """
+    with self.lock:
+      if self.block is None or not self.free:
+        return None
+      index = self.free.pop()
+      self.refcounts[index] = 1
+
+    return FrameRef(self, index, self.views[index])
+
+  def adopt(self, frame, buffer=None):
+    """
+    Returns a reference to a frame that was read, moving it into the ring if it was not decoded into `buffer` in place.
+
+    Parameters:
+      frame (numpy.ndarray): The frame that was read.
+      buffer (FrameRef, optional): Slot from `acquire` the frame was supposed to be decoded into. Defaults to None.
+
+    Returns:
+      FrameRef: Reference (count 1) to the frame.
+    """
+    if buffer is not None:
+      if frame is buffer.frame:
+        return buffer
+      buffer.release()
+
+    with self.lock:
+      if self.shape is None:
+        self.allocate(frame.shape, frame.dtype)
+
+    return self.copy(frame)
+
+  def copy(self, frame):
+    """
+    Copies a frame into a free slot, e.g. for a frame that is drawn on.
+
+    Parameters:
+      frame (numpy.ndarray): The frame to copy.
+
+    Returns:
+      FrameRef: Reference (count 1) to the copy, a private array if no slot is free or the frame does not fit the ring.
+    """
+    ref = self.acquire() if frame.shape == self.shape and frame.dtype == self.dtype else None
+    if ref is None:
+      with self.lock:
+        self.overflows += 1
+      return FrameRef(None, -1, frame.copy())
+
+    np.copyto(ref.frame, frame)
+    return ref
+
+  def retain(self, index):
+    with self.lock:
+      self.refcounts[index] += 1
+
+  def release(self, index):
+    with self.lock:
+      self.refcounts[index] -= 1
+      if self.refcounts[index] == 0:
+        self.free.append(index)
+
+  def get_stats(self):
+    """
+    Returns the ring's size, slots in use and overflow count.
+    """
+    with self.lock:
+      return {
+        "slots": self.slots,
+        "in_use": self.slots - len(self.free),
+        "slot_mb": self.slot_bytes / (1024 * 1024) if self.block is not None else 0.0,
+        "overflows": self.overflows,
+      }
+
+  def close(self):
+    """
+    Frees the shared memory block. Frames still referenced by stages that have not stopped yet stay readable until they are dropped.
+    """
+    global _reserved_bytes
+
+    with self.lock:
+      block, self.block = self.block, None
+      self.views = []
+
+    if block is None:
+      return
+    with _reserved_lock:
+      _reserved_bytes -= self.slot_bytes * self.slots
+    try:
+      block.close()
+    except BufferError:
+      pass
+    block.unlink()
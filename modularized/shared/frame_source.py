@@ -0,0 +1,253 @@
+# shared/frame_source.py
+import os, time
+import cv2 as cv
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def build_rtsp_url(ip_address, channel):
+  """
+  Builds the RTSP URL of a camera stream.
+
+  Parameters:
+    ip_address (str): IP address of the camera.
+    channel (str): Stream channel (e.g. "101" for the main stream, "102" for the sub-stream).
+
+  Returns:
+    str: RTSP URL with basic authentication.
+  """
+  username = "admin"
+  password = "Sit12345"
+  return f"rtsp://{username}:{password}@{ip_address}/Streaming/Channels/{channel}"
+
+
+class FrameSource:
+  """
+  Base class for all sources a Camera can read frames from.
+
+  Attributes:
+    reconnectable (bool): Whether the reader should try to reopen the source after repeated read failures (live streams).
+    exhausted (bool): Set once a finite source (e.g. a replayed file) has no frames left.
+  """
+  reconnectable = False
+
+  def __init__(self):
+    self.exhausted = False
+
+  def open(self):
+    """
+    Opens the source.
+
+    Returns:
+      bool: True if the source was opened successfully.
+    """
+    raise NotImplementedError
+
+  def read(self, out=None):
+    """
+    Reads the next frame.
+
+    Parameters:
+      out (numpy.ndarray, optional): Pre-allocated array to decode the frame into. Sources that can't decode in place,
+        or frames that don't fit `out`, return a newly allocated frame instead. Defaults to None.
+
+    Returns:
+      tuple: (ret, frame) like `cv2.VideoCapture.read`, ret is False if no frame could be read.
+    """
+    raise NotImplementedError
+
+  def release(self):
+    """
+    Releases the source.
+    """
+    raise NotImplementedError
+
+
+class CaptureFrameSource(FrameSource):
+  """
+  Frame source backed by a `cv2.VideoCapture`.
+  """
+
+  def __init__(self, target, api_preference=cv.CAP_ANY):
+    """
+    Parameters:
+      target (str or int): URL, file path or device index passed to `cv2.VideoCapture`.
+      api_preference (int, optional): OpenCV capture backend. Defaults to cv2.CAP_ANY.
+    """
+    super().__init__()
+    self.target = target
+    self.api_preference = api_preference
+    self.cap = None
+
+  def open(self):
+    self.cap = cv.VideoCapture(self.target, self.api_preference)
+    return self.cap.isOpened()
+
+  def read(self, out=None):
+    if self.cap is None:
+      return False, None
+    return self.cap.read(out)
+
+  def release(self):
+    if self.cap:
+      self.cap.release()
+      self.cap = None
+
+
+class RTSPFrameSource(CaptureFrameSource):
+  """
+  Live RTSP stream of an IP camera.
+  """
+  reconnectable = True
+
+  def __init__(self, ip_address, channel):
+    """
+    Parameters:
+      ip_address (str): IP address of the camera.
+      channel (str): Stream channel to read.
+    """
+    super().__init__(build_rtsp_url(ip_address, channel), cv.CAP_FFMPEG)
+    self.ip_address = ip_address
+    self.channel = channel
+
+  def __str__(self):
+    return f"rtsp://{self.ip_address}/Streaming/Channels/{self.channel}"
+
+
+class WebcamFrameSource(CaptureFrameSource):
+  """
+  Local webcam, use only for testing on personal machines.
+  """
+
+  def __init__(self, index=0):
+    """
+    Parameters:
+      index (int, optional): Webcam device index. Defaults to 0.
+    """
+    super().__init__(index)
+
+  def __str__(self):
+    return f"webcam {self.target}"
+
+
+class ReplayFrameSource(FrameSource):
+  """
+  Base class for offline sources replayed either at a fixed FPS or as fast as possible.
+
+  Attributes:
+    fps (float or None): Replay rate, None to replay as fast as possible.
+    loop (bool): Restart from the first frame after the last one instead of finishing.
+  """
+
+  def __init__(self, fps=None, loop=False):
+    super().__init__()
+    self.fps = fps
+    self.loop = loop
+    self.next_frame_at = None
+
+  def pace(self):
+    """
+    Sleeps until the next frame is due when replaying at a fixed FPS.
+    """
+    if not self.fps:
+      return
+
+    now = time.monotonic()
+    if self.next_frame_at is not None and now < self.next_frame_at:
+      time.sleep(self.next_frame_at - now)
+      now = self.next_frame_at
+    self.next_frame_at = now + 1 / self.fps
+
+
+class VideoFileFrameSource(ReplayFrameSource):
+  """
+  Replays a video file.
+  """
+
+  def __init__(self, path, fps=None, loop=False):
+    """
+    Parameters:
+      path (str): Path to the video file.
+      fps (float, optional): Replay rate, None to replay as fast as possible. Defaults to None.
+      loop (bool, optional): Restart the video after the last frame. Defaults to False.
+    """
+    super().__init__(fps, loop)
+    self.path = path
+    self.cap = None
+
+  def open(self):
+    self.exhausted = False
+    self.cap = cv.VideoCapture(self.path)
+    return self.cap.isOpened()
+
+  def read(self, out=None):
+    if self.cap is None:
+      return False, None
+
+    self.pace()
+    ret, frame = self.cap.read(out)
+    if not ret and self.loop:
+      self.cap.set(cv.CAP_PROP_POS_FRAMES, 0)
+      ret, frame = self.cap.read(out)
+
+    if not ret:
+      self.exhausted = True
+    return ret, frame
+
+  def release(self):
+    if self.cap:
+      self.cap.release()
+      self.cap = None
+
+  def __str__(self):
+    return f"video {self.path}"
+
+
+class ImageDirectoryFrameSource(ReplayFrameSource):
+  """
+  Replays the images of a directory (e.g. 'datasets/one_bottle/4tiles') in file name order.
+  """
+
+  def __init__(self, directory, fps=None, loop=False):
+    """
+    Parameters:
+      directory (str): Directory containing the images.
+      fps (float, optional): Replay rate, None to replay as fast as possible. Defaults to None.
+      loop (bool, optional): Restart from the first image after the last one. Defaults to False.
+    """
+    super().__init__(fps, loop)
+    self.directory = directory
+    self.paths = []
+    self.index = 0
+
+  def open(self):
+    if not os.path.isdir(self.directory):
+      return False
+
+    self.paths = sorted(
+      os.path.join(self.directory, name)
+      for name in os.listdir(self.directory)
+      if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    self.index = 0
+    self.exhausted = False
+    return len(self.paths) > 0
+
+  def read(self, out=None):
+    if self.index >= len(self.paths):
+      if not self.loop or not self.paths:
+        self.exhausted = True
+        return False, None
+      self.index = 0
+
+    self.pace()
+    frame = cv.imread(self.paths[self.index])
+    self.index += 1
+    return frame is not None, frame
+
+  def release(self):
+    self.paths = []
+    self.index = 0
+
+  def __str__(self):
+    return f"images {self.directory}"
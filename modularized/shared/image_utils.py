@@ -0,0 +1,78 @@
+# shared/image_utils.py
+
+
+def safe_crop(img, x1, y1, x2, y2, padding=0):
+  """
+  Safely crops a region from an image, ensuring the crop area stays within image boundaries.
+
+  Parameters:
+    img (np.ndarray): The frame from which to crop.
+    x1, y1 (int): Top-left coordinates of the crop rectangle.
+    x2, y2 (int): Bottom-right coordinates of the crop rectangle.
+    padding (int, optional): Number of pixels to expand the crop area in all directions. Default is 0.
+
+  Returns:
+    np.ndarray: Cropped image region with padding applied, clipped to the image size.
+  """
+  h, w, _ = img.shape
+  x1 = max(x1 - padding, 0)
+  y1 = max(y1 - padding, 0)
+  x2 = min(x2 + padding, w)
+  y2 = min(y2 + padding, h)
+  return img[y1:y2, x1:x2]
+
+
+def padded_region(box, frame_shape, padding, min_size):
+  """
+  Expands a bounding box by `padding` times its larger side in every direction, to at least `min_size` per side,
+  clipped to the frame.
+
+  Parameters:
+    box (array-like): Bounding box (x1, y1, x2, y2).
+    frame_shape (tuple): Shape of the frame the box is in.
+    padding (float): Padding on every side, relative to the larger side of the box.
+    min_size (int): Minimum width and height of the region (unless the frame is smaller).
+
+  Returns:
+    tuple: Region (x1, y1, x2, y2) as integers.
+  """
+  h, w = frame_shape[:2]
+  x1, y1, x2, y2 = box
+  cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+  size = max(x2 - x1, y2 - y1)
+  half = max(size / 2 + size * padding, min_size / 2)
+
+  return (
+    int(max(cx - half, 0)),
+    int(max(cy - half, 0)),
+    int(min(cx + half, w)),
+    int(min(cy + half, h)),
+  )
+
+
+def merge_regions(regions):
+  """
+  Merges overlapping regions into their bounding rectangles until no two regions overlap.
+
+  Parameters:
+    regions (list of tuple): Regions (x1, y1, x2, y2).
+
+  Returns:
+    list of tuple: Non-overlapping regions covering all input regions.
+  """
+  merged = list(regions)
+  changed = True
+  while changed:
+    changed = False
+    for i in range(len(merged)):
+      for j in range(i + 1, len(merged)):
+        a, b = merged[i], merged[j]
+        if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+          merged[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+          del merged[j]
+          changed = True
+          break
+      if changed:
+        break
+
+  return merged
@@ -0,0 +1,206 @@
+# shared/keyframes.py
+import threading
+import cv2 as cv
+import numpy as np
+
+# Frames are downscaled to at most this width for optical flow
+FLOW_MAX_WIDTH = 640
+# Corners tracked per box
+FLOW_POINTS_PER_BOX = 20
+# Minimum tracked corners of a box to move it, boxes with fewer keep their position
+FLOW_MIN_POINTS = 3
+LK_PARAMS = dict(
+  winSize=(21, 21),
+  maxLevel=3,
+  criteria=(cv.TERM_CRITERIA_EPS | cv.TERM_CRITERIA_COUNT, 30, 0.01),
+)
+
+
+class KeyframeState:
+  """
+  What a camera's last keyframe found, carried forward to the frames in between.
+
+  Attributes:
+    gray (numpy.ndarray): Downscaled grayscale version of the last frame boxes were propagated to.
+    scale (float): Factor from frame to `gray` coordinates.
+    detections (numpy.ndarray): Detections of the last frame, see DETECTION_COLUMNS.
+    incompliant (numpy.ndarray): Incompliance mask of the last keyframe.
+    keypoints (numpy.ndarray): Pose keypoints of the last frame, None if pose estimation did not run on the keyframe.
+    frames (int): Frames propagated since the keyframe.
+  """
+  __slots__ = ("gray", "scale", "detections", "incompliant", "keypoints", "frames")
+
+  def __init__(self, gray, scale, detections, incompliant, keypoints):
+    self.gray = gray
+    self.scale = scale
+    self.detections = detections
+    self.incompliant = incompliant
+    self.keypoints = keypoints
+    self.frames = 0
+
+
+def to_flow_gray(frame):
+  """
+  Returns the downscaled grayscale frame optical flow runs on and the factor it was scaled by.
+  """
+  scale = min(1.0, FLOW_MAX_WIDTH / frame.shape[1])
+  if scale < 1.0:
+    frame = cv.resize(frame, None, fx=scale, fy=scale, interpolation=cv.INTER_AREA)
+  return cv.cvtColor(frame, cv.COLOR_BGR2GRAY), scale
+
+
+class KeyframePropagator:
+  """
+  Runs full detection on every k-th frame of a camera (keyframes) only, and carries the keyframe's detections and pose
+  keypoints across the frames in between with sparse (Lucas-Kanade) optical flow.
+
+  Association only needs a few hits per person within `REQUIRED_DURATION`, so detecting at a fraction of the camera's
+  frame rate is enough as long as every frame still reports where the incompliant objects and persons are. Boxes are
+  moved by the median flow of corners found inside them, keypoints are tracked directly. Verdicts (incompliant or not)
+  are the keyframe's, objects that got flagged in the meantime are no longer reported as incompliant.
+
+  Attributes:
+    default_interval (int): Keyframe interval of cameras without an override, 1 runs detection on every frame.
+    camera_intervals (dict): Per camera keyframe interval overrides.
+      Format: {
+        camera_id: interval (int)
+      }
+    states (dict): Last keyframe of each camera.
+      Format: {
+        camera_id: KeyframeState
+      }
+    keyframes (int): Number of keyframes run through detection.
+    propagated (int): Number of frames whose detections were propagated.
+  """
+
+  def __init__(self, default_interval=1, camera_intervals=None):
+    """
+    Initializes the KeyframePropagator.
+
+    Parameters:
+      default_interval (int, optional): Keyframe interval of cameras without an override. Defaults to 1.
+      camera_intervals (dict, optional): Per camera keyframe interval overrides. Defaults to None.
+    """
+    self.default_interval = max(1, default_interval)
+    self.camera_intervals = camera_intervals or {}
+    self.states = {}
+    self.keyframes = 0
+    self.propagated = 0
+    self.lock = threading.Lock()
+
+  def interval(self, camera_id):
+    """
+    Returns the keyframe interval of a camera.
+    """
+    return max(1, self.camera_intervals.get(camera_id, self.default_interval))
+
+  def is_keyframe(self, camera_id):
+    """
+    Returns True if the next frame of a camera has to run through detection.
+    """
+    state = self.states.get(camera_id)
+    return state is None or state.frames + 1 >= self.interval(camera_id)
+
+  def update(self, camera_id, frame, result):
+    """
+    Stores the detections of a keyframe to propagate them to the following frames.
+
+    Parameters:
+      camera_id (int): The camera the keyframe belongs to.
+      frame (numpy.ndarray): The keyframe.
+      result (FrameDetections): Detections of the keyframe.
+    """
+    with self.lock:
+      self.keyframes += 1
+
+    if self.interval(camera_id) == 1:
+      return
+
+    gray, scale = to_flow_gray(frame)
+    self.states[camera_id] = KeyframeState(gray, scale, result.detections, result.incompliant, result.keypoints)
+
+  def propagate(self, camera_id, frame, flagged):
+    """
+    Moves the detections and keypoints of a camera's last frame to a new frame.
+
+    Parameters:
+      camera_id (int): The camera the frame belongs to.
+      frame (numpy.ndarray): The new frame.
+      flagged (set): Track IDs of the camera that are already flagged.
+
+    Returns:
+      tuple: (detections, incompliance mask, keypoints or None), in the layout of FrameDetections.
+    """
+    state = self.states[camera_id]
+    gray, scale = to_flow_gray(frame)
+
+    detections = state.detections.copy()
+    keypoints = state.keypoints.copy() if state.keypoints is not None else None
+
+    # Corners inside every box, followed by the visible keypoints, all tracked in one optical flow call
+    points, owners = [], []
+    height, width = state.gray.shape
+    for index, box in enumerate(detections[:, 3:7] * state.scale):
+      x1, y1 = np.clip(box[:2].astype(int), 0, [width, height])
+      x2, y2 = np.clip(np.ceil(box[2:]).astype(int), 0, [width, height])
+      if x2 - x1 < 2 or y2 - y1 < 2:
+        continue
+      corners = cv.goodFeaturesToTrack(state.gray[y1:y2, x1:x2], FLOW_POINTS_PER_BOX, 0.01, 3)
+      if corners is not None:
+        points.append(corners.reshape(-1, 2) + (x1, y1))
+        owners += [index] * len(corners)
+
+    visible = None
+    if keypoints is not None:
+      # Keypoints the pose model could not locate are (0, 0) and stay that way
+      visible = (keypoints > 0).all(axis=2)
+      points.append(keypoints[visible] * state.scale)
+
+    if points:
+      old = np.concatenate(points).astype(np.float32).reshape(-1, 1, 2)
+      new, status, _ = cv.calcOpticalFlowPyrLK(state.gray, gray, old, None, **LK_PARAMS)
+      tracked = status.ravel() == 1
+      old, new = old.reshape(-1, 2), new.reshape(-1, 2)
+
+      owners = np.array(owners, dtype=int)
+      for index in np.unique(owners):
+        mask = tracked[:len(owners)] & (owners == index)
+        if mask.sum() >= FLOW_MIN_POINTS:
+          dx, dy = np.median(new[:len(owners)][mask] - old[:len(owners)][mask], axis=0) / state.scale
+          detections[index, 3:7] += (dx, dy, dx, dy)
+
+      if keypoints is not None:
+        moved = np.where(tracked[len(owners):, None], new[len(owners):], old[len(owners):])
+        keypoints[visible] = moved / state.scale
+
+    frame_height, frame_width = frame.shape[:2]
+    detections[:, [3, 5]] = detections[:, [3, 5]].clip(0, frame_width - 1)
+    detections[:, [4, 6]] = detections[:, [4, 6]].clip(0, frame_height - 1)
+
+    incompliant = state.incompliant & ~np.isin(detections[:, 0].astype(int), list(flagged))
+
+    state.gray, state.scale = gray, scale
+    state.detections, state.keypoints = detections, keypoints
+    state.frames += 1
+    with self.lock:
+      self.propagated += 1
+
+    return detections, incompliant, keypoints
+
+  def drop_camera(self, camera_id):
+    """
+    Forgets a camera's last keyframe, e.g. after it was moved to another worker or removed.
+    """
+    self.states.pop(camera_id, None)
+
+  def get_stats(self):
+    """
+    Returns the number of keyframes, propagated frames and the fraction of frames that ran through detection.
+    """
+    with self.lock:
+      total = self.keyframes + self.propagated
+      return {
+        "keyframes": self.keyframes,
+        "propagated": self.propagated,
+        "keyframe_rate": self.keyframes / total if total else 0.0,
+      }
@@ -0,0 +1,92 @@
+# shared/metrics.py
+import threading
+from collections import deque
+import numpy as np
+
+
+class StageMetrics:
+  """
+  Thread-safe collector of per-stage latencies of the detection pipeline.
+
+  Every pipeline thread records how long a frame spent in a stage (e.g. "detect", "pose", "association").
+  Only the most recent `max_samples` latencies per stage are kept for the percentiles, counts are kept in total.
+
+  Attributes:
+    max_samples (int): Number of latest samples kept per stage.
+    samples (dict): Latest latencies in seconds per stage.
+      Format: {
+        stage: deque([seconds, ...])
+      }
+    counts (dict): Total number of samples recorded per stage.
+  """
+
+  def __init__(self, max_samples=10000):
+    """
+    Initializes an empty StageMetrics collector.
+
+    Parameters:
+      max_samples (int, optional): Number of latest samples kept per stage. Defaults to 10000.
+    """
+    self.max_samples = max_samples
+    self.samples = {}
+    self.counts = {}
+    self.lock = threading.Lock()
+
+  def record(self, stage, seconds):
+    """
+    Records the latency of one frame in a stage.
+
+    Parameters:
+      stage (str): Name of the pipeline stage.
+      seconds (float): Time the frame spent in the stage.
+    """
+    with self.lock:
+      if stage not in self.samples:
+        self.samples[stage] = deque(maxlen=self.max_samples)
+        self.counts[stage] = 0
+      self.samples[stage].append(seconds)
+      self.counts[stage] += 1
+
+  def count(self, stage):
+    """
+    Returns the total number of samples recorded for a stage.
+    """
+    with self.lock:
+      return self.counts.get(stage, 0)
+
+  def summary(self):
+    """
+    Summarizes the recorded latencies of every stage.
+
+    Returns:
+      dict: Sample count, mean, p50, p95 and p99 latency (in milliseconds) per stage.
+    """
+    with self.lock:
+      samples = {stage: np.array(values) * 1000 for stage, values in self.samples.items()}
+      counts = dict(self.counts)
+
+    result = {}
+    for stage, values in samples.items():
+      if values.size == 0:
+        continue
+      p50, p95, p99 = np.percentile(values, [50, 95, 99])
+      result[stage] = {
+        "count": counts[stage],
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+      }
+    return result
+
+  def reset(self):
+    """
+    Discards all recorded samples.
+    """
+    with self.lock:
+      self.samples.clear()
+      self.counts.clear()
+
+
+# Shared by all pipeline threads of the process
+stage_metrics = StageMetrics()
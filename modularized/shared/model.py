@@ -1,33 +1,311 @@
 # shared/model.py
-import os, torch
+import os, threading, torch
+import cv2 as cv
+import numpy as np
 from ultralytics import YOLO
+from ultralytics.engine.results import Boxes
+from ultralytics.trackers.basetrack import BaseTrack
+from ultralytics.trackers.track import TRACKER_MAP
+from ultralytics.utils import YAML, IterableSimpleNamespace
+from ultralytics.utils.checks import check_yaml
+from shared.config import (
+  CASCADE_SCREENER_MODEL,
+  MODEL_BACKEND,
+  MODEL_INTRA_OP_THREADS,
+  MODEL_PRECISION,
+  MODEL_CALIBRATION_DIR,
+  MODEL_CALIBRATION_FRAMES,
+)
+
+MODELS_DIR = "yolo_models"
+# Model files loaded by the DetectionPipeline and their tasks, exported up front by `export_models`
+PIPELINE_MODELS = {"yolo11x.pt": "detect", "yolov8n-pose.pt": "pose", "yolov8n-cls.pt": "classify"}
+MODEL_BACKENDS = ["pytorch", "onnx", "openvino"]
+MODEL_PRECISIONS = ["fp32", "int8"]
+# COCO class IDs of food and drinks, see `https://docs.ultralytics.com/datasets/detect/coco/#dataset-yaml`
+FOOD_DRINK_CLASSES = [39, 40, 41, 46, 47, 48, 49, 50, 51, 52, 53, 54, 55]
+# Minimum confidence of a food/ drink detection
+DETECTION_CONFIDENCE = 0.7
+
+# COCO keypoints kept by `PoseDetectionModel.parse_keypoints`, in this order
+POSE_KEYPOINTS = [0, 1, 2, 3, 4, 9, 10]
+# Indices of the kept keypoints in the parsed (persons, 7, 2) array
+NOSE, LEFT_EYE, RIGHT_EYE, LEFT_EAR, RIGHT_EAR, LEFT_WRIST, RIGHT_WRIST = range(len(POSE_KEYPOINTS))
+
+# Serializes exports of models loaded by several workers of the same process at once
+_export_lock = threading.Lock()
+
+# Ultralytics numbers the tracks of all trackers from one global counter (BaseTrack._count) and resets it whenever a
+# tracker is created. Each camera keeps its own counter instead, swapped in for every tracker call (see CameraTracker).
+# Counters outlive the camera's trackers, so a tracker created again (e.g. after the camera moved to another worker of
+# this process) never hands out a track ID the camera already used.
+_track_id_lock = threading.Lock()
+_track_id_counters = {} # Format: {camera_id: last track ID counter value}
+
+
+def exported_model_path(model_path, backend):
+  """
+  Returns where the export of a .pt model for a backend is cached, next to the .pt file.
+
+  Parameters:
+    model_path (str): Path of the .pt model.
+    backend (str): "onnx" or "openvino".
+
+  Returns:
+    str: Path of the .onnx file or the OpenVINO IR directory.
+  """
+  stem = os.path.splitext(model_path)[0]
+  return f"{stem}.onnx" if backend == "onnx" else f"{stem}_openvino_model"
+
+
+def is_cached(path, source_path):
+  """
+  Returns True if a derived model file exists and is newer than the file it was derived from.
+  """
+  return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source_path)
+
+
+def export_model(model_path, backend, precision="fp32", task=None):
+  """
+  Exports a .pt model for a backend, unless an export newer than the .pt file is cached already.
+
+  Models are exported with dynamic input shapes, so batched detection (several cameras) and classification (several crops)
+  keep working with any batch size. For INT8 the FP32 .onnx export is then quantized (see `shared/quantization.py`),
+  calibrated on images from MODEL_CALIBRATION_DIR.
+
+  Parameters:
+    model_path (str): Path of the .pt model.
+    backend (str): "onnx" or "openvino".
+    precision (str, optional): "fp32" or "int8" (onnx only). Defaults to "fp32".
+    task (str, optional): Ultralytics task of the model, needed to preprocess the calibration frames for INT8.
+
+  Returns:
+    str: Path of the exported model.
+  """
+  export_path = exported_model_path(model_path, backend)
+
+  with _export_lock:
+    if not is_cached(export_path, model_path):
+      print(f"[INFO] Exporting {model_path} to {backend}, this only happens once per model.")
+      export_path = YOLO(model_path).export(format=backend, dynamic=True, verbose=False)
+
+    if precision == "fp32":
+      return export_path
+
+    from shared.quantization import quantized_model_path, find_calibration_frames, quantize_model
+
+    quantized_path = quantized_model_path(export_path)
+    if is_cached(quantized_path, export_path):
+      return quantized_path
+
+    frames = find_calibration_frames(MODEL_CALIBRATION_DIR, MODEL_CALIBRATION_FRAMES)
+    print(f"[INFO] Quantizing {export_path} to INT8 with {len(frames)} calibration frames, this only happens once per model.")
+    return quantize_model(export_path, task, frames)
+
+
+def export_models(backend=MODEL_BACKEND, precision=MODEL_PRECISION):
+  """
+  Exports all DetectionPipeline models for a backend, before the workers (threads or processes) load them concurrently.
+
+  Parameters:
+    backend (str, optional): Inference backend, nothing is exported for "pytorch". Defaults to MODEL_BACKEND.
+    precision (str, optional): "fp32" or "int8". Defaults to MODEL_PRECISION.
+  """
+  if backend == "pytorch":
+    return
+
+  models = dict(PIPELINE_MODELS)
+  if CASCADE_SCREENER_MODEL:
+    models[CASCADE_SCREENER_MODEL] = "detect"
+
+  for model, task in models.items():
+    export_model(os.path.join(MODELS_DIR, model), backend, precision, task)
+
 
 class BaseModel:
   """
   Base class for all model types.
+
+  Models are always given as .pt files. With MODEL_BACKEND "onnx" or "openvino" the model is exported once
+  (see `export_model`) and run with ONNX Runtime/ OpenVINO instead of PyTorch, which is a lot faster on CPU-only nodes.
+  Ultralytics loads the exported models with the same predict API and results, so subclasses do not depend on the backend.
+  With MODEL_PRECISION "int8" the ONNX export is additionally quantized to INT8.
+
+  Attributes:
+    task (str): Ultralytics task of the model, exported models don't always carry it in their metadata.
+    backend (str): Inference backend, one of MODEL_BACKENDS.
+    precision (str): Model precision, one of MODEL_PRECISIONS.
+    model_path (str): Path of the loaded model (.pt, .onnx or OpenVINO IR directory).
+    intra_op_threads (int): Threads the ONNX Runtime/ OpenVINO runtime may use per inference call, 0 for the runtime's default.
   """
-  def __init__(self, model):
+  task = None
+
+  def __init__(self, model, backend=MODEL_BACKEND, intra_op_threads=MODEL_INTRA_OP_THREADS, precision=MODEL_PRECISION):
     """
     Initializes the BaseModel with the given model name.
     
     Parameters:
       model (str): Name of the YOLO model file (.pt) to load.
+      backend (str, optional): Inference backend, one of MODEL_BACKENDS. Defaults to MODEL_BACKEND.
+      intra_op_threads (int, optional): Threads per inference call for exported backends, 0 for the default. Defaults to MODEL_INTRA_OP_THREADS.
+      precision (str, optional): Model precision, one of MODEL_PRECISIONS. Defaults to MODEL_PRECISION.
+
+    Raises:
+      ValueError: If the backend or precision is unknown, or INT8 is requested for a backend other than onnx.
+    """
+    if backend not in MODEL_BACKENDS:
+      raise ValueError(f"Unknown model backend '{backend}', expected one of {MODEL_BACKENDS}")
+    if precision not in MODEL_PRECISIONS:
+      raise ValueError(f"Unknown model precision '{precision}', expected one of {MODEL_PRECISIONS}")
+    if precision == "int8" and backend != "onnx":
+      raise ValueError(f"INT8 models are only supported with the onnx backend, not '{backend}'")
+
+    self.backend = backend
+    self.precision = precision
+    self.intra_op_threads = intra_op_threads
+
+    model_path = os.path.join(MODELS_DIR, model)
+    if backend != "pytorch":
+      model_path = export_model(model_path, backend, precision, self.task)
+
+    self.model_path = model_path
+    self.model = YOLO(model_path, task=self.task)
+    if backend != "pytorch" and intra_op_threads > 0:
+      self.model.add_callback("on_predict_start", self._configure_runtime)
+
+  def _configure_runtime(self, predictor):
+    """
+    Recreates the ONNX Runtime session/ recompiles the OpenVINO model with `intra_op_threads`.  
+    Ultralytics creates both without thread settings when the predictor is set up on the first predict call,
+    this callback runs right after that and only reconfigures the runtime once.
+
+    Parameters:
+      predictor (BasePredictor): The model's predictor.
+    """
+    backend = predictor.model
+    if getattr(backend, "runtime_configured", False):
+      return
+
+    if backend.onnx:
+      import onnxruntime
+
+      options = onnxruntime.SessionOptions()
+      options.intra_op_num_threads = self.intra_op_threads
+      # Only one request runs at a time per model, extra inter-op threads only compete with the other workers
+      options.inter_op_num_threads = 1
+      backend.session = onnxruntime.InferenceSession(
+        self.model_path, options, providers=backend.session.get_providers()
+      )
+
+    elif backend.xml:
+      import openvino as ov
+
+      core = ov.Core()
+      xml = next(f for f in os.listdir(self.model_path) if f.endswith(".xml"))
+      ov_model = core.read_model(os.path.join(self.model_path, xml))
+      backend.ov_compiled_model = core.compile_model(
+        ov_model,
+        device_name="CPU",
+        config={"PERFORMANCE_HINT": backend.inference_mode, "INFERENCE_NUM_THREADS": self.intra_op_threads},
+      )
+
+    backend.runtime_configured = True
+
+class CameraTracker:
+  """
+  ByteTrack/ BoT-SORT tracker of a single camera, numbering its tracks from the camera's own track ID counter.
+
+  The global Ultralytics counter is never reset while other cameras are tracked: it is saved and restored around the
+  tracker's creation, and the camera's counter is swapped in for each update.
+  Worker processes each keep their own counters, so their track IDs are interleaved (`id_offset`, `id_stride`) to stay
+  unique when a camera is moved from one worker process to another.
+
+  Attributes:
+    camera_id (int): The camera the tracker belongs to.
+    tracker (BYTETracker or BOTSORT): The Ultralytics tracker.
+    id_offset (int): Offset of this process's track IDs.
+    id_stride (int): Number of processes sharing the track ID space of a camera.
+  """
+
+  def __init__(self, camera_id, args, frame_rate=30, id_offset=0, id_stride=1):
+    """
+    Creates the tracker without touching the track IDs of other cameras.
+
+    Parameters:
+      camera_id (int): The camera the tracker belongs to.
+      args (IterableSimpleNamespace): Ultralytics tracker config, its `tracker_type` selects ByteTrack or BoT-SORT.
+      frame_rate (int, optional): Rate of the frames the tracker is updated with. Defaults to 30.
+      id_offset (int, optional): Offset of this process's track IDs. Defaults to 0.
+      id_stride (int, optional): Number of processes sharing the track ID space of a camera. Defaults to 1.
+    """
+    self.camera_id = camera_id
+    self.id_offset = id_offset
+    self.id_stride = max(1, id_stride)
+
+    with _track_id_lock:
+      count = BaseTrack._count
+      try:
+        self.tracker = TRACKER_MAP[args.tracker_type](args=args, frame_rate=frame_rate)
+      finally:
+        BaseTrack._count = count
+
+  @property
+  def tracked_stracks(self):
+    return self.tracker.tracked_stracks
+
+  def update(self, results, img=None):
     """
-    self.model = YOLO(os.path.join("yolo_models", model))
+    Updates the tracker with the detections of a frame, see `BYTETracker.update`.
+
+    Returns:
+      numpy.ndarray: Tracks of the frame (x1, y1, x2, y2, track_id, score, cls, idx) with this camera's track IDs.
+    """
+    with _track_id_lock:
+      count = BaseTrack._count
+      BaseTrack._count = _track_id_counters.get(self.camera_id, 0)
+      try:
+        tracks = self.tracker.update(results, img)
+      finally:
+        _track_id_counters[self.camera_id] = BaseTrack._count
+        BaseTrack._count = count
+
+    if len(tracks) and self.id_stride > 1:
+      tracks[:, 4] = (tracks[:, 4] - 1) * self.id_stride + self.id_offset + 1
+    return tracks
 
 class ObjectDetectionModel(BaseModel):
-  def __init__(self, model, gpu_device=None):
+  task = "detect"
+
+  def __init__(self, model, gpu_device=None, tracker="botsort.yaml"):
     """
     Initializes the ObjectDetectionModel.
 
     Parameters:
       model (str): Model file name (.pt) to load from 'yolo_models' directory.
-      gpu_device (int, optional): Index of the GPU to use. If None, uses CPU.
+      gpu_device (int, optional): Index of the GPU to use. If None or no CUDA device is available, uses CPU.
+      tracker (str, optional): Ultralytics tracker config used for every tracker created by `create_tracker`.
     """
     super().__init__(model)
     self.gpu_device = gpu_device
+    self.tracker_cfg = IterableSimpleNamespace(**YAML.load(check_yaml(tracker)))
 
-  def detect(self, frame):
+  def create_tracker(self, camera_id, frame_rate=30, id_offset=0, id_stride=1):
+    """
+    Creates a new ByteTrack/ BoT-SORT tracker with its own state.  
+    One tracker is kept per camera so frames of different cameras sharing this model do not corrupt each other's tracks.
+
+    Parameters:
+      camera_id (int): The camera the tracker belongs to, its tracks continue the camera's track IDs.
+      frame_rate (int, optional): Rate of the frames the tracker is updated with, lost tracks are kept for `track_buffer` frames at 30 FPS. Defaults to 30.
+      id_offset (int, optional): Offset of this process's track IDs, see CameraTracker. Defaults to 0.
+      id_stride (int, optional): Number of processes sharing the track ID space of a camera. Defaults to 1.
+
+    Returns:
+      CameraTracker: A fresh tracker instance.
+    """
+    return CameraTracker(camera_id, self.tracker_cfg, frame_rate, id_offset, id_stride)
+
+  def detect(self, frame, tracker):
     """
     Runs object detection on a given frame to find any food or drinks only.  
     Any other detected objects of other classes will not be returned.  
@@ -35,26 +313,102 @@ class ObjectDetectionModel(BaseModel):
 
     Parameters:
       frame (numpy.ndarray): Input frame for detection.
+      tracker (CameraTracker): Tracker of the camera the frame belongs to, see `create_tracker`.
 
     Returns:
       Boxes: Detected bounding boxes of target classes.
     """
-    device_str = f"cuda:{self.gpu_device}" if self.gpu_device is not None else "cpu"
-    result = self.model.track(
-      frame,
-      persist=True, # Enable to track objects across frames.
-      classes=[39, 40, 41, 46, 47, 48, 49, 50, 51, 52, 53, 54, 55],
-      conf=0.7,
+    return self.detect_batch([frame], [tracker])[0]
+
+  def detect_batch(self, frames, trackers):
+    """
+    Runs object detection on frames from different cameras in a single batched inference call.  
+    Each frame's detections are then tracked with the tracker of its own camera.
+
+    Parameters:
+      frames (list of numpy.ndarray): Input frames for detection.
+      trackers (list): Tracker of the camera each frame belongs to, in the same order as `frames`.
+
+    Returns:
+      list of Boxes: Detected bounding boxes of target classes, one entry per frame.
+    """
+    use_gpu = self.gpu_device is not None and torch.cuda.is_available()
+    device_str = f"cuda:{self.gpu_device}" if use_gpu else "cpu"
+    results = self.model.predict(
+      frames,
+      classes=FOOD_DRINK_CLASSES,
+      conf=DETECTION_CONFIDENCE,
       verbose=False,
       device=torch.device(device_str)
     )
-    drink_boxes = result[0].boxes
-    return drink_boxes
+    return [self._update_tracker(result, tracker) for result, tracker in zip(results, trackers)]
+
+  def screen_batch(self, frames, conf):
+    """
+    Runs untracked object detection on frames to find food or drink candidates only, e.g. as the screener of a DetectionCascade.
+
+    Parameters:
+      frames (list of numpy.ndarray): Input frames for detection.
+      conf (float): Minimum confidence of a candidate.
+
+    Returns:
+      list of int: Number of candidates found in each frame.
+    """
+    use_gpu = self.gpu_device is not None and torch.cuda.is_available()
+    device_str = f"cuda:{self.gpu_device}" if use_gpu else "cpu"
+    results = self.model.predict(
+      frames,
+      classes=FOOD_DRINK_CLASSES,
+      conf=conf,
+      verbose=False,
+      device=torch.device(device_str)
+    )
+    return [len(result.boxes) for result in results]
+
+  def skip_frame(self, frame, tracker):
+    """
+    Advances a camera's tracker by a frame object detection did not run on, as if nothing was detected in it.  
+    Tracks are aged and expire just like with real empty detections, so track IDs stay consistent when detection resumes.
+
+    Parameters:
+      frame (numpy.ndarray): The frame that was not run through object detection.
+      tracker (CameraTracker): Tracker of the camera the frame belongs to.
+
+    Returns:
+      Boxes: Empty boxes for the frame.
+    """
+    boxes = Boxes(np.zeros((0, 6), dtype=np.float32), frame.shape[:2])
+    tracker.update(boxes, frame)
+    return boxes
+
+  def _update_tracker(self, result, tracker):
+    """
+    Updates a camera's tracker with the detections of a frame and assigns track IDs to the boxes.  
+    Mirrors what Ultralytics does in `model.track(..., persist=True)`, but with a tracker passed in by the caller.
+
+    Parameters:
+      result (Results): Detection result of a single frame.
+      tracker (CameraTracker): Tracker of the camera the frame belongs to.
+
+    Returns:
+      Boxes: Tracked bounding boxes (boxes without a matched track are returned without IDs).
+    """
+    det = result.boxes.cpu().numpy()
+    tracks = tracker.update(det, result.orig_img)
+    if len(tracks) == 0:
+      return result.boxes
+
+    idx = tracks[:, -1].astype(int)
+    result = result[idx]
+    result.update(boxes=torch.as_tensor(tracks[:, :-1]))
+    return result.boxes
 
 class PoseDetectionModel(BaseModel):
   """
   YOLO pose detection model for estimating keypoints on human figures.
   """
+  task = "pose"
+
   def __init__(self, model, conf_threshold, iou):
     """
     Initializes the PoseDetectionModel.
@@ -83,40 +437,64 @@ class PoseDetectionModel(BaseModel):
     keypoints = pose_results.keypoints.xy if pose_results.keypoints else None
 
     return keypoints
+
+  def predict_regions(self, frame, regions, max_imgsz=640):
+    """
+    Performs pose prediction on regions of a frame (e.g. around incompliant objects) in one batched inference call.
+
+    The input size is the larger side of the largest region (rounded up to the model's stride, at most `max_imgsz`),
+    so regions are not upscaled and the model only processes about as many pixels as the regions cover.
+
+    Parameters:
+      frame (numpy.ndarray): Input image for pose detection.
+      regions (list of tuple): Regions (x1, y1, x2, y2) to run pose detection on.
+      max_imgsz (int, optional): Maximum input size of the model. Defaults to 640.
+
+    Returns:
+      None or numpy.ndarray: Keypoints for each detected person in frame coordinates, shape (persons, 17, 2), or None if none found.
+    """
+    crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in regions]
+    largest = max(max(crop.shape[:2]) for crop in crops)
+    imgsz = min(max_imgsz, -(-largest // 32) * 32)
+
+    results = self.model.predict(crops, conf=self.conf_threshold, iou=self.iou, imgsz=imgsz, verbose=False)
+
+    keypoints = []
+    for (x1, y1, _, _), result in zip(regions, results):
+      if result.keypoints:
+        keypoints.append(result.keypoints.xy.cpu().numpy() + np.array([x1, y1], dtype=np.float32))
+
+    return np.concatenate(keypoints) if keypoints else None
   
-  def parse_keypoints(self, keypoints):
+  @staticmethod
+  def parse_keypoints(keypoints):
     """
-    Parses raw keypoints into a dictionary of named landmarks for each person.
+    Extracts the keypoints used by association (nose, eyes, ears, wrists) of every person at once.  
+    Index the result with the NOSE, LEFT_EYE, RIGHT_EYE, LEFT_EAR, RIGHT_EAR, LEFT_WRIST and RIGHT_WRIST constants.
 
     Parameters:
-      keypoints (torch.Tensor): Keypoints from the pose model.
+      keypoints (torch.Tensor or numpy.ndarray): Keypoints from the pose model, shape (persons, 17, 2), or None.
 
     Returns:
-      list of dict: Each dict contains named keypoint positions (e.g., nose, wrists, eyes).
+      numpy.ndarray: float32 array of shape (persons, 7, 2), empty if there are no keypoints.
     """
-    results = []
-    for person in keypoints:
-      try:
-        person_lm = person.cpu().numpy()
-        landmarks = {
-          "nose": person_lm[0],
-          "left_wrist": person_lm[9],
-          "right_wrist": person_lm[10],
-          "left_ear": person_lm[3],
-          "right_ear": person_lm[4],
-          "left_eye": person_lm[1],
-          "right_eye": person_lm[2],
-        }
-        results.append(landmarks)
-      except Exception:
-        continue
-      
-    return results
+    if keypoints is None:
+      return np.zeros((0, len(POSE_KEYPOINTS), 2), dtype=np.float32)
+
+    if isinstance(keypoints, torch.Tensor):
+      # Select on the device, then a single transfer of the whole selection to the host
+      keypoints = keypoints[:, POSE_KEYPOINTS, :2].cpu().numpy()
+    else:
+      keypoints = np.asarray(keypoints)[:, POSE_KEYPOINTS, :2]
+
+    return np.ascontiguousarray(keypoints, dtype=np.float32)
 
 class ImageClassificationModel(BaseModel):
   """
   YOLO image classification model.
   """
+  task = "classify"
+
   def __init__(self, model):
     super().__init__(model)
 
@@ -135,3 +513,42 @@ class ImageClassificationModel(BaseModel):
     label = pred.names[pred.probs.top1]
 
     return label
+
+  def classify_batch(self, crops):
+    """
+    Classifies multiple images (e.g. every object crop of a frame) in one batched inference call.
+
+    Crops are resized to the model's input size beforehand (shorter side scaled to the input size, then center cropped,
+    same as the model's own preprocessing) so that crops of different sizes can be stacked into one batch.
+
+    Parameters:
+      crops (list of numpy.ndarray): Input images for classification.
+
+    Returns:
+      list of str: The name of the predicted class label for each crop, in the same order as `crops`.
+    """
+    if not crops:
+      return []
+
+    results = self.model([self._resize_to_input(crop) for crop in crops], verbose=False)
+    return [pred.names[pred.probs.top1] for pred in results]
+
+  def _resize_to_input(self, crop):
+    """
+    Resizes an image to the square input size of the model, keeping its aspect ratio by center cropping.
+
+    Parameters:
+      crop (numpy.ndarray): Input image.
+
+    Returns:
+      numpy.ndarray: Image of shape (imgsz, imgsz, channels).
+    """
+    imgsz = self.model.overrides.get("imgsz") or 224
+    h, w = crop.shape[:2]
+    scale = imgsz / min(h, w)
+    new_w, new_h = max(round(w * scale), imgsz), max(round(h * scale), imgsz)
+    resized = cv.resize(crop, (new_w, new_h), interpolation=cv.INTER_LINEAR)
+
+    top = (new_h - imgsz) // 2
+    left = (new_w - imgsz) // 2
+    return resized[top:top + imgsz, left:left + imgsz]
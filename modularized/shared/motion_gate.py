@@ -0,0 +1,111 @@
+# shared/motion_gate.py
+import time
+import cv2 as cv
+import numpy as np
+
+
+class MotionGate:
+  """
+  Cheap per-camera motion gate in front of object detection.
+
+  Each frame is downscaled to a small grayscale image and compared with the previous one. The motion score is the
+  fraction of pixels that changed by more than `pixel_threshold`. Frames are sent to detection while the score is above
+  `threshold` (and for `hold_time` seconds after motion stops, so tracks and the association hit count can settle).
+  While the scene is static only one keyframe every `keyframe_interval` seconds is sent.
+
+  Attributes:
+    threshold (float): Minimum fraction of changed pixels for a frame to count as motion.
+    pixel_threshold (int): Minimum grayscale difference for a pixel to count as changed.
+    keyframe_interval (float): Seconds between forced keyframes while the scene is static.
+    hold_time (float): Seconds frames keep being sent after the last motion.
+    width (int): Width in pixels the frame is downscaled to before scoring.
+    frames_seen (int): Number of frames passed through the gate.
+    frames_skipped (int): Number of frames that were not sent to detection.
+  """
+
+  def __init__(self, threshold=0.01, pixel_threshold=25, keyframe_interval=0.5, hold_time=2.0, width=160):
+    """
+    Initializes the MotionGate.
+
+    Parameters:
+      threshold (float, optional): Minimum fraction of changed pixels to count as motion. Defaults to 0.01.
+      pixel_threshold (int, optional): Minimum grayscale difference for a changed pixel. Defaults to 25.
+      keyframe_interval (float, optional): Seconds between keyframes while static. Defaults to 0.5.
+      hold_time (float, optional): Seconds frames keep being sent after the last motion. Defaults to 2.
+      width (int, optional): Width of the downscaled frame used for scoring. Defaults to 160.
+    """
+    self.threshold = threshold
+    self.pixel_threshold = pixel_threshold
+    self.keyframe_interval = keyframe_interval
+    self.hold_time = hold_time
+    self.width = width
+
+    self.previous = None
+    self.active_until = 0.0
+    self.last_sent = 0.0
+
+    self.frames_seen = 0
+    self.frames_skipped = 0
+
+  def score(self, frame):
+    """
+    Computes the motion score of a frame against the previous frame.
+
+    Parameters:
+      frame (numpy.ndarray): Full resolution BGR frame.
+
+    Returns:
+      float: Fraction of changed pixels, 1.0 for the first frame.
+    """
+    h, w = frame.shape[:2]
+    small = cv.resize(frame, (self.width, max(int(h * self.width / w), 1)), interpolation=cv.INTER_AREA)
+    gray = cv.GaussianBlur(cv.cvtColor(small, cv.COLOR_BGR2GRAY), (5, 5), 0)
+
+    if self.previous is None or self.previous.shape != gray.shape:
+      motion = 1.0
+    else:
+      diff = cv.absdiff(gray, self.previous)
+      motion = np.count_nonzero(diff > self.pixel_threshold) / diff.size
+
+    self.previous = gray
+    return motion
+
+  def should_process(self, frame):
+    """
+    Decides whether a frame is sent to detection.
+
+    Parameters:
+      frame (numpy.ndarray): Full resolution BGR frame.
+
+    Returns:
+      bool: True if the frame has motion, follows recent motion or is a keyframe, False if it can be skipped.
+    """
+    self.frames_seen += 1
+    now = time.monotonic()
+
+    if self.score(frame) >= self.threshold:
+      self.active_until = now + self.hold_time
+
+    if now < self.active_until or now - self.last_sent >= self.keyframe_interval:
+      self.last_sent = now
+      return True
+
+    self.frames_skipped += 1
+    return False
+
+  def skip_rate(self):
+    """
+    Returns the fraction of frames that were skipped, 0 if no frames were seen yet.
+    """
+    return self.frames_skipped / self.frames_seen if self.frames_seen else 0.0
+
+  def get_stats(self):
+    """
+    Returns the gate's threshold and skip counters.
+    """
+    return {
+      "threshold": self.threshold,
+      "frames_seen": self.frames_seen,
+      "frames_skipped": self.frames_skipped,
+      "skip_rate": self.skip_rate(),
+    }
@@ -0,0 +1,100 @@
+# shared/proximity_history.py
+import threading
+from collections import deque
+
+
+class ProximityHistory:
+  """
+  Timestamps at which a person was found close to a tracked food/ drink, kept per track ID in a fixed size ring buffer.
+
+  Association only counts the timestamps within the last few seconds, so each track keeps at most `maxlen` of them.
+  Tracks whose last timestamp is older than `ttl` (the object left, or its track ended) are evicted by a sweep that runs
+  at most once every `ttl` seconds, so the history stays bounded no matter how many track IDs a camera goes through.
+
+  Attributes:
+    maxlen (int): Timestamps kept per track.
+    ttl (float): Seconds after a track's last timestamp until it is evicted.
+    tracks (dict): Ring buffer of timestamps per track, oldest first.
+      Format: {
+        track_id: deque([timestamp1, timestamp2, ...], maxlen=maxlen)
+      }
+    last_sweep (float): Timestamp of the last sweep, None before the first timestamp was recorded.
+    evicted (int): Number of tracks evicted so far.
+  """
+
+  def __init__(self, maxlen=8, ttl=30.0):
+    """
+    Initializes an empty ProximityHistory.
+
+    Parameters:
+      maxlen (int, optional): Timestamps kept per track. Defaults to 8.
+      ttl (float, optional): Seconds after a track's last timestamp until it is evicted. Defaults to 30.
+    """
+    self.maxlen = max(1, maxlen)
+    self.ttl = ttl
+    self.tracks = {}
+    self.last_sweep = None
+    self.evicted = 0
+    self.lock = threading.Lock()
+
+  def record(self, track_id, timestamp, window):
+    """
+    Adds a timestamp to a track and counts the track's timestamps within `window` seconds before it.
+
+    Parameters:
+      track_id (int): Track ID of the object.
+      timestamp (float): When the person was close to the object (monotonic clock, e.g. the frame's capture time).
+      window (float): Seconds to count timestamps in.
+
+    Returns:
+      int: Number of timestamps of the track within the window, including this one (at most `maxlen`).
+    """
+    with self.lock:
+      if self.last_sweep is None:
+        self.last_sweep = timestamp
+      elif timestamp - self.last_sweep >= self.ttl:
+        self._sweep(timestamp)
+
+      history = self.tracks.get(track_id)
+      if history is None:
+        history = self.tracks[track_id] = deque(maxlen=self.maxlen)
+      history.append(timestamp)
+
+      return sum(1 for t in history if timestamp - t <= window)
+
+  def sweep(self, now):
+    """
+    Evicts the tracks whose last timestamp is older than `ttl`.
+
+    Parameters:
+      now (float): Current time, on the same clock as the recorded timestamps.
+
+    Returns:
+      int: Number of evicted tracks.
+    """
+    with self.lock:
+      return self._sweep(now)
+
+  def _sweep(self, now):
+    expired = [track_id for track_id, history in self.tracks.items() if now - history[-1] > self.ttl]
+    for track_id in expired:
+      del self.tracks[track_id]
+
+    self.last_sweep = now
+    self.evicted += len(expired)
+    return len(expired)
+
+  def __len__(self):
+    with self.lock:
+      return len(self.tracks)
+
+  def get_stats(self):
+    """
+    Returns the number of live tracks, the timestamps they hold and the tracks evicted so far.
+    """
+    with self.lock:
+      return {
+        "tracks": len(self.tracks),
+        "timestamps": sum(len(history) for history in self.tracks.values()),
+        "evicted": self.evicted,
+      }
@@ -0,0 +1,209 @@
+# shared/quantization.py
+import os, ast, glob, tempfile
+import cv2 as cv
+import numpy as np
+import onnx
+from onnxruntime.quantization import (
+  CalibrationDataReader,
+  CalibrationMethod,
+  QuantFormat,
+  QuantType,
+  quant_pre_process,
+  quantize_static,
+)
+from ultralytics.data.augment import LetterBox
+
+# Image extensions used as calibration frames
+CALIBRATION_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def quantized_model_path(onnx_path):
+  """
+  Returns where the INT8 version of an exported .onnx model is cached, next to the FP32 export.
+
+  Parameters:
+    onnx_path (str): Path of the FP32 .onnx model.
+
+  Returns:
+    str: Path of the INT8 .onnx model.
+  """
+  return f"{os.path.splitext(onnx_path)[0]}_int8.onnx"
+
+
+def find_calibration_frames(calibration_dir, max_frames):
+  """
+  Picks up to `max_frames` images spread evenly over every dataset in a directory (e.g. 'datasets'),
+  so all datasets and tile counts are represented in the calibration.
+
+  Parameters:
+    calibration_dir (str): Directory searched recursively for images.
+    max_frames (int): Maximum number of images to return, 0 for all of them.
+
+  Returns:
+    list of str: Sorted image paths.
+  """
+  paths = sorted(
+    path for path in glob.glob(os.path.join(calibration_dir, "**", "*"), recursive=True)
+    if path.lower().endswith(CALIBRATION_EXTENSIONS)
+  )
+  if max_frames <= 0 or len(paths) <= max_frames:
+    return paths
+
+  indices = np.linspace(0, len(paths) - 1, max_frames).round().astype(int)
+  return [paths[i] for i in indices]
+
+
+def preprocess_for_task(image, task, imgsz):
+  """
+  Turns a BGR image into the NCHW float32 input the exported model sees, following Ultralytics' own preprocessing:
+  letterboxed to `imgsz` (padded to a multiple of the stride) for detection/ pose, shorter side scaled to `imgsz` and
+  center cropped for classification.
+
+  Parameters:
+    image (numpy.ndarray): BGR image.
+    task (str): "detect", "pose" or "classify".
+    imgsz (int): Input size of the model.
+
+  Returns:
+    numpy.ndarray: Input tensor of shape (1, 3, height, width), RGB scaled to [0, 1].
+  """
+  if task == "classify":
+    h, w = image.shape[:2]
+    scale = imgsz / min(h, w)
+    resized = cv.resize(image, (max(round(w * scale), imgsz), max(round(h * scale), imgsz)), interpolation=cv.INTER_LINEAR)
+    top = (resized.shape[0] - imgsz) // 2
+    left = (resized.shape[1] - imgsz) // 2
+    image = resized[top:top + imgsz, left:left + imgsz]
+  else:
+    image = LetterBox((imgsz, imgsz), auto=True, stride=32)(image=image)
+
+  tensor = image[..., ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+  return np.ascontiguousarray(tensor)
+
+
+class FrameCalibrationReader(CalibrationDataReader):
+  """
+  Feeds calibration frames to ONNX Runtime's static quantization, one preprocessed frame per call.
+
+  The classifier only ever sees object crops, so it is calibrated on the quadrants of every frame in addition to the
+  full frame, which is closer to the scale of a crop than the whole (tiled) camera view.
+
+  Attributes:
+    input_name (str): Name of the model's image input.
+    task (str): Ultralytics task of the model.
+    imgsz (int): Input size of the model.
+    frame_paths (list of str): Calibration images.
+  """
+
+  def __init__(self, input_name, task, imgsz, frame_paths):
+    self.input_name = input_name
+    self.task = task
+    self.imgsz = imgsz
+    self.frame_paths = frame_paths
+    self.inputs = self._inputs()
+
+  def _inputs(self):
+    for path in self.frame_paths:
+      frame = cv.imread(path)
+      if frame is None:
+        continue
+
+      images = [frame]
+      if self.task == "classify":
+        h, w = frame.shape[:2]
+        images += [frame[y:y + h // 2, x:x + w // 2] for y in (0, h // 2) for x in (0, w // 2)]
+
+      for image in images:
+        yield {self.input_name: preprocess_for_task(image, self.task, self.imgsz)}
+
+  def get_next(self):
+    return next(self.inputs, None)
+
+  def rewind(self):
+    self.inputs = self._inputs()
+
+
+def postprocess_nodes(model):
+  """
+  Returns the nodes between the model's last convolutions and its outputs (box decoding, DFL, sigmoid, concat).
+
+  These stay in FP32: the detection output concatenates pixel coordinates (hundreds) with class scores (0-1),
+  quantizing that tensor with a single scale would round every score to a handful of levels.
+
+  Parameters:
+    model (onnx.ModelProto): The FP32 model.
+
+  Returns:
+    list of str: Names of the nodes to exclude from quantization.
+  """
+  producers = {output: node for node in model.graph.node for output in node.output}
+  excluded = set()
+  pending = [output.name for output in model.graph.output]
+
+  while pending:
+    node = producers.get(pending.pop())
+    if node is None or node.name in excluded or node.op_type == "Conv":
+      continue
+    excluded.add(node.name)
+    pending.extend(node.input)
+
+  return sorted(excluded)
+
+
+def model_imgsz(metadata_props, default=640):
+  """
+  Returns the square input size stored in an exported model's Ultralytics metadata.
+  """
+  metadata = {prop.key: prop.value for prop in metadata_props}
+  imgsz = ast.literal_eval(metadata["imgsz"]) if "imgsz" in metadata else default
+  return imgsz[0] if isinstance(imgsz, (list, tuple)) else imgsz
+
+
+def quantize_model(onnx_path, task, calibration_frames):
+  """
+  Quantizes an exported FP32 .onnx model to INT8 (QDQ format, per-channel weights), calibrated on the given frames.
+
+  Parameters:
+    onnx_path (str): Path of the FP32 .onnx model.
+    task (str): Ultralytics task of the model, decides how the calibration frames are preprocessed.
+    calibration_frames (list of str): Calibration images, see `find_calibration_frames`.
+
+  Returns:
+    str: Path of the INT8 .onnx model.
+
+  Raises:
+    ValueError: If no calibration frames are given.
+  """
+  if not calibration_frames:
+    raise ValueError(f"No calibration frames to quantize {onnx_path} with")
+
+  metadata = onnx.load(onnx_path, load_external_data=False).metadata_props
+  output_path = quantized_model_path(onnx_path)
+  imgsz = model_imgsz(metadata, default=224 if task == "classify" else 640)
+
+  with tempfile.TemporaryDirectory() as tmp_dir:
+    # Graph optimizations and shape inference ONNX Runtime recommends before quantizing
+    # (symbolic shape inference does not cope with the dynamic input shapes, plain ONNX shape inference is used instead)
+    preprocessed_path = os.path.join(tmp_dir, "preprocessed.onnx")
+    quant_pre_process(onnx_path, preprocessed_path, skip_symbolic_shape=True)
+    model = onnx.load(preprocessed_path)
+
+    quantize_static(
+      preprocessed_path,
+      output_path,
+      FrameCalibrationReader(model.graph.input[0].name, task, imgsz, calibration_frames),
+      quant_format=QuantFormat.QDQ,
+      activation_type=QuantType.QInt8,
+      weight_type=QuantType.QInt8,
+      per_channel=True,
+      calibrate_method=CalibrationMethod.MinMax,
+      nodes_to_exclude=postprocess_nodes(model),
+    )
+
+  # Ultralytics reads class names, stride and task from the metadata, keep it on the quantized model
+  quantized = onnx.load(output_path)
+  if not quantized.metadata_props:
+    quantized.metadata_props.extend(metadata)
+    onnx.save(quantized, output_path)
+
+  return output_path
@@ -0,0 +1,141 @@
+# shared/verdict_cache.py
+import threading, time
+from collections import OrderedDict
+
+
+def box_iou(box_a, box_b):
+  """
+  Computes the intersection over union of two bounding boxes.
+
+  Parameters:
+    box_a, box_b (array-like): Coordinates (x1, y1, x2, y2) of the boxes.
+
+  Returns:
+    float: IoU between 0 (no overlap) and 1 (identical boxes).
+  """
+  ix1 = max(box_a[0], box_b[0])
+  iy1 = max(box_a[1], box_b[1])
+  ix2 = min(box_a[2], box_b[2])
+  iy2 = min(box_a[3], box_b[3])
+  intersection = max(ix2 - ix1, 0) * max(iy2 - iy1, 0)
+
+  area_a = (box_a[2] - box_a[0]) * (box_a[3] - box_a[1])
+  area_b = (box_b[2] - box_b[0]) * (box_b[3] - box_b[1])
+  union = area_a + area_b - intersection
+
+  return float(intersection / union) if union > 0 else 0.0
+
+
+class VerdictCache:
+  """
+  Caches the water bottle classifier's verdict per tracked object so stationary objects are not classified on every frame.
+
+  Entries are keyed by (camera_id, track_id). A cached verdict is reused until it expires (TTL), has been
+  reused for `reclassify_frames` frames, or the object's bounding box has changed a lot (IoU with the box
+  it was classified on drops below `iou_threshold`). The least recently used entry is evicted when the cache is full.
+
+  Attributes:
+    max_entries (int): Maximum number of cached verdicts.
+    ttl (float): Seconds a verdict stays valid.
+    reclassify_frames (int): Number of frames a verdict is reused before the object is classified again.
+    iou_threshold (float): Minimum IoU between the current and the classified box for the verdict to be reused.
+    entries (OrderedDict): Cached verdicts in least recently used order.
+      Format: {
+        (camera_id, track_id): [label (str), coords (list of 4), frames reused (int), expiry timestamp (float)]
+      }
+    hits (int): Number of lookups answered from the cache.
+    misses (int): Number of lookups that required a classification.
+  """
+
+  def __init__(self, max_entries=1024, ttl=300.0, reclassify_frames=30, iou_threshold=0.5):
+    """
+    Initializes an empty VerdictCache.
+
+    Parameters:
+      max_entries (int, optional): Maximum number of cached verdicts. Defaults to 1024.
+      ttl (float, optional): Seconds a verdict stays valid. Defaults to 300.
+      reclassify_frames (int, optional): Frames a verdict is reused before reclassifying. Defaults to 30.
+      iou_threshold (float, optional): Minimum IoU to the classified box to reuse a verdict. Defaults to 0.5.
+    """
+    self.max_entries = max_entries
+    self.ttl = ttl
+    self.reclassify_frames = reclassify_frames
+    self.iou_threshold = iou_threshold
+
+    self.entries = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+    self.lock = threading.Lock()
+
+  def get(self, camera_id, track_id, coords):
+    """
+    Looks up the cached verdict of a tracked object.
+
+    Parameters:
+      camera_id (int): The camera the object was detected on.
+      track_id (int): Track ID of the object.
+      coords (array-like): Current bounding box (x1, y1, x2, y2) of the object.
+
+    Returns:
+      str or None: The cached label, or None if the object has to be classified again.
+    """
+    key = (camera_id, track_id)
+    with self.lock:
+      entry = self.entries.get(key)
+
+      if entry is not None:
+        label, cached_coords, frames, expires_at = entry
+        stale = (
+          time.monotonic() >= expires_at
+          or frames >= self.reclassify_frames
+          or box_iou(cached_coords, coords) < self.iou_threshold
+        )
+        if stale:
+          del self.entries[key]
+        else:
+          entry[2] += 1
+          self.entries.move_to_end(key)
+          self.hits += 1
+          return label
+
+      self.misses += 1
+      return None
+
+  def put(self, camera_id, track_id, coords, label):
+    """
+    Stores the verdict of a freshly classified object, evicting the least recently used entry if the cache is full.
+
+    Parameters:
+      camera_id (int): The camera the object was detected on.
+      track_id (int): Track ID of the object.
+      coords (array-like): Bounding box (x1, y1, x2, y2) the object was classified on.
+      label (str): Predicted class label.
+    """
+    key = (camera_id, track_id)
+    with self.lock:
+      self.entries[key] = [label, list(coords), 0, time.monotonic() + self.ttl]
+      self.entries.move_to_end(key)
+
+      while len(self.entries) > self.max_entries:
+        self.entries.popitem(last=False)
+
+  def hit_rate(self):
+    """
+    Returns the fraction of lookups answered from the cache, 0 if there were no lookups yet.
+    """
+    with self.lock:
+      lookups = self.hits + self.misses
+      return self.hits / lookups if lookups else 0.0
+
+  def get_stats(self):
+    """
+    Returns the cache size, hits, misses and hit rate.
+    """
+    hit_rate = self.hit_rate()
+    with self.lock:
+      return {
+        "entries": len(self.entries),
+        "hits": self.hits,
+        "misses": self.misses,
+        "hit_rate": hit_rate,
+      }
@@ -1,19 +1,22 @@
-import queue, time, os
-import numpy as np
+import queue, threading, time, os
 from dotenv import load_dotenv
 from datetime import datetime
 import cv2
 from zoneinfo import ZoneInfo
 
-import time
 from threads.notificationservice import NotificationService
 from threads.nvr import NVR
 from threads.process_incompliance import ProcessIncompliance
+from threads.reader import grab_main_stream_frame
+from threads.recognition_service import RecognitionRequest, PersonPending
 from shared.camera import Camera
 from database import get_lab_safety_email_by_camera_id
 from database import get_lab_safety_telegram_by_camera_id
 
 from shared.mqtt_client import MQTTClient
+from shared.metrics import stage_metrics
+from shared.image_utils import safe_crop
+from shared.association_engine import match_people
 from data_source.lab_safety_staff_dao import LabSafetyStaffDAO
 
 # Constants
@@ -32,359 +35,298 @@ db_params = {
 mqtt_client = MQTTClient()
 lab_safety_staff_dao = LabSafetyStaffDAO(db_params=db_params)
 
+# NVR, notification and incompliance clients of each recognition worker thread
+_clients = threading.local()
 
-def safe_crop(img, x1, y1, x2, y2, padding=0):
+
+def get_evidence_frame(context, frame):
     """
-    Safely crops a region from an image, ensuring the crop area stays within image boundaries.
+    Returns the frame used for face recognition and evidence snapshots, with the scale to map detection coordinates onto it.
+
+    If the camera detects on the low resolution sub-stream, a full resolution frame is grabbed from the main stream.
+    Otherwise (or if grabbing fails) the detection frame itself is used.
 
     Parameters:
-        img (np.ndarray): The frame from which to crop.
-        x1, y1 (int): Top-left coordinates of the crop rectangle.
-        x2, y2 (int): Bottom-right coordinates of the crop rectangle.
-        padding (int, optional): Number of pixels to expand the crop area in all directions. Default is 0.
+        context (Camera): The camera context.
+        frame (np.ndarray): The frame detection and pose estimation ran on.
 
     Returns:
-        np.ndarray: Cropped image region with padding applied, clipped to the image size.
+        tuple: (evidence_frame, scale_x, scale_y), multiply detection coordinates by the scales to map them onto the evidence frame.
     """
-    h, w, _ = img.shape
-    x1 = max(x1 - padding, 0)
-    y1 = max(y1 - padding, 0)
-    x2 = min(x2 + padding, w)
-    y2 = min(y2 + padding, h)
-    return img[y1:y2, x1:x2]
+    if not context.use_sub_stream:
+        return frame, 1.0, 1.0
 
+    main_frame = grab_main_stream_frame(context)
+    if main_frame is None:
+        return frame, 1.0, 1.0
 
-# Estimates the facial area based on the nose, eyes and ears
-def extract_face_from_nose(pose_points, frame):
-    """
-    Estimates a bounding box for the face based on detected keypoints: nose, eyes, and ears.
+    h, w = frame.shape[:2]
+    main_h, main_w = main_frame.shape[:2]
+    return main_frame, main_w / w, main_h / h
 
-    The bounding box is calculated vertically using the distance from nose to eyes (value is tripled),
-    and horizontally using the ears and eye positions with some offsets.
 
-    Parameters:
-        pose_points (dict): Dictionary that has 'nose', 'left_eye', 'right_eye', 'left_ear', 'right_ear' keypoints as (x, y) tuples.
-        frame (np.ndarray): The frame from which to extract the face area.
+# Helper function to keep track of track id
+def flag_track_id(context, track_id):
+    context.flagged_foodbev.add(context.camera_id, track_id)
 
-    Returns:
-        tuple: Coordinates (x1, y1, x2, y2) defining the bounding box of the estimated face region.
 
-    Raises:
-        ValueError: If the calculated bounding box dimensions are invalid (x2 <= x1 or y2 <= y1).
+def get_clients(camera_id):
     """
-    h, _ = frame.shape[:2]
+    Returns the NVR, notification service and incompliance handler of the calling recognition worker thread.
 
-    nose = np.array(pose_points["nose"])
-    l_eye = np.array(pose_points["left_eye"])
-    r_eye = np.array(pose_points["right_eye"])
-    l_ear = np.array(pose_points["left_ear"])
-    r_ear = np.array(pose_points["right_ear"])
+    Each worker thread keeps its own clients, so requests running concurrently do not share an NVR session.
 
-    # Get the vertical distance of nose to eyes
-    average_y_of_eyes = (l_eye[1] + r_eye[1]) // 2
-    nose_to_eye_height = abs(nose[1] - average_y_of_eyes) * 3
-    eye_center_y = average_y_of_eyes
-
-    # Add one unit (of nose_to_eye_height) above eye center, one below nose
-    y1 = max(int(eye_center_y - nose_to_eye_height), 0)
-    y2 = min(int(nose[1] + nose_to_eye_height) + 20, h)
+    Parameters:
+        camera_id (int): The camera the incompliance handler records incompliances for.
 
-    # Horizontal distance of bbox based on ears
-    x1 = int(min(l_ear[0], r_eye[0] - 40))
-    x2 = int(max(r_ear[0], l_eye[0] + 40))
+    Returns:
+        tuple: (nvr, notifier, process_incompliance)
+    """
+    if not hasattr(_clients, "nvr"):
+        _clients.nvr = NVR("192.168.1.63", "D3FB23C8155040E4BE08374A418ED0CA", "admin", "Sit12345")
+        _clients.notifier = NotificationService()
+        _clients.process_incompliance = {}
 
-    # check that bbox is valid
-    if x2 <= x1 or y2 <= y1:
-        print(x1, y1, x2, y2)
-        raise ValueError("Invalid bounding box dimensions.")
+    if camera_id not in _clients.process_incompliance:
+        _clients.process_incompliance[camera_id] = ProcessIncompliance(db_params, camera_id)
+        # _clients.process_incompliance[camera_id] = ProcessIncompliance(DATABASE, camera_id)
 
-    return (x1, y1, x2, y2)
+    return _clients.nvr, _clients.notifier, _clients.process_incompliance[camera_id]
 
 
-def get_dist_nose_to_box(pose_points, food_drinks_bbox):
+def save_snapshot(context, evidence_frame, face_box, object_box, person_id, today):
+    """
+    Saves the evidence frame with the face (red) and food/ drink (green) boxes drawn on it.
     """
-    Calculates the shortest Euclidean distance from the nose keypoint to the edges of a given bounding box.
+    clone = evidence_frame.copy()
+    cv2.rectangle(clone, face_box[:2], face_box[2:], (0, 0, 255), 1)
+    cv2.rectangle(clone, object_box[:2], object_box[2:], (0, 255, 0), 1)
+    context.manager.saver.save_img(clone, str(person_id), today)
 
-    Parameters:
-        pose_points (dict): Dictionary containing 'nose' keypoint as an (x, y) tuple.
-        food_drinks_bbox (tuple): Coordinates (x1, y1, x2, y2) of the bounding box representing food or drink.
 
-    Returns:
-        float: The Euclidean distance between the nose point and the closest edge of the bounding box.
+# Facial recognition of a person associated with a food/ drink, run by the recognition service
+def recognise(request, service):
     """
-    # Compute edge of food/drink bbox edges to nose point
-    # Get nose point
-    nose = np.array(pose_points["nose"])
+    Recognises the person of a RecognitionRequest on the NVR and handles the incompliance.
 
-    # Get food/ drinks bounding box coords
-    x1, y1, x2, y2 = food_drinks_bbox
+    A matched person gets their incompliance recorded, a snapshot saved and the lab safety staff notified (once per day).
+    A person without a match is inserted into the NVR face database as a new person. Until the NVR has modeled that
+    face, another request without a match could be the same person, so it is deferred (PersonPending) instead of
+    inserting a duplicate.
 
-    # Clamp the nose to the bounding box (to get closest point on box edge)
-    clamped_x = np.clip(nose[0], x1, x2)
-    clamped_y = np.clip(nose[1], y1, y2)
+    The face is cropped from the evidence frame (see `get_evidence_frame`), grabbed here so a slow main stream only
+    holds up the recognition worker thread and not the camera's association thread.
 
-    # Compute distance from nose to closest point on the bbox (euclidean distance formula)
-    return np.linalg.norm(nose - np.array([clamped_x, clamped_y]))
+    Parameters:
+        request (RecognitionRequest): The food/ drink and face to recognise.
+        service (RecognitionService): The service running the request.
 
+    Returns:
+        str or None: ID of the person the incompliance was recorded for, None if no incompliance was recorded or the
+            face could not be cropped.
 
-# Helper function to keep track of track id
-def flag_track_id(context, track_id):
-    with context.flagged_foodbev_lock:
-        context.flagged_foodbev.append(track_id)
+    Raises:
+        PersonPending: If there is no match while a new person's face is still being modeled.
+    """
+    context = request.context
+    track_id = request.track_id
+    nvr, notifier, process_incompliance = get_clients(context.camera_id)
+    today = request.current_date[:10]
+    print(request.current_date)
+
+    # Face crop and snapshot come from the full resolution main stream when detecting on the sub-stream
+    evidence_frame, scale_x, scale_y = get_evidence_frame(context, request.frame)
+    scales = (scale_x, scale_y, scale_x, scale_y)
+    face_box = tuple(int(value * scale) for value, scale in zip(request.face_box, scales))
+    object_box = tuple(int(value * scale) for value, scale in zip(request.object_box, scales))
+
+    face_crop = safe_crop(evidence_frame, *face_box, padding=30)
+
+    # Face crop failed, the food/ drink is not flagged so association submits it again
+    if face_crop is None or face_crop.size <= 0:
+        return None
+
+    mode_data = nvr.get_mode_data(evidence_frame)
+    matches_found = nvr.get_face_comparison(mode_data)
+
+    if matches_found[0] == None:
+        return None
+
+    # Match found
+    if int(matches_found[0]) >= 1:
+
+        print("Match found")
+        person_id = process_incompliance.match_found_new_incompliance(
+            matches_found,
+            nvr,
+            request.detection,
+            track_id,
+            face_crop,
+            request.current_date,
+        )
+
+        print(f"[DEBUG]{person_id}")
+        # Incompliance on different date
+        if person_id is not None:
+
+            # Save frame locally
+            save_snapshot(context, evidence_frame, face_box, object_box, person_id, today)
+
+            # Send Email for Second Incompliance Detected
+            lab_emails = lab_safety_staff_dao.get_email_by_camera_id(context.camera_id)
+            lab_telegram = get_lab_safety_telegram_by_camera_id(
+                context.camera_id
+            )
+            print(f"[DEBUG25]")
+            print(f"[DEBUG23] Retrieved lab emails for camera {context.camera_id}: {lab_emails}")
+
+            # Email
+            if lab_emails:
+                for email_row in lab_emails:
+                    email = email_row["lab_safety_email"]
+
+                    print(f"[DEBUG23] Sending email to: {email}")
+                    notifier.send_incompliance_email(email, f"Person {person_id}")
+
+            # Telegram
+            if lab_telegram:
+                for telegram in lab_telegram:
+                    notifier.send_incompliance_telegram(
+                        telegram=telegram,
+                        person_name=f"Person {person_id}",
+                        camera_id=context.camera_id,
+                    )
+
+            # Publish MQTT message
+            if mqtt_client:
+                mqtt_client.publish_violation(
+                    user=str(person_id),
+                    event="lab_safety_violation",
+                    details=f"Incompliance detected at camera {context.camera_id}",
+                )
+
+            print(
+                f"[ACTION] Similar face found 🟢: {person_id}. Saving incompliance snapshot and updated last incompliance date ✅")
+
+        flag_track_id(context, track_id)
+        return person_id
+
+    # No match found
+    # One new person inserted at a time, and none while a face inserted before is not modeled yet (prevents double
+    # inserts of the same person)
+    with service.new_person_lock:
+        ready_at = service.pending_until()
+        if ready_at is not None:
+            raise PersonPending(ready_at)
+
+        flag_track_id(context, track_id)
+
+        print("No match found")
+        person_id = process_incompliance.no_match_new_incompliance(
+            nvr,
+            request.detection,
+            track_id,
+            face_crop,
+            request.current_date,
+        )
+        service.mark_pending(person_id)
+
+    # Save frame locally in new folder
+    os.makedirs(
+        os.path.join(
+            "web",
+            "static",
+            "incompliances",
+            str(person_id),
+        ),
+        exist_ok=True,
+    )
+
+    save_snapshot(context, evidence_frame, face_box, object_box, person_id, today)
+
+    print(
+        "[NEW] No face found 🟡. Saving incompliance snapshot and updated last incompliance date ✅")
+    return person_id
 
 
 # Mapping detected food/ drinks to person
 def association(context: Camera):
-    notifier = NotificationService()
-    nvr = NVR("192.168.1.63", "D3FB23C8155040E4BE08374A418ED0CA", "admin", "Sit12345")
-    process_incompliance = ProcessIncompliance(db_params, context.camera_id)
-    # process_incompliance = ProcessIncompliance(DATABASE, context.camera_id)
+    # Food/ drinks waiting for face recognition, not submitted again until their recognition is done
+    pending_recognitions = {}
 
     while context.running.is_set():
         try:
-            frame = context.process_queue.get(timeout=1)
+            result = context.process_queue.get(timeout=1)
 
         except queue.Empty:
             continue
 
+        # Frame stays in the camera's frame ring until released at the end of this iteration
+        frame = result.frame.frame
         if frame is None or frame.size == 0:
+            result.release()
             continue
 
-        # Shallow copy for reading in this thread
-        with context.detected_incompliance_lock, context.pose_points_lock:
-            local_pose_points = list(context.pose_points)
-            local_detected_food_drinks = dict(context.detected_incompliance)
-
-        best_matches = {}
-        for track_id in local_detected_food_drinks:
-
-            with context.flagged_foodbev_lock:
-                if track_id in context.flagged_foodbev:
-                    continue
-
-            food_drinks_bbox = local_detected_food_drinks[track_id][0]
-            food_drinks_center = local_detected_food_drinks[track_id][1]
-            x1, y1, x2, y2 = map(int, food_drinks_bbox)
+        association_start = time.perf_counter()
 
-            drink = frame.copy()
-            cv2.rectangle(drink, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            best_score = float("inf")
-            best_matches[track_id] = {"person": None, "best_score": best_score}
+        for track_id in [track_id for track_id, future in pending_recognitions.items() if future.done()]:
+            del pending_recognitions[track_id]
 
-            for p in local_pose_points:
+        # Incompliant food/ drinks of this frame that are not flagged yet
+        flagged = context.flagged_foodbev.track_ids(context.camera_id)
+        unflagged = [
+            index for index, track_id in enumerate(result.detections[:, 0].astype(int).tolist())
+            if track_id not in flagged and track_id not in pending_recognitions
+        ]
+        detections = result.detections[unflagged]
+        boxes = detections[:, 3:7]
+        centers = (boxes[:, :2] + boxes[:, 2:]) // 2
 
-                try:
-                    face_bbox = extract_face_from_nose(p, frame)
-                    fx1, fy1, fx2, fy2 = map(int, face_bbox)
+        # Score every food/ drink against every person at once
+        matches, _, faces = match_people(boxes, centers, result.keypoints, frame.shape[0])
 
-                except ValueError:
-                    print("can't extract the face")
-                    continue
-
-                # If the top of food/ drink bbox is a percentage above the nose, ignore
-                if y1 < p["nose"][1] * 0.65:
-                    print("Food/ drink is above the nose, ignoring.")
-                    continue
+        for detection, center, match in zip(detections, centers, matches):
+            track_id = int(detection[0])
+            x1, y1, x2, y2 = map(int, detection[3:7])
 
-                # If height of food/ drink is a lot larger than height head, person is likely to be further away so ignore
-                # If height of food/ drink is a lot smaller than height of head, food/ drink is likely to be further away so ignore
-                area_food_drinks = abs(x1 - x2) * abs(y1 - y2)
-                area_head = abs(fx1 - fx2) * abs(fy1 - fy2)
-                area_check = (
-                        area_food_drinks >= area_head * 4
-                        or area_food_drinks < area_head * 0.1
+            if match >= 0:
+                # Track wrist proximity times, only the ones within the last 2 seconds count
+                recent_count = context.wrist_proximity_history.record(
+                    track_id, result.captured_at, REQUIRED_DURATION
                 )
-                height_check = (
-                        abs(y1 - y2) >= abs(fy1 - fy2) * 2.85
-                        or abs(y1 - y2) < abs(fy1 - fy2) * 0.35
-                )
-                if area_check or height_check:
-                    # print("🔶Food/ drink not at the same depth as person, ignoring.")
-                    continue
 
-                # Filter out poses that are too far away
-                dist_nose_to_box = get_dist_nose_to_box(p, food_drinks_bbox)
-                dist = min(
-                    np.linalg.norm(p["left_wrist"] - food_drinks_center),
-                    np.linalg.norm(p["right_wrist"] - food_drinks_center),
-                )
-
-                # Distance thresholds
-                nose_threshold = abs(y1 - y2) * 1.1
-                consumption_threshold = abs(y1 - y2) * 0.3
-                wrist_threshold = abs(y1 - y2) * 0.5
-
-                # Check if drinking
-                if dist_nose_to_box > consumption_threshold:
-                    # Not drinking, check if holding
-                    if dist > wrist_threshold or dist_nose_to_box > nose_threshold:
-                        # Not holding, skip
-                        continue
-
-                # Find best matched person
-                score = dist_nose_to_box + dist
-                if score < best_matches[track_id]["best_score"]:
-                    best_matches[track_id]["best_score"] = score
-                    best_matches[track_id]["person"] = p
-
-            if best_matches[track_id]["person"] is not None:
-                p = best_matches[track_id]["person"]
-                now = time.time()
-
-                # Track wrist proximity times
-                if track_id not in context.wrist_proximity_history:
-                    context.wrist_proximity_history[track_id] = []
-
-                context.wrist_proximity_history[track_id].append(now)
-
-                # # Logging detection frame per track_Id
-                # for track_id, timestamps in context.wrist_proximity_history.items():
-                #     print(
-                #         f"Track ID {track_id} has {len(timestamps)} proximity detections"
-                #     )
-
-                # Keep only timestamps within the last 2 seconds
-                recent_times = [
-                    t
-                    for t in context.wrist_proximity_history[track_id]
-                    if now - t <= REQUIRED_DURATION
-                ]
-                context.wrist_proximity_history[track_id] = (
-                    recent_times  # Prune old entries
-                )
-
-                if len(recent_times) < REQUIRED_COUNT:
+                if recent_count < REQUIRED_COUNT:
                     continue
 
-                face_crop = None
-                try:
-                    face_bbox = extract_face_from_nose(p, frame)
-                    fx1, fy1, fx2, fy2 = map(int, face_bbox)
-
-                except ValueError:
-                    print("can't extract the face")
+                # Object in the format ProcessIncompliance reads it: [coords, center, confidence, class id]
+                local_detected_food_drinks = {
+                    track_id: [detection[3:7], tuple(center), float(detection[2]), int(detection[1])]
+                }
+
+                # Mock next day
+                # mocked_date = datetime(2025, 11, 25)
+                # current_date = mocked_date.strftime("%Y-%m-%d %H:%M:%S")
+
+                local_tz = ZoneInfo("Asia/Singapore")
+                current_date = datetime.now(local_tz).strftime("%Y-%m-%d %H:%M:%S")
+
+                # Facial recognition (and the main stream grab) runs on the recognition service, this thread moves on to
+                # the next frame. The request outlives this frame's slot in the frame ring, so it gets a copy.
+                future = context.manager.recognition_service.submit(RecognitionRequest(
+                    context,
+                    track_id,
+                    local_detected_food_drinks,
+                    frame.copy(),
+                    tuple(map(int, faces[match])),
+                    (x1, y1, x2, y2),
+                    current_date,
+                ))
+
+                if future is None:
+                    print(f"[ERROR] Recognition queue full, skipping track {track_id} on camera {context.camera_id}")
                     continue
-                face_crop = safe_crop(frame, fx1, fy1, fx2, fy2, padding=30)
 
-                # Face crop failed
-                if face_crop is None or face_crop.size <= 0:
-                    continue
+                pending_recognitions[track_id] = future
 
-                try:
-                    # Mock next day
-                    # mocked_date = datetime(2025, 11, 25)
-                    # current_date = mocked_date.strftime("%Y-%m-%d %H:%M:%S")
-
-                    local_tz = ZoneInfo("Asia/Singapore")
-                    current_date = datetime.now(local_tz).strftime("%Y-%m-%d %H:%M:%S")
-                    print(current_date)
-                    today = current_date[:10]
-
-                    # Facial Recognition
-                    with context.manager.nvr_face_lock:
-                        mode_data = nvr.get_mode_data(frame)
-                        matches_found = nvr.get_face_comparison(mode_data)
-
-                        if matches_found[0] == None:
-                            continue
-
-                        # Match found
-                        if int(matches_found[0]) >= 1:
-
-                            print("Match found")
-                            person_id = process_incompliance.match_found_new_incompliance(
-                                matches_found,
-                                nvr,
-                                local_detected_food_drinks,
-                                track_id,
-                                face_crop,
-                                current_date,
-                            )
-
-                            print(f"[DEBUG]{person_id}")
-                            # Incompliance on different date
-                            if person_id is not None:
-
-                                # Save frame locally
-                                clone = frame.copy()
-                                cv2.rectangle(clone, (fx1, fy1), (fx2, fy2), (0, 0, 255), 1)
-                                cv2.rectangle(clone, (x1, y1), (x2, y2), (0, 255, 0), 1)
-                                context.manager.saver.save_img(clone, str(person_id), today)
-
-                                # Send Email for Second Incompliance Detected
-                                lab_emails = lab_safety_staff_dao.get_email_by_camera_id(context.camera_id)
-                                lab_telegram = get_lab_safety_telegram_by_camera_id(
-                                    context.camera_id
-                                )
-                                print(f"[DEBUG25]")
-                                print(f"[DEBUG23] Retrieved lab emails for camera {context.camera_id}: {lab_emails}")
-
-                                # Email
-                                if lab_emails:
-                                    for email_row in lab_emails:
-                                        email = email_row["lab_safety_email"]
-
-                                        print(f"[DEBUG23] Sending email to: {email}")
-                                        notifier.send_incompliance_email(email, f"Person {person_id}")
-
-                                # Telegram
-                                if lab_telegram:
-                                    for telegram in lab_telegram:
-                                        notifier.send_incompliance_telegram(
-                                            telegram=telegram,
-                                            person_name=f"Person {person_id}",
-                                            camera_id=context.camera_id,
-                                        )
-
-                                # Publish MQTT message
-                                if mqtt_client:
-                                    mqtt_client.publish_violation(
-                                        user=str(person_id),
-                                        event="lab_safety_violation",
-                                        details=f"Incompliance detected at camera {context.camera_id}",
-                                    )
-
-                                print(
-                                    f"[ACTION] Similar face found 🟢: {person_id}. Saving incompliance snapshot and updated last incompliance date ✅")
-
-                            flag_track_id(context, track_id)
-
-                        # No match found
-                        elif int(matches_found[0]) < 1:
-
-                            flag_track_id(context, track_id)
-
-                            print("No match found")
-                            person_id = process_incompliance.no_match_new_incompliance(
-                                nvr,
-                                local_detected_food_drinks,
-                                track_id,
-                                face_crop,
-                                current_date,
-                            )
-
-                            # Save frame locally in new folder
-                            os.makedirs(
-                                os.path.join(
-                                    "web",
-                                    "static",
-                                    "incompliances",
-                                    str(person_id),
-                                ),
-                                exist_ok=True,
-                            )
-
-                            clone = frame.copy()
-                            cv2.rectangle(clone, (fx1, fy1), (fx2, fy2), (0, 0, 255), 1)
-                            cv2.rectangle(clone, (x1, y1), (x2, y2), (0, 255, 0), 1)
-                            context.manager.saver.save_img(clone, str(person_id), today)
-
-                            print(
-                                "[NEW] No face found 🟡. Saving incompliance snapshot and updated last incompliance date ✅")
-
-                        # Give time for the face to be modeled in NVR, prevents double inserts of same incompliances
-                        time.sleep(5)
-
-                except Exception as e:
-                    print(e)
-                    continue
+        result.release()
+        stage_metrics.record("association", time.perf_counter() - association_start)
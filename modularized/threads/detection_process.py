@@ -0,0 +1,359 @@
+import multiprocessing as mp
+import queue, threading, time, traceback
+from multiprocessing import shared_memory
+import numpy as np
+from threads.detection_worker import DetectionWorker
+
+# Batches a worker process may have queued or in progress at once, the next batch is collected while the current one is inferred
+MAX_PENDING_BATCHES = 2
+
+
+def close_shared_memory(block):
+    """
+    Closes a shared memory block attached by this process.
+    The mapping stays alive while frames read from it are still referenced (e.g. by the predictor's last batch).
+    """
+    try:
+        block.close()
+    except BufferError:
+        pass
+
+
+def run_pipeline_process(gpu_id, num_workers, requests, results):
+    """
+    Entry point of a worker process: loads a DetectionPipeline and runs every batch request on it.
+
+    Requests are ("batch", batch_id, slot_set, [(camera_id, kind, shm_name, offset, shape, dtype, flagged), ...]),
+    ("drop", camera_id) or None to stop. Frames of kind "ring" are read from the camera's FrameRing, frames of kind "slot"
+    from the worker's SharedFrameSlots. Results are ("ready",) once the models are loaded, then
+    (batch_id, slot_set, list of FrameDetections or None, detect seconds, pipeline seconds, pipeline stats, error or None).
+
+    Parameters:
+        gpu_id (int): The ID of the GPU device used for inference, also the worker's offset in the track ID space.
+        num_workers (int): Number of worker processes, each numbers a camera's tracks from its own interleaved track IDs.
+        requests (multiprocessing.Queue): Requests from the ProcessDetectionWorker.
+        results (multiprocessing.Queue): Results sent back to the ProcessDetectionWorker.
+    """
+    from shared.detection_pipeline import DetectionPipeline
+
+    # Track ID counters are per process, interleave them so a camera moved between processes keeps unique track IDs
+    pipeline = DetectionPipeline(gpu_id, track_id_offset=gpu_id, track_id_stride=num_workers)
+    attached = {}  # Format: {(slot_set, slot): (shm_name, SharedMemory)}
+    rings = {}  # Format: {camera_id: (shm_name, SharedMemory)}
+    results.put(("ready",))
+
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+
+        if request[0] == "drop":
+            pipeline.drop_tracker(request[1])
+            ring = rings.pop(request[1], None)
+            if ring is not None:
+                close_shared_memory(ring[1])
+            continue
+
+        _, batch_id, slot_set, items = request
+        try:
+            # Frames are read in place, the parent does not write to the slot set again until this batch's result is back
+            pipeline_items = []
+            for slot, (camera_id, kind, name, offset, shape, dtype, flagged) in enumerate(items):
+                # Camera frame rings stay attached until the camera is dropped from this worker
+                mapping, key = (rings, camera_id) if kind == "ring" else (attached, (slot_set, slot))
+                current = mapping.get(key)
+                if current is None or current[0] != name:
+                    # First frame, or the parent reallocated the block
+                    if current is not None:
+                        close_shared_memory(current[1])
+                    # Spawned processes share the parent's resource tracker, the block is still unlinked only once by the parent
+                    current = (name, shared_memory.SharedMemory(name=name))
+                    mapping[key] = current
+
+                frame = np.ndarray(shape, dtype=dtype, buffer=current[1].buf, offset=offset)
+                pipeline_items.append((camera_id, frame, flagged))
+
+            start = time.perf_counter()
+            frame_results, detect_time = pipeline.run(pipeline_items)
+            pipeline_time = time.perf_counter() - start
+
+            results.put(
+                (batch_id, slot_set, frame_results, detect_time, pipeline_time, pipeline.get_stats(), None)
+            )
+
+        except Exception as e:
+            traceback.print_exc()
+            results.put((batch_id, slot_set, None, 0.0, 0.0, None, str(e)))
+
+    for _, block in list(attached.values()) + list(rings.values()):
+        close_shared_memory(block)
+
+
+class SharedFrameSlot:
+    """
+    Shared memory block a frame is copied into to hand it over to a worker process.
+    The block is reallocated when a frame does not fit.
+
+    Attributes:
+        block (SharedMemory): The current shared memory block, None until the first frame is written.
+    """
+
+    def __init__(self):
+        self.block = None
+
+    def write(self, frame):
+        """
+        Copies a frame into the slot.
+
+        Parameters:
+            frame (numpy.ndarray): The frame to hand over.
+
+        Returns:
+            tuple: (shared memory name, offset, shape, dtype string) the worker process needs to read the frame.
+        """
+        if self.block is None or self.block.size < frame.nbytes:
+            self.release()
+            self.block = shared_memory.SharedMemory(create=True, size=frame.nbytes)
+
+        np.ndarray(frame.shape, dtype=frame.dtype, buffer=self.block.buf)[...] = frame
+        return self.block.name, 0, frame.shape, frame.dtype.str
+
+    def release(self):
+        """
+        Frees the shared memory block.
+        """
+        if self.block is not None:
+            self.block.close()
+            self.block.unlink()
+            self.block = None
+
+
+class ProcessDetectionWorker(DetectionWorker):
+    """
+    DetectionWorker that runs its DetectionPipeline in a separate process, so inference, pre/post-processing and
+    tracking do not compete for the GIL with Flask, the readers and the association threads.
+
+    The worker thread collects batches as usual. Frames in their camera's FrameRing are already in shared memory and are
+    read by the process in place, only frames outside the ring are copied into the worker's shared memory slots. The process sends back FrameDetections (small NumPy arrays) which a result thread publishes to the cameras
+    (drawing, incompliances, pose points, queues) exactly like the thread worker does. Up to `MAX_PENDING_BATCHES`
+    batches are handed over at once, so the next batch is collected and copied while the current one is inferred.
+
+    Attributes:
+        process (multiprocessing.Process): The process running `run_pipeline_process`.
+        requests (multiprocessing.Queue): Batch, drop tracker and stop requests for the process.
+        results (multiprocessing.Queue): Results sent back by the process.
+        result_thread (threading.Thread): Thread that publishes the results of the process.
+        ready (threading.Event): Set once the process has loaded its models.
+        slot_sets (list): `MAX_PENDING_BATCHES` sets of `batch_size` SharedFrameSlots, one set per pending batch, for frames outside a FrameRing.
+        free_slot_sets (queue.Queue): Indices of the slot sets not used by a pending batch.
+        pending (dict): Batches handed over to the process and not published yet.
+            Format: {
+                batch_id: (batch, batch start timestamp)
+            }
+        pipeline_stats (dict): Latest verdict cache and cascade stats reported by the process, None until the first result.
+    """
+
+    def __init__(self, worker_id, num_workers=1):
+        """
+        Starts the worker process, then the worker thread.
+
+        Parameters:
+            worker_id (int): The unique identifier for this worker, also used as the GPU ID of the process.
+            num_workers (int, optional): Number of workers of the DetectionManager. Defaults to 1.
+        """
+        # Spawn instead of fork, forking a process with running threads (and possibly CUDA) is unsafe
+        context = mp.get_context("spawn")
+        self.requests = context.Queue()
+        self.results = context.Queue()
+        self.process = context.Process(
+            target=run_pipeline_process,
+            args=(worker_id, num_workers, self.requests, self.results),
+            name=f"DetectionProcess-{worker_id}",
+            daemon=True,
+        )
+        self.process.start()
+
+        self.ready = threading.Event()
+        self.slot_sets = []
+        self.free_slot_sets = queue.Queue()
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        self.next_batch_id = 0
+        self.pipeline_stats = None
+
+        self.result_thread = threading.Thread(
+            target=self.receive_results,
+            name=f"DetectionResults-{worker_id}",
+            daemon=True,
+        )
+
+        super().__init__(worker_id, num_workers)
+        self.result_thread.start()
+
+    def preprocess(self, gpu_id):
+        """
+        Collects batches of frames, copies them into shared memory and hands them over to the worker process.
+
+        Parameters:
+            gpu_id (int): The ID of the GPU device used for inference (by the worker process).
+        """
+        self.slot_sets = [
+            [SharedFrameSlot() for _ in range(self.batch_size)] for _ in range(MAX_PENDING_BATCHES)
+        ]
+        for index in range(MAX_PENDING_BATCHES):
+            self.free_slot_sets.put(index)
+
+        # Frames are only taken from the cameras once the models are loaded, same as the thread worker
+        while self.running.is_set() and not self.ready.wait(timeout=1):
+            if not self.process.is_alive():
+                print(f"[ERROR] Detection process {self.worker_id} exited while loading models.")
+                self.hand_back_work()
+                return
+
+        while self.running.is_set():
+            # Checked before every batch, a dead process would otherwise be handed batches it never answers
+            if not self.process.is_alive():
+                print(f"[ERROR] Detection process {self.worker_id} exited unexpectedly.")
+                self.hand_back_work()
+                return
+
+            try:
+                slot_set = self.free_slot_sets.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            batch = self.collect_batch()
+            if not batch:
+                self.free_slot_sets.put(slot_set)
+                continue
+
+            batch_start = time.perf_counter()
+            items = []
+            for slot, (context, frame, _) in zip(self.slot_sets[slot_set], batch):
+                if frame.ring is not None and frame.ring.name is not None:
+                    # Already in shared memory, the process reads the ring slot in place
+                    item = ("ring", frame.ring.name, frame.index * frame.ring.slot_bytes, frame.frame.shape, frame.frame.dtype.str)
+                else:
+                    item = ("slot", *slot.write(frame.frame))
+                items.append((context.camera_id, *item, self.get_flagged(context)))
+
+            with self.pending_lock:
+                batch_id = self.next_batch_id
+                self.next_batch_id += 1
+                self.pending[batch_id] = (batch, batch_start)
+                self.in_flight += len(batch)
+
+            self.requests.put(("batch", batch_id, slot_set, items))
+
+    def receive_results(self):
+        """
+        Publishes the results sent back by the worker process to their cameras.
+        """
+        while self.running.is_set() or self.pending:
+            try:
+                message = self.results.get(timeout=1)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    # Batches still pending are never answered
+                    self.hand_back_work()
+                    break
+                continue
+
+            if message[0] == "ready":
+                self.ready.set()
+                continue
+
+            batch_id, slot_set, frame_results, detect_time, pipeline_time, pipeline_stats, error = message
+            with self.pending_lock:
+                entry = self.pending.pop(batch_id, None)
+
+            # The process is done with the slots, the original frames are still referenced by the batch
+            self.free_slot_sets.put(slot_set)
+
+            # Result sent right before the process died, its batch was already handed back
+            if entry is None:
+                continue
+            batch, batch_start = entry
+
+            if error is None:
+                self.pipeline_stats = pipeline_stats
+                self.publish_batch(batch, frame_results, detect_time, batch_start)
+                self.record_load(len(batch), pipeline_time)
+            else:
+                print(f"[ERROR] Detection process {self.worker_id} failed on a batch: {error}")
+                # Nothing is published, give the frames back to their rings
+                for context, frame, _ in batch:
+                    frame.release()
+                    self.finish(context)
+
+            with self.pending_lock:
+                self.in_flight -= len(batch)
+
+    def hand_back_work(self):
+        """
+        Gives the work of a dead worker process back to the DetectionManager, called by the worker and result threads when
+        they notice the process exited.
+
+        The frames of pending batches are released and the cameras of those batches and of the worker's queue are
+        scheduled again, on a live worker (see `is_alive`).
+        """
+        with self.pending_lock:
+            batches = list(self.pending.values())
+            self.pending.clear()
+            self.in_flight -= sum(len(batch) for batch, _ in batches)
+
+        for batch, _ in batches:
+            for context, frame, _ in batch:
+                frame.release()
+                self.finish(context)
+
+        # Queued cameras still hold their frame in the latest frame slot
+        while True:
+            try:
+                context = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            self.finish(context)
+
+    def is_alive(self):
+        """
+        Returns whether the worker process is running, the DetectionManager does not schedule cameras on a dead worker.
+        """
+        return self.process.is_alive()
+
+    def get_pipeline_stats(self):
+        """
+        Returns the verdict cache and cascade stats last reported by the worker process, None until the first result.
+        """
+        return self.pipeline_stats
+
+    def drop_tracker(self, camera_id):
+        """
+        Discards the tracker state of a camera in the worker process, e.g. after it was moved to another worker or removed.
+
+        Parameters:
+            camera_id (int): The camera whose tracker is discarded.
+        """
+        self.requests.put(("drop", camera_id))
+
+    def stop(self):
+        """
+        Stops the worker thread, the worker process and the result thread, and frees the shared memory slots.
+
+        Waits for up to 5 seconds for the process to exit gracefully, then terminates it.
+        """
+        self.running.clear()
+        self.thread.join(timeout=2)
+
+        self.requests.put(None)
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+        self.result_thread.join(timeout=2)
+        for slot_set in self.slot_sets:
+            for slot in slot_set:
+                slot.release()
+
+        print(f"[INFO] Detection worker {self.worker_id} stopped.")
@@ -1,14 +1,35 @@
-import queue
-from datetime import datetime, timedelta
+import queue, time
 import cv2 as cv
-from shared.model import (
-    ObjectDetectionModel,
-    PoseDetectionModel,
-    ImageClassificationModel,
+from shared.config import (
+    DETECTION_BATCH_SIZE,
+    DETECTION_BATCH_DEADLINE_MS,
+    BATCH_STATS_INTERVAL,
 )
-from threads.association import safe_crop
+from shared.model import PoseDetectionModel
+from shared.detection_pipeline import DetectionPipeline, FrameResult
+from shared.metrics import stage_metrics
 import threading
-import queue
+
+# Smoothing factor of the per-frame processing time EWMA used for load-aware scheduling
+EWMA_ALPHA = 0.2
+# Seconds over which worker utilisation is measured
+UTILISATION_WINDOW = 10.0
+
+
+def put_dropping_oldest(frame_queue, frame):
+    """
+    Puts a frame into a bounded queue, dropping (and releasing) the oldest frame if the queue is full.
+
+    Parameters:
+        frame_queue (queue.Queue): The camera's process or display queue.
+        frame (FrameRef or FrameResult): Reference to the frame (or the result holding it), ownership passes to the queue.
+    """
+    if frame_queue.full():
+        try:
+            frame_queue.get_nowait().release()
+        except queue.Empty:
+            pass
+    frame_queue.put(frame)
 
 
 class DetectionWorker:
@@ -20,31 +41,65 @@ class DetectionWorker:
     to identify keypoints/ humans. Detected frames are then sent to the next processing
     stage and also sent to a queue that stores the frames for display on the dashboard.
 
+    Inference itself is done by a DetectionPipeline owned by the worker thread. The worker only publishes the pipeline's
+    results to the camera, so `ProcessDetectionWorker` can run the same pipeline in a separate process instead.
+
     Attributes:
         worker_id (int): The unique identifier for this worker.
-        queue (queue.Queue): A queue for frames to be processed.
+        num_workers (int): Number of workers of the DetectionManager, worker processes interleave their track IDs by it.
+        queue (queue.Queue): A queue of cameras with a pending frame in their latest frame slot.
         thread (threading.Thread): The thread that runs the `preprocess` method.
         running (threading.Event): A flag to signal when the worker is running.
+        pipeline (DetectionPipeline): Models, per-camera trackers and verdict cache, None until loaded by the worker thread.
+        tracker_drops (queue.Queue): Cameras whose tracker state is discarded by the worker thread before its next batch.
+        batch_size (int): Maximum number of frames (from different cameras) run through object detection in one call.
+        batch_deadline (float): Maximum time in seconds to wait for a batch to fill up after its first frame.
+        batch_stats (dict): Measured inference time per batch size, used to report the throughput gain of batching.
+            Format: {
+                batch_size: [number of batches, total inference seconds]
+            }
+        in_flight (int): Number of frames currently being processed.
+        ewma_frame_time (float): Exponentially weighted moving average of the processing time per frame in seconds, None until measured.
+        utilisation (float): Fraction of the last utilisation window the worker spent processing frames.
     """
 
-    def __init__(self, worker_id):
+    def __init__(self, worker_id, num_workers=1):
         """
         Initializes the detection worker with a unique worker ID and starts the worker thread.
 
         Parameters:
             worker_id (int): The unique identifier for this worker.
+            num_workers (int, optional): Number of workers of the DetectionManager. Defaults to 1.
         """
+        self.worker_id = worker_id
+        self.num_workers = num_workers
         self.queue = queue.Queue()
+        self.pipeline = None
+        self.tracker_drops = queue.Queue()
+
+        # Batched inference, a batch size of 1 disables batching
+        self.batch_size = max(1, DETECTION_BATCH_SIZE)
+        self.batch_deadline = DETECTION_BATCH_DEADLINE_MS / 1000
+        self.batch_stats = {}
+        self.batch_stats_lock = threading.Lock()
+        self.last_stats_report = time.monotonic()
+
+        # Load tracking for the DetectionManager scheduler
+        self.in_flight = 0
+        self.ewma_frame_time = None
+        self.utilisation = 0.0
+        self.window_start = time.monotonic()
+        self.window_busy = 0.0
+
         self.thread = threading.Thread(
             target=self.preprocess,
             args=(worker_id,),
-            name=f"DetectionWorker-{worker_id}",
+            name=f"{type(self).__name__}-{worker_id}",
             daemon=True,
         )
         self.running = threading.Event()
         self.running.set()
         self.thread.start()
-        self.worker_id = worker_id
 
     # Display annotated frames on dashboard
     def preprocess(self, gpu_id):
@@ -60,128 +115,331 @@ class DetectionWorker:
         Parameters:
             gpu_id (int): The ID of the GPU device used for inference.
         """
-
-        object_detection_model = ObjectDetectionModel("yolo11x.pt", gpu_device=gpu_id)
-        pose_model = PoseDetectionModel("yolov8n-pose.pt", 0.8, 0.7)
-        classif_model = ImageClassificationModel("yolov8n-cls.pt")
-        last_cleared = datetime.min
+        self.pipeline = DetectionPipeline(gpu_id)
 
         while self.running.is_set():
 
+            batch = self.collect_batch()
+            if not batch:
+                continue
+
+            self.in_flight = len(batch)
+            batch_start = time.perf_counter()
+
+            self.apply_tracker_drops()
+            results, detect_time = self.pipeline.run(
+                [(context.camera_id, frame.frame, self.get_flagged(context)) for context, frame, _ in batch]
+            )
+            self.publish_batch(batch, results, detect_time, batch_start)
+
+            self.record_load(len(batch), time.perf_counter() - batch_start)
+            self.in_flight = 0
+
+    def publish_batch(self, batch, results, detect_time, batch_start):
+        """
+        Records the stage metrics of a processed batch, publishes each frame's results to its camera and releases the worker's frame references.
+
+        Parameters:
+            batch (list of tuple): (Camera, FrameRef, capture timestamp) entries, as returned by `collect_batch`.
+            results (list of FrameDetections): Pipeline results, in the same order as `batch`.
+            detect_time (float): Seconds taken by the batched object detection call.
+            batch_start (float): `time.perf_counter()` timestamp of when the batch was taken from the queue.
+        """
+        self.record_batch(len(batch), detect_time)
+
+        for (context, frame, captured_at), result in zip(batch, results):
+            stage_metrics.record("queue_wait", batch_start - captured_at)
+            # Includes "detect" only for frames object detection ran on (all of them without a cascade)
+            for stage, seconds in result.timings.items():
+                stage_metrics.record(stage, seconds)
+
+            self.process_frame(context, frame, result, captured_at)
+            frame.release()
+            stage_metrics.record("worker", time.perf_counter() - captured_at)
+            self.finish(context)
+
+    def finish(self, context):
+        """
+        Ends a camera's turn on this worker, queuing it again (on the worker selected by the DetectionManager) if a newer
+        frame arrived while its frame was in flight.
+
+        Parameters:
+            context (Camera): The camera whose frame was published or dropped.
+        """
+        if context.finish_frame():
+            context.detection_manager.schedule(context)
+
+    def process_frame(self, context, frame, result, captured_at):
+        """
+        Publishes the detections of a single frame to its camera.
+
+        Frames with incompliant objects and persons are sent to the association stage as a FrameResult.
+        While someone is watching the camera's live feed, the detected objects are also drawn on a copy of the frame
+        that is sent to the dashboard display queue, unwatched cameras skip the copy and the drawing.
+
+        Parameters:
+            context (Camera): The camera the frame belongs to.
+            frame (FrameRef): The frame that was run through the pipeline, the association stage gets its own reference.
+            result (FrameDetections): Detections, incompliance mask and pose keypoints of the frame.
+            captured_at (float): `time.perf_counter()` timestamp of when the frame was captured.
+        """
+        # perform image processing here
+        frame_copy = None
+        if context.has_viewers:
+            frame_copy = context.frame_ring.copy(
+                frame.frame
+            )  # copy frame (into a free ring slot) for drawing bounding boxes, ids and conf scores.
+
+        if len(result.detections) >= 1:
+
+            if frame_copy is not None:
+                for detection in result.detections:
+                    track_id, confidence = int(detection[0]), float(detection[2])
+                    x1, y1, x2, y2 = map(int, detection[3:7])
+
+                    cv.rectangle(frame_copy.frame, (x1, y1), (x2, y2), (0, 0, 255), 1)
+                    cv.putText(
+                        frame_copy.frame,
+                        f"id: {track_id}, conf: {confidence:.2f}",
+                        (x1, y1 - 10),
+                        cv.FONT_HERSHEY_SIMPLEX,
+                        0.7,
+                        (0, 0, 255),
+                        1,
+                    )
+
+            # only process if theres both faces and food/beverages in frame
+            if result.incompliant.any():
+                pose_points = PoseDetectionModel.parse_keypoints(result.keypoints)
+
+                # Put into process queue for the next step (mapping food/ drinks to faces)
+                if len(pose_points):
+                    try:
+                        put_dropping_oldest(
+                            context.process_queue,
+                            FrameResult(frame.retain(), captured_at, result.detections[result.incompliant], pose_points),
+                        )
+
+                    except Exception as e:
+                        print(f"Error putting frame into process queue: {e}")
+
+        # Put into queue to display frames in dashboard
+        if frame_copy is not None:
+            put_dropping_oldest(context.display_queue, frame_copy)
+
+    def get_flagged(self, context):
+        """
+        Returns the camera's flagged track IDs for the pipeline (flags expire after FLAGGED_TTL seconds).
+
+        Parameters:
+            context (Camera): The camera to read the flagged track IDs of.
+
+        Returns:
+            frozenset: Track IDs flagged for food or beverage policy violations, a read-only snapshot shared with other readers.
+        """
+        return context.flagged_foodbev.track_ids(context.camera_id)
+
+    def collect_batch(self):
+        """
+        Collects up to `batch_size` frames from different cameras for one batched inference call.
+
+        Blocks for up to 1 second for the first camera, then waits at most `batch_deadline` seconds
+        for more cameras to fill up the batch.
+
+        Returns:
+            list of tuple: (Camera, FrameRef, capture timestamp) entries, empty if no frame arrived.
+        """
+        batch = []
+        deadline = None
+
+        while len(batch) < self.batch_size:
             try:
-                frame, context = self.queue.get(timeout=1)
+                if deadline is None:
+                    context = self.queue.get(timeout=1)
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    context = self.queue.get(timeout=remaining)
 
             except queue.Empty:
+                break
+
+            # A camera is scheduled once until its frame is published, never twice in a batch
+            if any(entry[0] is context for entry in batch):
                 continue
 
-            if frame is None or frame.size == 0:
+            # Only the newest frame of the camera is processed, older ones were dropped by the reader
+            frame, captured_at = context.take_latest_frame()
+            if frame is None:
+                self.finish(context)
+                continue
+            if frame.frame.size == 0:
+                frame.release()
+                self.finish(context)
                 continue
 
-            # perform image processing here
-            frame_copy = (
-                frame.copy()
-            )  # copy frame for drawing bounding boxes, ids and conf scores.
-
-            # Food/Drink detection
-            drink_boxes = object_detection_model.detect(frame)
-
-            with context.detected_incompliance_lock:
-                context.detected_incompliance.clear()
-
-            if drink_boxes and len(drink_boxes) >= 1:
-                # or (food_boxes and len(food_boxes) >= 1)):
-
-                if datetime.now() - last_cleared >= timedelta(
-                    hours=2
-                ):  # Clear flagged ids every 2 hours
-                    with context.flagged_foodbev_lock:
-                        context.flagged_foodbev.clear()
-                    last_cleared = datetime.now()
-
-                # object detection pipeline
-                with context.detected_incompliance_lock:
-                    # Process drinks
-                    for box in drink_boxes:
-                        track_id = int(box.id) if box.id is not None else None
-                        if track_id is None:
-                            continue
-
-                        cls_id = int(box.cls.cpu())
-                        confidence = float(box.conf.cpu())
-                        coords = box.xyxy[0].cpu().numpy()
-                        # class_name = drink_model.names[cls_id]
-                        # print(f"[Food/Drink] {class_name} (ID: {cls_id}) - {confidence:.2f}")
-
-                        x1, y1, x2, y2 = map(int, coords)
-
-                        cv.rectangle(frame_copy, (x1, y1), (x2, y2), (0, 0, 255), 1)
-                        cv.putText(
-                            frame_copy,
-                            f"id: {track_id}, conf: {confidence:.2f}",
-                            (x1, y1 - 10),
-                            cv.FONT_HERSHEY_SIMPLEX,
-                            0.7,
-                            (0, 0, 255),
-                            1,
-                        )
+            batch.append((context, frame, captured_at))
+            if deadline is None:
+                deadline = time.monotonic() + self.batch_deadline
 
-                        if track_id not in context.flagged_foodbev:
+        return batch
 
-                            # Check if it's a water bottle or not
-                            object_crop = safe_crop(frame, x1, y1, x2, y2, padding=10)
-                            predicted_label = classif_model.classify(object_crop)
+    def record_batch(self, size, seconds):
+        """
+        Records the inference time of a batch and periodically prints the batching, verdict cache, keyframe, pose region and cascade stats.
 
-                            # Discard saving coordinates if it's a water bottle (model tends to detect some bottles as milk can also)
-                            if predicted_label == "water_bottle" or predicted_label == "milk_can":
-                                print("🚫 Water bottle, skipping")
-                                continue
+        Parameters:
+            size (int): Number of frames in the batch.
+            seconds (float): Time taken by the batched object detection call.
+        """
+        with self.batch_stats_lock:
+            stats = self.batch_stats.setdefault(size, [0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+
+        if time.monotonic() - self.last_stats_report >= BATCH_STATS_INTERVAL:
+            self.last_stats_report = time.monotonic()
+            report = self.get_batch_stats()
+            gain = report["throughput_gain"]
+            print(
+                f"[INFO] DetectionWorker-{self.worker_id} batching: max size {report['batch_size']}, "
+                f"deadline {report['batch_deadline_ms']}ms, avg size {report['avg_batch_size']:.2f}, "
+                f"{report['frames_per_second']:.1f} FPS, gain "
+                + (f"{gain:.2f}x" if gain is not None else "n/a")
+            )
+            pipeline_stats = self.get_pipeline_stats()
+            if pipeline_stats is None:
+                return
+            cache_stats = pipeline_stats["verdict_cache"]
+            print(
+                f"[INFO] DetectionWorker-{self.worker_id} verdict cache: {cache_stats['entries']} entries, "
+                f"hit rate {cache_stats['hit_rate']:.1%} ({cache_stats['hits']} hits, {cache_stats['misses']} misses)"
+            )
+            keyframe_stats = pipeline_stats["keyframes"]
+            if keyframe_stats["propagated"]:
+                print(
+                    f"[INFO] DetectionWorker-{self.worker_id} keyframes: {keyframe_stats['keyframes']} detected, "
+                    f"{keyframe_stats['propagated']} propagated ({keyframe_stats['keyframe_rate']:.1%} of frames detected)"
+                )
+            pose_stats = pipeline_stats["pose"]
+            if pose_stats["roi_calls"]:
+                print(
+                    f"[INFO] DetectionWorker-{self.worker_id} pose regions: {pose_stats['roi_calls']}/{pose_stats['calls']} calls on regions, "
+                    f"{pose_stats['pixel_ratio']:.1%} of the frame pixels processed"
+                )
+            cascade_stats = pipeline_stats["cascade"]
+            if cascade_stats is not None:
+                print(
+                    f"[INFO] DetectionWorker-{self.worker_id} cascade: escalated {cascade_stats['frames_escalated']}/{cascade_stats['frames_screened']} "
+                    f"frames ({cascade_stats['escalation_rate']:.1%}, {cascade_stats['escalations']}), "
+                    f"screen {cascade_stats['screen_ms_per_frame']:.1f} ms/frame, "
+                    f"detect {cascade_stats['detect_ms_per_escalated_frame']:.1f} ms/escalated frame, "
+                    f"detection time saved {cascade_stats['time_saved']:.1%}"
+                )
+
+    def get_batch_stats(self):
+        """
+        Summarizes the measured batching performance of this worker.
 
-                            context.detected_incompliance[track_id] = [
-                                coords,  # Coordinates of bbox
-                                (
-                                    (coords[0] + coords[2]) // 2,  # Center of bbox
-                                    (coords[1] + coords[3]) // 2,
-                                ),
-                                confidence,  # Confidence score
-                                cls_id,  # Class Id of detected object (refer to COCO dataset)
-                            ]
+        The throughput gain compares the inference time per frame of all batches against
+        batches of a single frame, it is None until both have been measured.
 
-                keypoints = pose_model.predict(frame)
-                with context.pose_points_lock:
-                    context.pose_points.clear()
+        Returns:
+            dict: Batch config, average batch size, inference frames per second and throughput gain.
+        """
+        with self.batch_stats_lock:
+            stats = {size: list(values) for size, values in self.batch_stats.items()}
+
+        batches = sum(count for count, _ in stats.values())
+        frames = sum(size * count for size, (count, _) in stats.items())
+        seconds = sum(total for _, total in stats.values())
+
+        gain = None
+        if 1 in stats and frames > stats[1][0]:
+            single_frame_time = stats[1][1] / stats[1][0]
+            gain = single_frame_time / (seconds / frames) if seconds > 0 else None
+
+        return {
+            "batch_size": self.batch_size,
+            "batch_deadline_ms": self.batch_deadline * 1000,
+            "avg_batch_size": frames / batches if batches else 0.0,
+            "frames_per_second": frames / seconds if seconds > 0 else 0.0,
+            "throughput_gain": gain,
+        }
+
+    def record_load(self, size, seconds):
+        """
+        Updates the processing time EWMA and utilisation of this worker after a batch.
 
-                with context.detected_incompliance_lock and context.pose_points_lock:
-                    # only process if theres both faces and food/beverages in frame
-                    if context.detected_incompliance and (keypoints is not None):
+        Parameters:
+            size (int): Number of frames in the batch.
+            seconds (float): Time taken to detect and process all frames of the batch.
+        """
+        frame_time = seconds / size
+        if self.ewma_frame_time is None:
+            self.ewma_frame_time = frame_time
+        else:
+            self.ewma_frame_time = EWMA_ALPHA * frame_time + (1 - EWMA_ALPHA) * self.ewma_frame_time
+
+        self.window_busy += seconds
+        elapsed = time.monotonic() - self.window_start
+        if elapsed >= UTILISATION_WINDOW:
+            self.utilisation = min(self.window_busy / elapsed, 1.0)
+            self.window_start = time.monotonic()
+            self.window_busy = 0.0
+
+    def queue_depth(self):
+        """
+        Returns the number of cameras waiting in this worker's queue.
+        """
+        return self.queue.qsize()
 
-                        context.pose_points = pose_model.parse_keypoints(keypoints)
+    def outstanding_work(self):
+        """
+        Estimates the time in seconds this worker needs before it could process a newly submitted frame.
 
-                # Put into process queue for the next step (mapping food/ drinks to faces)
-                with context.detected_incompliance_lock and context.pose_points_lock:
-                    if context.pose_points and context.detected_incompliance:
-                        try:
-                            if not context.process_queue.full():
-                                context.process_queue.put(frame)
-
-                            else:
-                                try:
-                                    context.process_queue.get_nowait()
-                                except queue.Empty:
-                                    pass
-                                context.process_queue.put(frame)
-
-                        except Exception as e:
-                            print(f"Error putting frame into process queue: {e}")
-
-            # Put into queue to display frames in dashboard
-            if not context.display_queue.full():
-                context.display_queue.put(frame_copy)
-            else:
-                try:
-                    context.display_queue.get_nowait()
-                except queue.Empty:
-                    pass
-                context.display_queue.put(frame_copy)
+        Returns:
+            float: (queued + in flight + 1) frames multiplied by the processing time EWMA, 0 until measured.
+        """
+        return (self.queue_depth() + self.in_flight + 1) * (self.ewma_frame_time or 0.0)
+
+    def is_alive(self):
+        """
+        Returns whether the worker can process frames, always True for a worker thread.
+        """
+        return True
+
+    def get_pipeline_stats(self):
+        """
+        Returns the stats of the pipeline's water bottle verdict cache and cascade, None until the models are loaded.
+        """
+        if self.pipeline is None:
+            return None
+        return self.pipeline.get_stats()
+
+    def drop_tracker(self, camera_id):
+        """
+        Discards the tracker state of a camera, e.g. after it was moved to another worker or removed.
+
+        Called from other threads (the camera's reader, camera removal), so the drop is only queued. The worker thread
+        applies it between batches, while the pipeline is not iterating over or updating its per-camera state.
+
+        Parameters:
+            camera_id (int): The camera whose tracker is discarded.
+        """
+        self.tracker_drops.put(camera_id)
+
+    def apply_tracker_drops(self):
+        """
+        Discards the tracker state of the cameras queued by `drop_tracker`, called by the worker thread only.
+        """
+        while True:
+            try:
+                camera_id = self.tracker_drops.get_nowait()
+            except queue.Empty:
+                return
+            self.pipeline.drop_tracker(camera_id)
 
     def stop(self):
         """
@@ -194,12 +452,11 @@ class DetectionWorker:
         self.thread.join(timeout=2)
         print(f"[INFO] Detection worker {self.worker_id} stopped.")
 
-    def submit(self, frame, camera):
+    def submit(self, camera):
         """
-        Submits a new frame to the worker for processing.
+        Queues a camera whose latest frame slot holds a frame waiting to be processed.
 
         Parameters:
-            frame (numpy.ndarray): The frame to be processed.
-            camera (Camera): The camera context that provides necessary details for processing.
+            camera (Camera): The camera context that provides the frame and necessary details for processing.
         """
-        self.queue.put((frame, camera))
+        self.queue.put(camera)
@@ -2,59 +2,99 @@
 import cv2
 import time
 from shared.camera import Camera
+from shared.frame_source import build_rtsp_url
+
+# Seconds between motion gate skip rate reports
+MOTION_STATS_INTERVAL = 60
+
+
+def grab_main_stream_frame(context: Camera, warmup_frames=3):
+    """
+    Opens the camera's full resolution main stream, grabs a single frame and closes it again.
+
+    Used when detection runs on the sub-stream and a face crop or evidence snapshot is needed,
+    so the main stream is only decoded on demand.
+
+    Parameters:
+        context (Camera): The camera context.
+        warmup_frames (int, optional): Frames to read before returning one, so the decoder has a keyframe. Defaults to 3.
+
+    Returns:
+        numpy.ndarray or None: Full resolution frame, or None if the main stream could not be read.
+    """
+    cap = cv2.VideoCapture(build_rtsp_url(context.ip_address, context.channel), cv2.CAP_FFMPEG)
+    frame = None
+    try:
+        if not cap.isOpened():
+            print(f"⚠️ Failed to open main stream of camera {context.ip_address}")
+            return None
+
+        for _ in range(warmup_frames):
+            ret, latest = cap.read()
+            if ret:
+                frame = latest
+    finally:
+        cap.release()
+
+    return frame
 
 
 def read_frames(context: Camera):
     """
     Reads frames from an IP camera or webcam and handles reconnections in case of failure.
 
-    This function runs in a thread that continuously reads frames from the camera and handles connection issues by
+    This function runs in a thread that continuously reads frames from the camera's frame source and handles connection issues by
     attempting to reconnect if frames cannot be retrieved. If the camera is an IP camera, it uses
     RTSP to stream frames, and it supports retries up to a maximum number of attempts with exponential backoff if consecutive failures occur.
     For non-IP cameras such as a local webcam, it directly captures frames (Use webcam only for testing on personal machines).
+    Offline sources (video files, image directories) are replayed until they run out of frames.
 
     Parameters:
         context (Camera): The camera context, containing configuration and state information about
                            the camera, such as whether it is an IP camera, its IP address, channel,
-                           and the frame queue for processing.
+                           and the latest frame slot for processing.
 
     Notes:
         - For IP cameras, the function uses RTSP for video streaming with basic authentication.
         - The function uses exponential backoff for retrying failed connections, gradually increasing the
           delay between each reconnection attempt.
         - The function supports a maximum retry limit to prevent endless retries and control the backoff behavior.
+        - If the camera uses the sub-stream, only the low resolution sub-stream is decoded here. The main stream is
+          grabbed on demand with `grab_main_stream_frame`.
+        - If the camera has a motion gate, frames of a static scene are skipped except for periodic keyframes.
     """
     max_retries = 30  # Maximum reconnection attempts
     retry_delay = 1.0  # Initial delay between retries
     max_delay = 10.0  # Maximum delay between retries
 
-    if context.use_ip_camera:
-        # Camera config
-        username = "admin"
-        password = "Sit12345"
-        rtsp_url = f"rtsp://{username}:{password}@{context.ip_address}/Streaming/Channels/{context.channel}"
-
-        # Initialize IP camera
-        context.cap = cv2.VideoCapture(rtsp_url, cv2.CAP_FFMPEG)
+    source = context.source
 
-        # Check if camera connection is successful
-        if not (context.cap).isOpened():
-            print("Failed to connect to the RTSP stream.")
-            print(f"Attempted URL: {rtsp_url}")
-            return
+    # Check if camera connection is successful
+    if not source.open():
+        print(f"Failed to open frame source of camera {context.camera_id}.")
+        print(f"Attempted source: {source}")
+        return
 
-        print(f"[DEBUG NVR CHECK] Attempted URL: {rtsp_url}")
-        print(f"✅ Successfully connected to IP camera: {context.ip_address}")
-    else:
-        context.cap = cv2.VideoCapture(0)  # to test with webcam
+    print(f"✅ Successfully opened frame source of camera {context.camera_id}: {source}")
 
     consecutive_failures = 0
     current_delay = retry_delay
+    last_motion_report = time.monotonic()
 
     while context.running.is_set():
-        ret, frame = (context.cap).read()
+        # Decode straight into a free slot of the camera's frame ring (None for the first frame or if the ring is full)
+        buffer = context.frame_ring.acquire()
+        ret, frame = source.read(buffer.frame if buffer else None)
 
         if not ret:
+            if buffer:
+                buffer.release()
+
+            # Replayed file or image directory has no frames left
+            if source.exhausted:
+                print(f"📼 Finished replaying {source}")
+                break
+
             consecutive_failures += 1
 
             if consecutive_failures == 1:
@@ -71,24 +111,17 @@ def read_frames(context: Camera):
                 )
 
             # If we've failed multiple times, try to reconnect
-            if consecutive_failures >= 10 and context.use_ip_camera:
+            if consecutive_failures >= 10 and source.reconnectable:
                 print(f"🔄 Attempting to reconnect to camera {context.ip_address}...")
 
                 # Release current connection
-                if context.cap:
-                    context.cap.release()
+                source.release()
 
                 # Wait before reconnecting
                 time.sleep(current_delay)
 
                 # Try to reconnect
-                username = "admin"
-                password = "Sit12345"
-                rtsp_url = f"rtsp://{username}:{password}@{context.ip_address}/Streaming/Channels/{context.channel}"
-
-                context.cap = cv2.VideoCapture(rtsp_url, cv2.CAP_FFMPEG)
-
-                if context.cap.isOpened():
+                if source.open():
                     print(f"✅ Successfully reconnected to camera {context.ip_address}")
                     consecutive_failures = 0
                     current_delay = retry_delay  # Reset delay
@@ -116,11 +149,22 @@ def read_frames(context: Camera):
             consecutive_failures = 0
             current_delay = retry_delay
 
-        if not (context.frame_queue).full():
-            context.manager.detection_manager.submit(frame, context)
-            # (context.frame_queue).put(frame)
+        frame_ref = context.frame_ring.adopt(frame, buffer)
+
+        # Skip detection while the scene is static (except for periodic keyframes)
+        if context.motion_gate is None or context.motion_gate.should_process(frame):
+            # Overwrites any frame still waiting for a worker, so only the newest frame gets processed
+            context.manager.detection_manager.submit(frame_ref, context)
+        else:
+            frame_ref.release()
+
+        if context.motion_gate and time.monotonic() - last_motion_report >= MOTION_STATS_INTERVAL:
+            last_motion_report = time.monotonic()
+            stats = context.motion_gate.get_stats()
+            print(
+                f"[INFO] Camera {context.camera_id} motion gate skipped {stats['frames_skipped']}/{stats['frames_seen']} frames ({stats['skip_rate']:.1%})"
+            )
         time.sleep(0.01)
 
-    if context.cap:
-        context.cap.release()
+    source.release()
     print(f"📹 Camera {context.ip_address} connection closed")
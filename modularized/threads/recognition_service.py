@@ -0,0 +1,269 @@
+import queue, threading, time
+from collections import namedtuple
+from concurrent.futures import Future, InvalidStateError
+from shared.metrics import stage_metrics
+
+
+class RecognitionRequest(namedtuple(
+    "RecognitionRequest",
+    ["context", "track_id", "detection", "frame", "face_box", "object_box", "current_date"],
+)):
+    """
+    Face recognition of a person associated with an incompliant food/ drink, submitted by an association thread.
+
+    Attributes:
+        context (Camera): The camera the incompliance was detected on.
+        track_id (int): Track ID of the food/ drink.
+        detection (list): The food/ drink as ProcessIncompliance reads it: [coords, center, confidence, class id].
+        frame (np.ndarray): Frame the food/ drink was detected on, owned by the request.
+        face_box (tuple): Face bounding box (x1, y1, x2, y2) on the detection frame.
+        object_box (tuple): Food/ drink bounding box (x1, y1, x2, y2) on the detection frame.
+        current_date (str): Timestamp of the detection (YYYY-MM-DD HH:MM:SS).
+    """
+    __slots__ = ()
+
+
+class PersonPending(Exception):
+    """
+    Raised by a recognition handler when the request has to wait for a new person's face to be modeled by the NVR.
+
+    Attributes:
+        ready_at (float): `time.monotonic()` timestamp after which the request is run again.
+    """
+
+    def __init__(self, ready_at):
+        super().__init__(f"Waiting for a new face to be modeled until {ready_at:.1f}")
+        self.ready_at = ready_at
+
+
+class RecognitionDropped(Exception):
+    """
+    Set on the future of a request that was never run to the end: the queue was full when a deferred request was put
+    back, or the service stopped. The food/ drink is not flagged, so association submits it again on a later frame.
+    """
+
+
+class RecognitionService:
+    """
+    Runs face recognition and the incompliance handling that follows it for all cameras on a small pool of threads.
+
+    Association threads submit RecognitionRequests and get a Future back instead of doing the NVR, database and
+    notification work themselves under a global lock. The bounded request queue keeps a burst of incidents from piling
+    up, and `concurrency` limits the number of requests the NVR has to handle at the same time.
+
+    A face inserted into the NVR for a new person takes a few seconds to be modeled, until then the NVR cannot match
+    it and the same person would be inserted again. Instead of sleeping after every insert, new persons are marked
+    pending for `model_delay` seconds: requests that would insert another new person meanwhile are put back and run
+    again once the pending faces are modeled (see PersonPending).
+
+    Attributes:
+        handler (callable): `handler(request, service)` doing the recognition of a request, its return value is the future's result.
+        concurrency (int): Number of worker threads, i.e. concurrent requests toward the NVR.
+        model_delay (float): Seconds the NVR needs to model a newly inserted face.
+        requests (queue.Queue): Bounded queue of (request, future) entries.
+        pending_persons (dict): New persons whose face is not modeled yet.
+            Format: {
+                person_id: ready_at (float, `time.monotonic()` timestamp)
+            }
+        new_person_lock (threading.Lock): Held by a handler while it decides whether a request is a new person and inserts it.
+        timers (set): Timers of the deferred requests that are not queued again yet.
+        stats (dict): Submitted, completed, failed, deferred and dropped (queue full) requests.
+    """
+
+    def __init__(self, handler, concurrency=2, queue_size=32, model_delay=5.0):
+        """
+        Initializes the service and starts its worker threads.
+
+        Parameters:
+            handler (callable): `handler(request, service)` doing the recognition of a request.
+            concurrency (int, optional): Number of worker threads. Defaults to 2.
+            queue_size (int, optional): Maximum number of queued requests. Defaults to 32.
+            model_delay (float, optional): Seconds the NVR needs to model a newly inserted face. Defaults to 5.
+        """
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.model_delay = model_delay
+        self.requests = queue.Queue(maxsize=max(1, queue_size))
+
+        self.pending_persons = {}
+        self.pending_lock = threading.Lock()
+        self.new_person_lock = threading.Lock()
+        self.timers = set()
+        self.timers_lock = threading.Lock()
+
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "deferred": 0, "dropped": 0}
+        self.stats_lock = threading.Lock()
+
+        self.running = threading.Event()
+        self.running.set()
+        self.threads = [
+            threading.Thread(target=self.run, name=f"Recognition-{index}", daemon=True)
+            for index in range(self.concurrency)
+        ]
+        for thread in self.threads:
+            thread.start()
+        print(f"[INFO] Recognition service started with {self.concurrency} worker(s).")
+
+    def submit(self, request):
+        """
+        Queues a recognition request.
+
+        Parameters:
+            request (RecognitionRequest): The request.
+
+        Returns:
+            Future or None: Future of the handler's result, None if the queue is full (the request is dropped).
+        """
+        future = Future()
+        try:
+            self.requests.put_nowait((request, future))
+        except queue.Full:
+            self.count("dropped")
+            return None
+
+        self.count("submitted")
+        return future
+
+    def run(self):
+        """
+        Worker loop: runs queued requests through the handler and resolves their futures.
+        """
+        while self.running.is_set():
+            try:
+                request, future = self.requests.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            # Deferred requests come back with their future already running
+            if not future.running() and not future.set_running_or_notify_cancel():
+                continue
+
+            start = time.perf_counter()
+            try:
+                result = self.handler(request, self)
+
+            except PersonPending as pending:
+                # Future stays running, the request is queued again once the pending faces are modeled
+                self.count("deferred")
+                self.defer(request, future, pending.ready_at)
+                continue
+
+            except Exception as e:
+                stage_metrics.record("recognition", time.perf_counter() - start)
+                print(f"[ERROR] Recognition of track {request.track_id} on camera {request.context.camera_id} failed: {e}")
+                self.count("failed")
+                future.set_exception(e)
+                continue
+
+            stage_metrics.record("recognition", time.perf_counter() - start)
+            self.count("completed")
+            future.set_result(result)
+
+    def defer(self, request, future, ready_at):
+        """
+        Starts a timer that puts a deferred request back into the queue at `ready_at`.
+        """
+        timer = threading.Timer(max(0.0, ready_at - time.monotonic()), self.requeue, args=(request, future))
+        timer.daemon = True
+        with self.timers_lock:
+            if not self.running.is_set():
+                self.abandon(future, "the recognition service stopped")
+                return
+            self.timers.add(timer)
+        timer.start()
+
+    def requeue(self, request, future):
+        """
+        Puts a deferred request back into the queue, run by its timer. The request is dropped if the queue is full.
+        """
+        with self.timers_lock:
+            self.timers = {timer for timer in self.timers if timer.args[1] is not future}
+            if not self.running.is_set():
+                self.abandon(future, "the recognition service stopped")
+                return
+
+            # Under the lock, so a stopping service drains every request queued before it stopped
+            try:
+                self.requests.put_nowait((request, future))
+                return
+            except queue.Full:
+                pass
+
+        self.count("dropped")
+        self.abandon(future, "the recognition queue is full")
+
+    def abandon(self, future, reason):
+        """
+        Resolves the future of a request that is not run (again), see RecognitionDropped.
+        """
+        if future.done():
+            return
+        # Queued futures can still be cancelled, deferred ones are already running
+        if future.cancel():
+            return
+        try:
+            future.set_exception(RecognitionDropped(f"Recognition request dropped, {reason}"))
+        except InvalidStateError:
+            # Resolved by another thread in the meantime
+            pass
+
+    def mark_pending(self, person_id):
+        """
+        Marks a newly inserted person as pending until the NVR has modeled their face.
+
+        Parameters:
+            person_id (int): The new person.
+        """
+        with self.pending_lock:
+            self.pending_persons[person_id] = time.monotonic() + self.model_delay
+
+    def pending_until(self):
+        """
+        Returns when the last pending person's face is modeled, dropping persons that are no longer pending.
+
+        Returns:
+            float or None: `time.monotonic()` timestamp, None if no person is pending.
+        """
+        now = time.monotonic()
+        with self.pending_lock:
+            for person_id in [person_id for person_id, ready_at in self.pending_persons.items() if ready_at <= now]:
+                del self.pending_persons[person_id]
+            return max(self.pending_persons.values()) if self.pending_persons else None
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def get_stats(self):
+        """
+        Returns the request counters, the number of queued requests and of pending persons.
+        """
+        with self.stats_lock:
+            stats = dict(self.stats)
+        stats["queued"] = self.requests.qsize()
+        with self.pending_lock:
+            stats["pending_persons"] = len(self.pending_persons)
+        return stats
+
+    def stop(self):
+        """
+        Stops the worker threads. Requests still queued or waiting to be queued again are not run, their futures are
+        cancelled or resolved with RecognitionDropped.
+        """
+        with self.timers_lock:
+            self.running.clear()
+            timers, self.timers = self.timers, set()
+
+        for timer in timers:
+            timer.cancel()
+            self.abandon(timer.args[1], "the recognition service stopped")
+
+        for thread in self.threads:
+            thread.join(timeout=2)
+
+        while True:
+            try:
+                _, future = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            self.abandon(future, "the recognition service stopped")
@@ -1436,18 +1436,26 @@ def video_feed(camera_id):
     print(f"[STREAM] Client connected to /video_feed/{camera_id}.")
 
     def generate_stream():
-        while camera.running:
-            try:
-                frame = (camera.display_queue).get()
-            except queue.Empty:
-                continue
+        # Detection workers only annotate frames for the display queue while the camera has viewers
+        camera.add_viewer()
+        try:
+            while camera.running:
+                try:
+                    frame_ref = (camera.display_queue).get(timeout=1)
+                except queue.Empty:
+                    continue
 
-            ret, buffer = cv2.imencode(".jpg", frame)
-            if not ret:
-                continue
+                # Annotated frame lives in the camera's frame ring, release the slot once encoded
+                ret, buffer = cv2.imencode(".jpg", frame_ref.frame)
+                frame_ref.release()
+                if not ret:
+                    continue
 
-            frame = buffer.tobytes()
-            yield (b"--frame\r\n" b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n")
+                frame = buffer.tobytes()
+                yield (b"--frame\r\n" b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n")
+        finally:
+            camera.remove_viewer()
+            print(f"[STREAM] Client disconnected from /video_feed/{camera_id}.")
 
     return Response(
         generate_stream(), mimetype="multipart/x-mixed-replace; boundary=frame"
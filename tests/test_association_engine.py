@@ -0,0 +1,60 @@
+import unittest
+import os
+import sys
+import numpy as np
+
+# Add the modularized directory to path to import the association modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "modularized"))
+
+from benchmarks.association_benchmark import (
+    FRAME_SHAPE, extract_face_from_nose, reference_match, synthetic_scene,
+)
+from shared.association_engine import face_regions, match_people
+
+
+class TestMatchPeopleMatchesReference(unittest.TestCase):
+    def setUp(self):
+        self.frame = np.zeros(FRAME_SHAPE, dtype=np.uint8)
+
+    def test_matches_identical_on_random_scenes(self):
+        """Test that match_people picks the same person as the per person loop for every object"""
+        rng = np.random.default_rng(0)
+        matched = 0
+        for people in (0, 1, 2, 4, 8, 16, 32, 64):
+            for objects in (1, 4, 16):
+                for _ in range(5):
+                    boxes, centers, pose_points = synthetic_scene(people, objects, rng)
+                    reference = reference_match(boxes, centers, pose_points, self.frame)
+                    matches, _, _ = match_people(boxes, centers, pose_points, FRAME_SHAPE[0])
+
+                    self.assertEqual(list(matches), reference, f"{people} people, {objects} objects")
+                    matched += sum(match >= 0 for match in reference)
+
+        # The scenes have to exercise the match path too, not only objects nobody holds
+        self.assertGreater(matched, 0)
+
+    def test_face_regions_identical_on_random_scenes(self):
+        """Test that face_regions gives the same face boxes and valid flags as extract_face_from_nose"""
+        rng = np.random.default_rng(1)
+        invalid = 0
+        for people in (1, 8, 64):
+            _, _, pose_points = synthetic_scene(people, 1, rng)
+            # Move some faces below the frame so their boxes become invalid
+            pose_points[::3, :5, 1] += FRAME_SHAPE[0]
+
+            faces, valid = face_regions(pose_points, FRAME_SHAPE[0])
+            for person, points in enumerate(pose_points):
+                try:
+                    expected = extract_face_from_nose(points, self.frame)
+                except ValueError:
+                    self.assertFalse(valid[person])
+                    invalid += 1
+                    continue
+                self.assertTrue(valid[person])
+                self.assertEqual(tuple(int(value) for value in faces[person]), expected)
+
+        self.assertGreater(invalid, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import unittest
+import os
+import queue
+import sys
+import threading
+import numpy as np
+from types import SimpleNamespace
+
+# Add the modularized directory to path to import the detection modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "modularized"))
+
+from shared.camera import Camera
+from shared.detection_manager import DetectionManager
+from shared.flagged_store import FlaggedStore
+from threads.detection_worker import DetectionWorker
+
+
+class TestCameraScheduling(unittest.TestCase):
+    def setUp(self):
+        """Create a DetectionManager with one DetectionWorker and two cameras, without starting threads or loading models"""
+        self.worker = DetectionWorker.__new__(DetectionWorker)
+        self.worker.worker_id = 0
+        self.worker.queue = queue.Queue()
+        self.worker.batch_size = 4
+        self.worker.batch_deadline = 0.01
+        self.worker.in_flight = 0
+        self.worker.ewma_frame_time = None
+
+        # The singleton's __init__ exports the models, set up a bare instance instead
+        self.manager = object.__new__(DetectionManager)
+        self.manager.workers = [self.worker]
+        self.manager.camera_affinity = {}
+        self.manager.lock = threading.Lock()
+        self.manager.last_stats_report = float("inf")
+
+        parent = SimpleNamespace(detection_manager=self.manager, flagged_foodbev=FlaggedStore())
+        self.cameras = [Camera(camera_id, "", "101", False, parent, source=object()) for camera_id in (1, 2)]
+
+    def tearDown(self):
+        for camera in self.cameras:
+            camera.frame_ring.close()
+
+    def submit(self, camera, value):
+        self.manager.submit(camera.frame_ring.copy(np.full((72, 128, 3), value, dtype=np.uint8)), camera)
+
+    def test_camera_in_flight_is_not_queued_again(self):
+        """Test that frames arriving while a camera's frame is in flight do not put the camera into another batch"""
+        first, second = self.cameras
+        self.submit(first, 1)
+        batch = self.worker.collect_batch()
+        self.assertEqual([entry[0] for entry in batch], [first])
+
+        # The reader keeps delivering frames during inference
+        self.submit(first, 2)
+        self.submit(first, 3)
+        self.submit(second, 1)
+        self.assertEqual(list(self.worker.queue.queue), [second])
+
+        for _, frame, _ in batch:
+            frame.release()
+            self.worker.finish(first)
+
+        # Queued again once its frame is published, with the newest frame only
+        batch = self.worker.collect_batch()
+        self.assertEqual([entry[0] for entry in batch], [second, first])
+        self.assertEqual(int(batch[1][1].frame[0, 0, 0]), 3)
+        self.assertEqual(first.dropped_frames, 1)
+
+        for context, frame, _ in batch:
+            frame.release()
+            self.worker.finish(context)
+        self.assertEqual(self.worker.queue_depth(), 0)
+        self.assertFalse(any(camera.scheduled for camera in self.cameras))
+
+    def test_duplicate_queue_entry_stays_out_of_batch(self):
+        """Test that a camera queued twice is only taken into a batch once"""
+        camera = self.cameras[0]
+        self.submit(camera, 1)
+        self.worker.submit(camera)
+
+        batch = self.worker.collect_batch()
+        self.assertEqual([entry[0] for entry in batch], [camera])
+        self.assertEqual(self.worker.queue_depth(), 0)
+
+        batch[0][1].release()
+        self.worker.finish(camera)
+        self.assertFalse(camera.scheduled)
+
+    def test_dead_worker_gets_no_cameras(self):
+        """Test that a camera is moved off a dead worker and no camera is scheduled on it"""
+        dead = DetectionWorker.__new__(DetectionWorker)
+        dead.queue = queue.Queue()
+        dead.in_flight = 0
+        dead.ewma_frame_time = None
+        dead.tracker_drops = queue.Queue()
+        dead.is_alive = lambda: False
+        self.manager.workers = [dead, self.worker]
+
+        first, second = self.cameras
+        self.manager.camera_affinity[first.camera_id] = 0
+        self.submit(first, 1)
+        self.submit(second, 1)
+
+        self.assertEqual(dead.queue_depth(), 0)
+        self.assertEqual(list(self.worker.queue.queue), [first, second])
+        self.assertEqual(self.manager.camera_affinity, {first.camera_id: 1, second.camera_id: 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+import os
+import queue
+import sys
+import threading
+import numpy as np
+from unittest.mock import MagicMock, patch
+
+# Add the modularized directory to path to import the detection modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "modularized"))
+
+import shared.frame_ring
+from shared.frame_ring import FrameRing
+from threads.detection_process import ProcessDetectionWorker
+
+
+class TestProcessWorkerFrameRelease(unittest.TestCase):
+    def setUp(self):
+        """Create a camera frame ring and a ProcessDetectionWorker without starting its process or threads"""
+        self.ring = FrameRing(4)
+        self.ring.adopt(np.zeros((72, 128, 3), dtype=np.uint8)).release()
+
+        self.worker = ProcessDetectionWorker.__new__(ProcessDetectionWorker)
+        self.worker.worker_id = 0
+        self.worker.results = queue.Queue()
+        self.worker.pending = {}
+        self.worker.pending_lock = threading.Lock()
+        self.worker.free_slot_sets = queue.Queue()
+        self.worker.queue = queue.Queue()
+        self.worker.in_flight = 0
+        self.worker.running = threading.Event()
+        self.worker.ready = threading.Event()
+        self.worker.process = MagicMock()
+        self.worker.process.is_alive.return_value = False
+
+    def tearDown(self):
+        self.ring.close()
+
+    def test_failed_batch_releases_frames(self):
+        """Test that the frames of a batch the worker process failed on are given back to their ring"""
+        camera = MagicMock()
+        batch = [(camera, self.ring.copy(np.ones((72, 128, 3), dtype=np.uint8)), 0.0) for _ in range(3)]
+        self.assertEqual(self.ring.get_stats()["in_use"], 3)
+
+        self.worker.pending[0] = (batch, 0.0)
+        self.worker.in_flight = len(batch)
+        self.worker.results.put((0, 0, None, 0.0, 0.0, None, "inference failed"))
+        self.worker.receive_results()
+
+        self.assertEqual(self.ring.get_stats()["in_use"], 0)
+        self.assertEqual(self.worker.in_flight, 0)
+        self.assertEqual(self.worker.free_slot_sets.get_nowait(), 0)
+
+    def test_dead_process_hands_back_work(self):
+        """Test that the frames and cameras of a dead worker process are released and scheduled again"""
+        pending_cameras = [MagicMock() for _ in range(2)]
+        queued_camera = MagicMock()
+        batch = [(camera, self.ring.copy(np.ones((72, 128, 3), dtype=np.uint8)), 0.0) for camera in pending_cameras]
+
+        self.worker.pending[0] = (batch, 0.0)
+        self.worker.in_flight = len(batch)
+        self.worker.queue.put(queued_camera)
+        self.worker.receive_results()
+
+        self.assertEqual(self.ring.get_stats()["in_use"], 0)
+        self.assertEqual(self.worker.pending, {})
+        self.assertEqual(self.worker.in_flight, 0)
+        self.assertEqual(self.worker.queue_depth(), 0)
+        for camera in pending_cameras + [queued_camera]:
+            camera.detection_manager.schedule.assert_called_once_with(camera)
+
+
+class TestFrameRingShmBudget(unittest.TestCase):
+    def setUp(self):
+        self.frame = np.zeros((72, 128, 3), dtype=np.uint8)
+        self.rings = []
+
+    def tearDown(self):
+        for ring in self.rings:
+            ring.close()
+
+    def adopt(self, slots):
+        ring = FrameRing(slots)
+        self.rings.append(ring)
+        ring.adopt(self.frame).release()
+        return ring
+
+    def test_rings_fit_into_shm_budget(self):
+        """Test that rings beyond the shared memory budget get fewer slots instead of a block that does not fit"""
+        reserved = shared.frame_ring._reserved_bytes
+        with patch.object(shared.frame_ring, "shm_budget", return_value=reserved + self.frame.nbytes * 6):
+            first = self.adopt(4)
+            second = self.adopt(4)
+            third = self.adopt(4)
+
+        self.assertEqual([first.slots, second.slots, third.slots], [4, 2, 0])
+        self.assertIsNone(third.block)
+
+        # Without slots every frame is private
+        ref = third.adopt(self.frame)
+        self.assertIsNone(ref.ring)
+        self.assertEqual(third.get_stats()["in_use"], 0)
+
+    def test_closed_ring_returns_its_budget(self):
+        """Test that closing a ring frees its share of the budget for the next ring"""
+        reserved = shared.frame_ring._reserved_bytes
+        with patch.object(shared.frame_ring, "shm_budget", return_value=reserved + self.frame.nbytes * 4):
+            self.adopt(4).close()
+            self.assertEqual(self.adopt(4).slots, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+# Add the modularized directory to path to import the recognition service
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "modularized"))
+
+from shared.metrics import stage_metrics
+from threads.recognition_service import PersonPending, RecognitionDropped, RecognitionService
+
+
+class ScriptedHandler:
+    """Recognition handler whose behaviour per request is scripted by the test"""
+
+    def __init__(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.defer_for = {}  # Format: {request: seconds, deferred once}
+
+    def __call__(self, request, service):
+        self.calls.append(request)
+        if request in self.defer_for:
+            raise PersonPending(time.monotonic() + self.defer_for.pop(request))
+        if request == "block":
+            self.release.wait(timeout=10)
+        return f"person-{request}"
+
+
+class TestRecognitionServiceDeferral(unittest.TestCase):
+    def setUp(self):
+        stage_metrics.reset()
+        self.handler = ScriptedHandler()
+        self.service = RecognitionService(self.handler, concurrency=1, queue_size=1, model_delay=0.1)
+
+    def tearDown(self):
+        self.handler.release.set()
+        self.service.stop()
+
+    def test_deferred_request_runs_again(self):
+        """Test that a deferred request is queued again and resolves its original future once"""
+        self.handler.defer_for["a"] = 0.1
+        future = self.service.submit("a")
+
+        self.assertEqual(future.result(timeout=5), "person-a")
+        self.assertEqual(self.handler.calls, ["a", "a"])
+
+        stats = self.service.get_stats()
+        self.assertEqual((stats["deferred"], stats["completed"]), (1, 1))
+        # Only the run that completed is measured
+        self.assertEqual(stage_metrics.count("recognition"), 1)
+        self.assertEqual(self.service.timers, set())
+
+    def test_requeue_into_full_queue_drops_request(self):
+        """Test that a deferred request is dropped instead of blocking its timer while the queue is full"""
+        blocked = self.service.submit("block")
+        while self.handler.calls != ["block"]:
+            time.sleep(0.01)
+        queued = self.service.submit("queued")
+
+        deferred = Future()
+        deferred.set_running_or_notify_cancel()
+        self.service.requeue("deferred", deferred)
+
+        self.assertIsInstance(deferred.exception(timeout=1), RecognitionDropped)
+        self.assertEqual(self.service.get_stats()["dropped"], 1)
+
+        self.handler.release.set()
+        self.assertEqual(blocked.result(timeout=5), "person-block")
+        self.assertEqual(queued.result(timeout=5), "person-queued")
+
+
+class TestRecognitionServiceStop(unittest.TestCase):
+    def test_stop_resolves_outstanding_futures(self):
+        """Test that stopping resolves queued and deferred requests instead of leaving their futures pending"""
+        handler = ScriptedHandler()
+        service = RecognitionService(handler, concurrency=1, queue_size=2, model_delay=60)
+
+        handler.defer_for["deferred"] = 60
+        deferred = service.submit("deferred")
+        while not service.timers:
+            time.sleep(0.01)
+        blocked = service.submit("block")
+        while "block" not in handler.calls:
+            time.sleep(0.01)
+        queued = service.submit("queued")
+
+        stopping = threading.Thread(target=service.stop)
+        stopping.start()
+        while service.running.is_set():
+            time.sleep(0.01)
+        handler.release.set()
+        stopping.join(timeout=10)
+
+        # The request in progress finishes, the others are never run
+        self.assertEqual(blocked.result(timeout=1), "person-block")
+        self.assertIsInstance(deferred.exception(timeout=1), RecognitionDropped)
+        self.assertTrue(queued.cancelled())
+        self.assertEqual(handler.calls, ["deferred", "block"])
+        self.assertEqual(service.timers, set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import os
+import sys
+import numpy as np
+
+# Add the modularized directory to path to import the detection modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "modularized"))
+
+from ultralytics.engine.results import Boxes
+from ultralytics.trackers.basetrack import BaseTrack
+from ultralytics.utils import YAML, IterableSimpleNamespace
+from ultralytics.utils.checks import check_yaml
+from shared.model import CameraTracker
+
+FRAME_SHAPE = (720, 1280)
+
+
+def make_boxes(*boxes):
+    """Returns Ultralytics Boxes of (x1, y1, x2, y2) boxes, all with confidence 0.9 and class 39 (bottle)"""
+    data = np.array([[*box, 0.9, 39] for box in boxes], dtype=np.float32).reshape(-1, 6)
+    return Boxes(data, FRAME_SHAPE)
+
+
+class TestCameraTrackerIds(unittest.TestCase):
+    def setUp(self):
+        """Load the ByteTrack config, trackers of these tests never need a frame"""
+        self.args = IterableSimpleNamespace(**YAML.load(check_yaml("bytetrack.yaml")))
+        self.first = (100, 100, 150, 200)
+        self.second = (400, 100, 450, 200)
+        self.third = (800, 300, 850, 400)
+
+    def track_ids(self, tracker, *boxes):
+        tracks = tracker.update(make_boxes(*boxes))
+        return sorted(int(track_id) for track_id in tracks[:, 4])
+
+    def test_new_tracker_keeps_live_track_ids(self):
+        """Test that creating another camera's tracker does not hand out a live track's ID again"""
+        camera_a = CameraTracker(1, self.args)
+        for _ in range(3):
+            live_ids = self.track_ids(camera_a, self.first, self.second)
+        self.assertEqual(len(set(live_ids)), 2)
+
+        global_count = BaseTrack._count
+        camera_b = CameraTracker(2, self.args)
+        self.assertEqual(BaseTrack._count, global_count)
+        self.track_ids(camera_b, self.first)
+
+        # A new object on camera A is confirmed on its second frame, then reported next to the live tracks with an ID of its own
+        for _ in range(2):
+            ids = self.track_ids(camera_a, self.first, self.second, self.third)
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(len(set(ids)), 3)
+        self.assertTrue(set(live_ids) <= set(ids))
+
+    def test_recreated_tracker_continues_camera_ids(self):
+        """Test that a camera's track IDs are not reused after its tracker is created again"""
+        tracker = CameraTracker(3, self.args)
+        for _ in range(3):
+            old_ids = self.track_ids(tracker, self.first, self.second)
+
+        # e.g. the camera moved to another worker
+        tracker = CameraTracker(3, self.args)
+        for _ in range(3):
+            new_ids = self.track_ids(tracker, self.first, self.second)
+
+        self.assertEqual(len(new_ids), 2)
+        self.assertTrue(min(new_ids) > max(old_ids))
+
+    def test_worker_processes_interleave_ids(self):
+        """Test that trackers of different worker processes never hand out the same track ID for a camera"""
+        first_process = CameraTracker(4, self.args, id_offset=0, id_stride=2)
+        second_process = CameraTracker(5, self.args, id_offset=1, id_stride=2)
+
+        first_ids = self.track_ids(first_process, self.first, self.second)
+        second_ids = self.track_ids(second_process, self.first, self.second)
+        self.assertTrue(all(track_id % 2 == 1 for track_id in first_ids))
+        self.assertTrue(all(track_id % 2 == 0 for track_id in second_ids))
+
+
+if __name__ == '__main__':
+    unittest.main()